@@ -0,0 +1,113 @@
+import asyncio
+import base64
+import json
+import aiohttp
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from algosdk.future.transaction import SuggestedParams
+
+# asyncio counterpart of algod.AlgodClient for the calls the scripts make.
+# A single aiohttp session keeps connections to algod alive between requests
+# and a semaphore bounds how many requests are in flight at once, so thousands
+# of concurrent callers share a small pool of sockets.
+class AsyncAlgodClient:
+    def __init__(self, algod_token, algod_address, max_concurrency=64, max_connections=64, keepalive_timeout=30):
+        self.algod_address = algod_address.rstrip("/")
+        self.headers = {"X-Algo-API-Token": algod_token}
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Close the pooled connections
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self.session
+
+    # Perform a request against the algod v2 API
+    async def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json"):
+        async with self.semaphore:
+            async with self.get_session().request(
+                method,
+                self.algod_address + "/v2" + requrl,
+                params=params,
+                data=data,
+                headers=headers
+            ) as response:
+                body = await response.read()
+                if response.status >= 400:
+                    try:
+                        message = json.loads(body)["message"]
+                    except (ValueError, KeyError):
+                        message = body.decode(errors="replace")
+                    raise AlgodHTTPError(message, response.status)
+        if response_format == "json":
+            return json.loads(body) if body else None
+        return body
+
+    async def status(self):
+        return await self.algod_request("GET", "/status")
+
+    async def status_after_block(self, block_num):
+        return await self.algod_request("GET", f"/status/wait-for-block-after/{block_num}")
+
+    async def suggested_params(self):
+        res = await self.algod_request("GET", "/transactions/params")
+        return SuggestedParams(
+            res["fee"],
+            res["last-round"],
+            res["last-round"] + 1000,
+            res["genesis-hash"],
+            res["genesis-id"],
+            False,
+            res["consensus-version"],
+            res["min-fee"]
+        )
+
+    async def send_raw_transaction(self, txn):
+        response = await self.algod_request(
+            "POST",
+            "/transactions",
+            data=base64.b64decode(txn),
+            headers={"Content-Type": "application/x-binary"}
+        )
+        return response["txId"]
+
+    async def send_transaction(self, txn):
+        return await self.send_raw_transaction(encoding.msgpack_encode(txn))
+
+    async def send_transactions(self, txns):
+        serialized = b"".join(base64.b64decode(encoding.msgpack_encode(txn)) for txn in txns)
+        return await self.send_raw_transaction(base64.b64encode(serialized))
+
+    async def pending_transaction_info(self, tx_id):
+        return await self.algod_request("GET", f"/transactions/pending/{tx_id}")
+
+    async def block_info(self, block_num, response_format="json"):
+        return await self.algod_request(
+            "GET",
+            f"/blocks/{block_num}",
+            params={"format": response_format},
+            response_format=response_format
+        )
+
+    async def compile(self, source):
+        return await self.algod_request(
+            "POST",
+            "/teal/compile",
+            data=source.encode(),
+            headers={"Content-Type": "application/x-binary"}
+        )
@@ -0,0 +1,1342 @@
+# In-process evaluator for the TEAL programs produced by smart_contracts/.
+#
+# Programs are executed from TEAL source: the local algod stand-in
+# (local_algod.py) hands out the TEAL text itself as the "compiled" program,
+# so the approval programs carried by ApplicationCreateTxns can be evaluated
+# here without a real assembler. The ledger models what the contracts touch:
+# global, local and box state, logs, Global.latest_timestamp, ASAs and inner
+# transactions, with the per-group pooled opcode budget. Signatures, fees and
+# minimum balances are not checked.
+
+from algosdk.encoding import checksum, decode_address
+
+# Opcode budget contributed by every application call in a group
+APP_CALL_BUDGET = 700
+
+# Limits the evaluator enforces
+MAX_STACK_DEPTH = 1000
+MAX_BYTES_LENGTH = 4096
+MAX_LOG_CALLS = 32
+MAX_LOG_SIZE = 1024
+MAX_INNER_TXNS = 256
+MAX_BOX_SIZE = 32768
+MAX_UINT64 = 2 ** 64 - 1
+
+# Opcodes costing more than 1
+OPCODE_COSTS = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "sha3_256": 130,
+    "ed25519verify": 1900,
+    "ed25519verify_bare": 1900,
+    "ecdsa_verify": 1700,
+    "ecdsa_pk_decompress": 650,
+    "ecdsa_pk_recover": 2000,
+    "vrf_verify": 5700,
+    "json_ref": 25,
+    "b+": 10,
+    "b-": 10,
+    "b*": 20,
+    "b/": 20,
+    "b%": 20,
+    "bsqrt": 40
+}
+
+# Named integer constants accepted by `int`
+NAMED_INTS = {
+    "NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3, "UpdateApplication": 4, "DeleteApplication": 5,
+    "unknown": 0, "pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6
+}
+
+# Transaction type names by TypeEnum
+TYPE_NAMES = {1: b"pay", 2: b"keyreg", 3: b"acfg", 4: b"axfer", 5: b"afrz", 6: b"appl"}
+
+# Transaction fields that hold arrays
+ARRAY_FIELDS = ("ApplicationArgs", "Accounts", "Applications", "Assets", "Logs")
+
+ZERO_ADDRESS = bytes(32)
+
+class AVMError(Exception):
+    pass
+
+# Address of an application's account
+def application_address(app_id):
+    return checksum(b"appID" + app_id.to_bytes(8, "big"))
+
+def itob(value):
+    return value.to_bytes(8, "big")
+
+def btoi(value):
+    if len(value) > 8:
+        raise AVMError("btoi arg too long")
+    return int.from_bytes(value, "big")
+
+# Split a TEAL line into opcode and immediate tokens, keeping quoted strings whole
+def tokenize(line):
+    tokens = []
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char.isspace():
+            i += 1
+        elif line.startswith("//", i):
+            break
+        elif char == '"':
+            j = i + 1
+            while j < len(line) and line[j] != '"':
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i:j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < len(line) and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+def parse_bytes(tokens):
+    first = tokens[0]
+    if first.startswith('"'):
+        return first[1:-1].encode("latin-1").decode("unicode_escape").encode("latin-1")
+    if first.startswith("0x"):
+        return bytes.fromhex(first[2:])
+    if first in ("base64", "b64"):
+        import base64
+        return base64.b64decode(tokens[1])
+    if first in ("base32", "b32"):
+        import base64
+        return base64.b32decode(tokens[1] + "=" * (-len(tokens[1]) % 8))
+    raise AVMError(f"Unsupported byte constant: {' '.join(tokens)}")
+
+def parse_int(token):
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    return int(token, 0)
+
+# A TEAL program parsed into (opcode, immediates) instructions with labels
+# resolved to instruction indices
+class Program:
+    def __init__(self, source):
+        if isinstance(source, bytes):
+            source = source.decode()
+        self.source = source
+        self.version = 1
+        self.code = []
+        labels = {}
+        lines = []
+        for raw_line in source.splitlines():
+            tokens = tokenize(raw_line.strip())
+            if not tokens:
+                continue
+            if tokens[0] == "#pragma":
+                if tokens[1] == "version":
+                    self.version = int(tokens[2])
+                continue
+            if len(tokens) == 1 and tokens[0].endswith(":"):
+                labels[tokens[0][:-1]] = len(lines)
+                continue
+            lines.append(tokens)
+
+        for tokens in lines:
+            op, args = tokens[0], tokens[1:]
+            if op in ("int", "pushint"):
+                op, args = "int", parse_int(args[0])
+            elif op in ("byte", "pushbytes"):
+                op, args = "byte", parse_bytes(args)
+            elif op == "addr":
+                op, args = "byte", decode_address(args[0])
+            elif op in ("b", "bz", "bnz", "callsub"):
+                args = labels[args[0]]
+            elif op in ("switch", "match"):
+                args = [labels[label] for label in args]
+            elif op in ("txna", "gtxn", "itxna", "gitxn"):
+                args = (args[0], int(args[1])) if op in ("txna", "itxna") else (int(args[0]), args[1])
+            elif op == "gtxna" or op == "gitxna":
+                args = (int(args[0]), args[1], int(args[2]))
+            elif args and all(arg.lstrip("-").isdigit() for arg in args):
+                args = tuple(int(arg) for arg in args)
+                if len(args) == 1:
+                    args = args[0]
+            elif len(args) == 1:
+                args = args[0]
+            else:
+                args = tuple(args)
+            self.code.append((op, args, OPCODE_COSTS.get(op, 1)))
+
+# Executes one program for one transaction
+class Evaluator:
+    def __init__(self, ledger, txn, group, app_id, program, caller_app_id=0):
+        self.ledger = ledger
+        self.txn = txn
+        self.group = group
+        self.app_id = app_id
+        self.program = program
+        self.caller_app_id = caller_app_id
+        self.stack = []
+        self.scratch = [0] * 256
+        self.frames = []
+        self.logs = []
+        self.inner_building = None
+        self.inner_results = []
+        self.created_assets = set()
+        self.jump = None
+
+    # Resolve an account reference (index into Accounts or an address)
+    def account(self, ref, allow_app_accounts=True):
+        accounts = self.txn.get("Accounts", [])
+        if isinstance(ref, int):
+            if ref == 0:
+                return self.txn["Sender"]
+            if ref > len(accounts):
+                raise AVMError(f"invalid Accounts index {ref}")
+            return accounts[ref - 1]
+        if ref == self.txn["Sender"] or ref in accounts:
+            return ref
+        if allow_app_accounts:
+            app_ids = [self.app_id] + self.txn.get("Applications", [])
+            if ref in (application_address(app_id) for app_id in app_ids):
+                return ref
+        raise AVMError("unavailable Account")
+
+    # Resolve an application reference (index into Applications or an ID)
+    def application(self, ref):
+        apps = self.txn.get("Applications", [])
+        if ref == 0:
+            return self.app_id
+        if ref <= len(apps):
+            return apps[ref - 1]
+        if ref == self.app_id or ref in apps:
+            return ref
+        raise AVMError(f"unavailable App {ref}")
+
+    # Resolve an asset reference (index into Assets or an ID)
+    def asset(self, ref):
+        assets = self.txn.get("Assets", [])
+        if ref < len(assets):
+            return assets[ref]
+        if ref in assets or ref in self.created_assets:
+            return ref
+        raise AVMError(f"unavailable Asset {ref}")
+
+    def box_name(self, name):
+        if not 1 <= len(name) <= 64:
+            raise AVMError("box names must be 1 to 64 bytes")
+        if (self.app_id, name) not in self.ledger.group_boxes:
+            raise AVMError(f"invalid Box reference {name!r}")
+        return name
+
+    def push(self, value):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int) and not 0 <= value <= MAX_UINT64:
+            raise AVMError("uint64 overflow" if value > 0 else "uint64 underflow")
+        if isinstance(value, bytes) and len(value) > MAX_BYTES_LENGTH:
+            raise AVMError("byte array too long")
+        self.stack.append(value)
+
+    def pop(self):
+        if not self.stack:
+            raise AVMError("stack underflow")
+        return self.stack.pop()
+
+    def pop_int(self):
+        value = self.pop()
+        if not isinstance(value, int):
+            raise AVMError("expected uint64, got bytes")
+        return value
+
+    def pop_bytes(self):
+        value = self.pop()
+        if not isinstance(value, bytes):
+            raise AVMError("expected bytes, got uint64")
+        return value
+
+    # Run the program; returns True when it approves
+    def run(self):
+        code = self.program.code
+        pc = 0
+        budget = self.ledger.budget
+        while pc < len(code):
+            op, args, cost = code[pc]
+            budget[0] -= cost
+            if budget[0] < 0:
+                raise AVMError("dynamic cost budget exceeded")
+            self.ledger.stats["opcodes"] += cost
+            handler = OPS.get(op)
+            if handler is None:
+                raise AVMError(f"unsupported opcode {op}")
+            self.jump = None
+            self.pc = pc
+            if handler(self, args):
+                break
+            if len(self.stack) > MAX_STACK_DEPTH:
+                raise AVMError("stack overflow")
+            pc = pc + 1 if self.jump is None else self.jump
+        if len(self.stack) != 1:
+            raise AVMError(f"stack finished with {len(self.stack)} values")
+        result = self.stack[0]
+        if isinstance(result, bytes):
+            raise AVMError("stack finished with bytes not int")
+        return result != 0
+
+    # Read a transaction field; array fields take an index
+    def txn_field(self, txn, field, index=None):
+        if field in ARRAY_FIELDS or index is not None:
+            values = txn.get(field, [])
+            if field == "Accounts":
+                values = [txn["Sender"]] + values
+            elif field == "Applications":
+                values = [txn.get("ApplicationID", 0)] + values
+            if index >= len(values):
+                raise AVMError(f"invalid {field} index {index}")
+            return values[index]
+        if field.startswith("Num"):
+            name = {"NumAppArgs": "ApplicationArgs"}.get(field, field[3:])
+            return len(txn.get(name, []))
+        if field == "Type":
+            return TYPE_NAMES[txn["TypeEnum"]]
+        if field == "LastLog":
+            logs = txn.get("Logs", [])
+            return logs[-1] if logs else b""
+        if field in txn:
+            return txn[field]
+        return TXN_FIELD_DEFAULTS.get(field, 0)
+
+    def global_field(self, field):
+        if field == "LatestTimestamp":
+            return self.ledger.timestamp
+        if field == "Round":
+            return self.ledger.round + 1
+        if field == "CurrentApplicationID":
+            return self.app_id
+        if field == "CurrentApplicationAddress":
+            return application_address(self.app_id)
+        if field == "GroupSize":
+            return len(self.group)
+        if field == "MinTxnFee":
+            return 1000
+        if field == "MinBalance":
+            return 100000
+        if field == "MaxTxnLife":
+            return 1000
+        if field == "ZeroAddress":
+            return ZERO_ADDRESS
+        if field == "CreatorAddress":
+            return self.ledger.apps[self.app_id].creator
+        if field == "OpcodeBudget":
+            return self.ledger.budget[0]
+        if field == "CallerApplicationID":
+            return self.caller_app_id
+        if field == "CallerApplicationAddress":
+            return application_address(self.caller_app_id) if self.caller_app_id else ZERO_ADDRESS
+        if field == "GroupID":
+            return bytes(32)
+        raise AVMError(f"unsupported global field {field}")
+
+# Default values of transaction fields that are not set
+TXN_FIELD_DEFAULTS = {
+    "Note": b"", "Lease": bytes(32), "RekeyTo": ZERO_ADDRESS, "Receiver": ZERO_ADDRESS,
+    "CloseRemainderTo": ZERO_ADDRESS, "AssetSender": ZERO_ADDRESS, "AssetReceiver": ZERO_ADDRESS,
+    "AssetCloseTo": ZERO_ADDRESS, "FreezeAssetAccount": ZERO_ADDRESS, "ConfigAssetUnitName": b"",
+    "ConfigAssetName": b"", "ConfigAssetURL": b"", "ConfigAssetMetadataHash": b"",
+    "ConfigAssetManager": ZERO_ADDRESS, "ConfigAssetReserve": ZERO_ADDRESS,
+    "ConfigAssetFreeze": ZERO_ADDRESS, "ConfigAssetClawback": ZERO_ADDRESS,
+    "ApprovalProgram": b"", "ClearStateProgram": b"", "TxID": bytes(32)
+}
+
+OPS = {}
+
+def op(*names):
+    def register(handler):
+        for name in names:
+            OPS[name] = handler
+        return handler
+    return register
+
+def binary_int_op(name, func):
+    def handler(vm, args):
+        b = vm.pop_int()
+        a = vm.pop_int()
+        vm.push(func(a, b))
+    OPS[name] = handler
+
+def div(a, b):
+    if b == 0:
+        raise AVMError("/ 0")
+    return a // b
+
+def mod(a, b):
+    if b == 0:
+        raise AVMError("% 0")
+    return a % b
+
+for _name, _func in {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": div,
+    "%": mod,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "&&": lambda a, b: bool(a and b),
+    "||": lambda a, b: bool(a or b),
+    "&": lambda a, b: a & b,
+    "|": lambda a, b: a | b,
+    "^": lambda a, b: a ^ b,
+    "shl": lambda a, b: (a << b) & MAX_UINT64,
+    "shr": lambda a, b: a >> b,
+    "exp": lambda a, b: a ** b
+}.items():
+    binary_int_op(_name, _func)
+
+@op("int", "byte")
+def op_const(vm, args):
+    vm.push(args)
+
+@op("==", "!=")
+def op_equality(vm, args):
+    b = vm.pop()
+    a = vm.pop()
+    if type(a) is not type(b):
+        raise AVMError("cannot compare uint64 to bytes")
+    equal = a == b
+    vm.push(equal if vm.op_name == "==" else not equal)
+
+@op("!")
+def op_not(vm, args):
+    vm.push(vm.pop_int() == 0)
+
+@op("~")
+def op_bitwise_not(vm, args):
+    vm.push(vm.pop_int() ^ MAX_UINT64)
+
+@op("sqrt")
+def op_sqrt(vm, args):
+    import math
+    vm.push(math.isqrt(vm.pop_int()))
+
+@op("bitlen")
+def op_bitlen(vm, args):
+    value = vm.pop()
+    vm.push(value.bit_length() if isinstance(value, int) else int.from_bytes(value, "big").bit_length())
+
+@op("err")
+def op_err(vm, args):
+    raise AVMError("err opcode executed")
+
+@op("assert")
+def op_assert(vm, args):
+    if vm.pop_int() == 0:
+        raise AVMError(f"assert failed pc={vm.pc}")
+
+@op("return")
+def op_return(vm, args):
+    value = vm.pop()
+    vm.stack = [value]
+    return True
+
+@op("pop")
+def op_pop(vm, args):
+    vm.pop()
+
+@op("popn")
+def op_popn(vm, args):
+    for _ in range(args):
+        vm.pop()
+
+@op("dup")
+def op_dup(vm, args):
+    value = vm.pop()
+    vm.push(value)
+    vm.push(value)
+
+@op("dupn")
+def op_dupn(vm, args):
+    value = vm.pop()
+    for _ in range(args + 1):
+        vm.push(value)
+
+@op("dup2")
+def op_dup2(vm, args):
+    vm.stack.extend(vm.stack[-2:])
+
+@op("swap")
+def op_swap(vm, args):
+    vm.stack[-1], vm.stack[-2] = vm.stack[-2], vm.stack[-1]
+
+@op("dig")
+def op_dig(vm, args):
+    vm.push(vm.stack[-1 - args])
+
+@op("bury")
+def op_bury(vm, args):
+    vm.stack[-1 - args] = vm.stack[-1]
+    vm.stack.pop()
+
+@op("cover")
+def op_cover(vm, args):
+    vm.stack.insert(len(vm.stack) - 1 - args, vm.stack.pop())
+
+@op("uncover")
+def op_uncover(vm, args):
+    vm.stack.append(vm.stack.pop(-1 - args))
+
+@op("select")
+def op_select(vm, args):
+    condition = vm.pop_int()
+    b = vm.pop()
+    a = vm.pop()
+    vm.push(b if condition else a)
+
+@op("b")
+def op_b(vm, args):
+    vm.jump = args
+
+@op("bz")
+def op_bz(vm, args):
+    if vm.pop_int() == 0:
+        vm.jump = args
+
+@op("bnz")
+def op_bnz(vm, args):
+    if vm.pop_int() != 0:
+        vm.jump = args
+
+@op("switch")
+def op_switch(vm, args):
+    index = vm.pop_int()
+    if index < len(args):
+        vm.jump = args[index]
+
+@op("match")
+def op_match(vm, args):
+    target = vm.pop()
+    candidates = vm.stack[len(vm.stack) - len(args):]
+    del vm.stack[len(vm.stack) - len(args):]
+    for label, candidate in zip(args, candidates):
+        if candidate == target:
+            vm.jump = label
+            break
+
+@op("callsub")
+def op_callsub(vm, args):
+    vm.frames.append([vm.pc + 1, len(vm.stack), 0, 0])
+    vm.jump = args
+
+# A frame is [return pc, stack height at callsub, proto args, proto returns];
+# frame_dig and frame_bury index relative to the height at callsub, so the
+# arguments sit at negative offsets
+@op("proto")
+def op_proto(vm, args):
+    num_args, num_returns = args
+    frame = vm.frames[-1]
+    if num_args > frame[1]:
+        raise AVMError("callsub to proto that requires more arguments than the stack holds")
+    frame[2] = num_args
+    frame[3] = num_returns
+    frame.append(True)
+
+@op("retsub")
+def op_retsub(vm, args):
+    frame = vm.frames.pop()
+    return_pc, height, num_args, num_returns = frame[:4]
+    if len(frame) > 4:
+        if len(vm.stack) < height + num_returns:
+            raise AVMError("retsub executed with fewer stack values than proto declared")
+        returns = vm.stack[len(vm.stack) - num_returns:] if num_returns else []
+        del vm.stack[height - num_args:]
+        vm.stack.extend(returns)
+    vm.jump = return_pc
+
+@op("frame_dig")
+def op_frame_dig(vm, args):
+    vm.push(vm.stack[vm.frames[-1][1] + args])
+
+@op("frame_bury")
+def op_frame_bury(vm, args):
+    vm.stack[vm.frames[-1][1] + args] = vm.pop()
+
+@op("load")
+def op_load(vm, args):
+    vm.push(vm.scratch[args])
+
+@op("store")
+def op_store(vm, args):
+    vm.scratch[args] = vm.pop()
+
+@op("loads")
+def op_loads(vm, args):
+    vm.push(vm.scratch[vm.pop_int()])
+
+@op("stores")
+def op_stores(vm, args):
+    value = vm.pop()
+    vm.scratch[vm.pop_int()] = value
+
+@op("btoi")
+def op_btoi(vm, args):
+    vm.push(btoi(vm.pop_bytes()))
+
+@op("itob")
+def op_itob(vm, args):
+    vm.push(itob(vm.pop_int()))
+
+@op("len")
+def op_len(vm, args):
+    vm.push(len(vm.pop_bytes()))
+
+@op("concat")
+def op_concat(vm, args):
+    b = vm.pop_bytes()
+    a = vm.pop_bytes()
+    vm.push(a + b)
+
+@op("bzero")
+def op_bzero(vm, args):
+    vm.push(bytes(vm.pop_int()))
+
+def checked_slice(value, start, end):
+    if start > end or end > len(value):
+        raise AVMError(f"extraction {start}:{end} out of range of {len(value)} bytes")
+    return value[start:end]
+
+@op("substring")
+def op_substring(vm, args):
+    start, end = args
+    vm.push(checked_slice(vm.pop_bytes(), start, end))
+
+@op("substring3")
+def op_substring3(vm, args):
+    end = vm.pop_int()
+    start = vm.pop_int()
+    vm.push(checked_slice(vm.pop_bytes(), start, end))
+
+@op("extract")
+def op_extract(vm, args):
+    start, length = args
+    value = vm.pop_bytes()
+    vm.push(checked_slice(value, start, len(value) if length == 0 else start + length))
+
+@op("extract3")
+def op_extract3(vm, args):
+    length = vm.pop_int()
+    start = vm.pop_int()
+    vm.push(checked_slice(vm.pop_bytes(), start, start + length))
+
+def extract_uint(width):
+    def handler(vm, args):
+        start = vm.pop_int()
+        vm.push(int.from_bytes(checked_slice(vm.pop_bytes(), start, start + width), "big"))
+    return handler
+
+OPS["extract_uint16"] = extract_uint(2)
+OPS["extract_uint32"] = extract_uint(4)
+OPS["extract_uint64"] = extract_uint(8)
+
+def replace_bytes(value, start, replacement):
+    if start + len(replacement) > len(value):
+        raise AVMError("replacement out of range")
+    return value[:start] + replacement + value[start + len(replacement):]
+
+@op("replace2")
+def op_replace2(vm, args):
+    replacement = vm.pop_bytes()
+    vm.push(replace_bytes(vm.pop_bytes(), args, replacement))
+
+@op("replace3")
+def op_replace3(vm, args):
+    replacement = vm.pop_bytes()
+    start = vm.pop_int()
+    vm.push(replace_bytes(vm.pop_bytes(), start, replacement))
+
+@op("getbyte")
+def op_getbyte(vm, args):
+    index = vm.pop_int()
+    value = vm.pop_bytes()
+    if index >= len(value):
+        raise AVMError("getbyte index out of range")
+    vm.push(value[index])
+
+@op("setbyte")
+def op_setbyte(vm, args):
+    byte = vm.pop_int()
+    index = vm.pop_int()
+    value = vm.pop_bytes()
+    if index >= len(value) or byte > 255:
+        raise AVMError("setbyte out of range")
+    vm.push(value[:index] + bytes([byte]) + value[index + 1:])
+
+@op("sha512_256")
+def op_sha512_256(vm, args):
+    vm.push(checksum(vm.pop_bytes()))
+
+@op("sha256")
+def op_sha256(vm, args):
+    import hashlib
+    vm.push(hashlib.sha256(vm.pop_bytes()).digest())
+
+@op("b==", "b!=", "b<", "b>", "b<=", "b>=")
+def op_byte_compare(vm, args):
+    b = int.from_bytes(vm.pop_bytes(), "big")
+    a = int.from_bytes(vm.pop_bytes(), "big")
+    vm.push({
+        "b==": a == b, "b!=": a != b, "b<": a < b, "b>": a > b, "b<=": a <= b, "b>=": a >= b
+    }[vm.op_name])
+
+@op("txn")
+def op_txn(vm, args):
+    vm.push(vm.txn_field(vm.txn, args))
+
+@op("txna")
+def op_txna(vm, args):
+    field, index = args
+    vm.push(vm.txn_field(vm.txn, field, index))
+
+@op("txnas")
+def op_txnas(vm, args):
+    vm.push(vm.txn_field(vm.txn, args, vm.pop_int()))
+
+@op("gtxn")
+def op_gtxn(vm, args):
+    group_index, field = args
+    vm.push(vm.txn_field(vm.group[group_index], field))
+
+@op("gtxns")
+def op_gtxns(vm, args):
+    vm.push(vm.txn_field(vm.group[vm.pop_int()], args))
+
+@op("global")
+def op_global(vm, args):
+    vm.push(vm.global_field(args))
+
+@op("log")
+def op_log(vm, args):
+    message = vm.pop_bytes()
+    vm.logs.append(message)
+    if len(vm.logs) > MAX_LOG_CALLS or sum(map(len, vm.logs)) > MAX_LOG_SIZE:
+        raise AVMError("too many log calls or log bytes")
+    vm.ledger.stats["logs"] += 1
+
+@op("app_global_get")
+def op_app_global_get(vm, args):
+    key = vm.pop_bytes()
+    vm.push(vm.ledger.global_get(vm.app_id, key, 0))
+
+@op("app_global_get_ex")
+def op_app_global_get_ex(vm, args):
+    key = vm.pop_bytes()
+    app_id = vm.application(vm.pop_int())
+    value = vm.ledger.global_get(app_id, key, None)
+    vm.push(0 if value is None else value)
+    vm.push(value is not None)
+
+@op("app_global_put")
+def op_app_global_put(vm, args):
+    value = vm.pop()
+    key = vm.pop_bytes()
+    vm.ledger.global_put(vm.app_id, key, value)
+
+@op("app_global_del")
+def op_app_global_del(vm, args):
+    vm.ledger.global_del(vm.app_id, vm.pop_bytes())
+
+@op("app_local_get")
+def op_app_local_get(vm, args):
+    key = vm.pop_bytes()
+    address = vm.account(vm.pop())
+    vm.push(vm.ledger.local_get(address, vm.app_id, key, 0))
+
+@op("app_local_get_ex")
+def op_app_local_get_ex(vm, args):
+    key = vm.pop_bytes()
+    app_id = vm.application(vm.pop_int())
+    address = vm.account(vm.pop())
+    value = vm.ledger.local_get(address, app_id, key, None)
+    vm.push(0 if value is None else value)
+    vm.push(value is not None)
+
+@op("app_local_put")
+def op_app_local_put(vm, args):
+    value = vm.pop()
+    key = vm.pop_bytes()
+    address = vm.account(vm.pop())
+    vm.ledger.local_put(address, vm.app_id, key, value)
+
+@op("app_local_del")
+def op_app_local_del(vm, args):
+    key = vm.pop_bytes()
+    address = vm.account(vm.pop())
+    vm.ledger.local_del(address, vm.app_id, key)
+
+@op("app_opted_in")
+def op_app_opted_in(vm, args):
+    app_id = vm.application(vm.pop_int())
+    address = vm.account(vm.pop())
+    vm.push(vm.ledger.opted_in(address, app_id))
+
+@op("app_params_get")
+def op_app_params_get(vm, args):
+    app_id = vm.application(vm.pop_int())
+    app = vm.ledger.apps.get(app_id)
+    if app is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    vm.push({
+        "AppCreator": app.creator,
+        "AppAddress": application_address(app_id),
+        "AppApprovalProgram": app.approval.source.encode(),
+        "AppClearStateProgram": app.clear.source.encode()
+    }[args])
+    vm.push(1)
+
+@op("asset_params_get")
+def op_asset_params_get(vm, args):
+    asset_id = vm.asset(vm.pop_int())
+    params = vm.ledger.assets.get(asset_id)
+    if params is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    field = {
+        "AssetTotal": "total", "AssetDecimals": "decimals", "AssetDefaultFrozen": "default_frozen",
+        "AssetUnitName": "unit_name", "AssetName": "name", "AssetURL": "url",
+        "AssetMetadataHash": "metadata_hash", "AssetManager": "manager", "AssetReserve": "reserve",
+        "AssetFreeze": "freeze", "AssetClawback": "clawback", "AssetCreator": "creator"
+    }[args]
+    vm.push(params[field])
+    vm.push(1)
+
+@op("asset_holding_get")
+def op_asset_holding_get(vm, args):
+    asset_id = vm.asset(vm.pop_int())
+    address = vm.account(vm.pop())
+    holding = vm.ledger.holding(address, asset_id)
+    if holding is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    vm.push(holding["amount"] if args == "AssetBalance" else int(holding["frozen"]))
+    vm.push(1)
+
+@op("balance")
+def op_balance(vm, args):
+    vm.push(vm.ledger.account(vm.account(vm.pop())).amount)
+
+@op("min_balance")
+def op_min_balance(vm, args):
+    vm.account(vm.pop())
+    vm.push(100000)
+
+@op("box_create")
+def op_box_create(vm, args):
+    size = vm.pop_int()
+    name = vm.box_name(vm.pop_bytes())
+    if size > MAX_BOX_SIZE:
+        raise AVMError("box size too large")
+    existing = vm.ledger.box_get(vm.app_id, name)
+    if existing is not None and len(existing) != size:
+        raise AVMError("box size mismatch")
+    if existing is None:
+        vm.ledger.box_put(vm.app_id, name, bytes(size))
+    vm.push(existing is None)
+
+@op("box_put")
+def op_box_put(vm, args):
+    value = vm.pop_bytes()
+    name = vm.box_name(vm.pop_bytes())
+    existing = vm.ledger.box_get(vm.app_id, name)
+    if existing is not None and len(existing) != len(value):
+        raise AVMError("box_put wrong size")
+    vm.ledger.box_put(vm.app_id, name, value)
+
+@op("box_get")
+def op_box_get(vm, args):
+    value = vm.ledger.box_get(vm.app_id, vm.box_name(vm.pop_bytes()))
+    vm.push(b"" if value is None else value)
+    vm.push(value is not None)
+
+@op("box_len")
+def op_box_len(vm, args):
+    value = vm.ledger.box_get(vm.app_id, vm.box_name(vm.pop_bytes()))
+    vm.push(0 if value is None else len(value))
+    vm.push(value is not None)
+
+@op("box_extract")
+def op_box_extract(vm, args):
+    length = vm.pop_int()
+    start = vm.pop_int()
+    value = vm.ledger.box_get(vm.app_id, vm.box_name(vm.pop_bytes()))
+    if value is None:
+        raise AVMError("no such box")
+    vm.push(checked_slice(value, start, start + length))
+
+@op("box_replace")
+def op_box_replace(vm, args):
+    replacement = vm.pop_bytes()
+    start = vm.pop_int()
+    name = vm.box_name(vm.pop_bytes())
+    value = vm.ledger.box_get(vm.app_id, name)
+    if value is None:
+        raise AVMError("no such box")
+    vm.ledger.box_put(vm.app_id, name, replace_bytes(value, start, replacement))
+
+@op("box_del")
+def op_box_del(vm, args):
+    name = vm.box_name(vm.pop_bytes())
+    vm.push(vm.ledger.box_del(vm.app_id, name))
+
+@op("itxn_begin")
+def op_itxn_begin(vm, args):
+    if vm.inner_building is not None:
+        raise AVMError("itxn_begin without itxn_submit")
+    vm.inner_building = [vm.ledger.inner_defaults(vm)]
+
+@op("itxn_next")
+def op_itxn_next(vm, args):
+    if vm.inner_building is None:
+        raise AVMError("itxn_next without itxn_begin")
+    vm.inner_building.append(vm.ledger.inner_defaults(vm))
+
+@op("itxn_field")
+def op_itxn_field(vm, args):
+    if vm.inner_building is None:
+        raise AVMError("itxn_field without itxn_begin")
+    value = vm.pop()
+    txn = vm.inner_building[-1]
+    if args in ARRAY_FIELDS:
+        txn.setdefault(args, []).append(value)
+    elif args == "Type":
+        txn["TypeEnum"] = {name: enum for enum, name in TYPE_NAMES.items()}[value]
+    elif args == "ConfigAssetMetadataHash" and len(value) != 32:
+        raise AVMError("ConfigAssetMetadataHash must be 32 bytes")
+    else:
+        txn[args] = value
+
+@op("itxn_submit")
+def op_itxn_submit(vm, args):
+    if vm.inner_building is None:
+        raise AVMError("itxn_submit without itxn_begin")
+    group, vm.inner_building = vm.inner_building, None
+    if len(vm.inner_results) + len(group) > MAX_INNER_TXNS:
+        raise AVMError("too many inner transactions")
+    results = vm.ledger.apply_inner_group(group, vm)
+    vm.inner_results.extend(results)
+    vm.last_inner_group = results
+
+@op("itxn")
+def op_itxn(vm, args):
+    vm.push(vm.txn_field(vm.last_inner_group[-1], args))
+
+@op("itxna")
+def op_itxna(vm, args):
+    field, index = args
+    vm.push(vm.txn_field(vm.last_inner_group[-1], field, index))
+
+@op("gitxn")
+def op_gitxn(vm, args):
+    group_index, field = args
+    vm.push(vm.txn_field(vm.last_inner_group[group_index], field))
+
+# Handlers dispatch on the opcode; the few that share a handler read it back
+# through vm.op_name
+def named(handler):
+    def wrapper(name):
+        def dispatch(vm, args):
+            vm.op_name = name
+            return handler(vm, args)
+        return dispatch
+    return wrapper
+
+for _name in ("==", "!=", "b==", "b!=", "b<", "b>", "b<=", "b>="):
+    OPS[_name] = named(OPS[_name])(_name)
+
+# Account state tracked by the ledger
+class Account:
+    def __init__(self):
+        self.amount = 0
+        self.local_state = {}
+        self.holdings = {}
+
+# Application state tracked by the ledger
+class Application:
+    def __init__(self, app_id, creator, approval, clear, global_schema, local_schema):
+        self.app_id = app_id
+        self.creator = creator
+        self.approval = approval
+        self.clear = clear
+        self.global_schema = global_schema
+        self.local_schema = local_schema
+        self.global_state = {}
+        self.boxes = {}
+
+MISSING = object()
+
+# World state the evaluator runs against. Every write goes through an undo
+# journal so a failed transaction group can be rolled back atomically.
+class Ledger:
+    def __init__(self, timestamp=0, round_num=0):
+        self.accounts = {}
+        self.apps = {}
+        self.assets = {}
+        self.next_id = 1000
+        self.timestamp = timestamp
+        self.round = round_num
+        self.journal = []
+        self.budget = [0]
+        self.group_boxes = set()
+        self.programs = {}
+        self.stats = {
+            "app_calls": 0, "opcodes": 0, "logs": 0,
+            "global_reads": 0, "global_writes": 0,
+            "local_reads": 0, "local_writes": 0,
+            "box_reads": 0, "box_writes": 0
+        }
+
+    def write(self, container, key, value):
+        self.journal.append((container, key, container.get(key, MISSING)))
+        if value is MISSING:
+            container.pop(key, None)
+        else:
+            container[key] = value
+
+    def rollback(self, mark):
+        while len(self.journal) > mark:
+            container, key, old_value = self.journal.pop()
+            if old_value is MISSING:
+                container.pop(key, None)
+            else:
+                container[key] = old_value
+
+    def allocate_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    # Parse TEAL source once per distinct program
+    def program(self, source):
+        if isinstance(source, bytes):
+            source = source.decode()
+        program = self.programs.get(source)
+        if program is None:
+            program = self.programs[source] = Program(source)
+        return program
+
+    def account(self, address):
+        account = self.accounts.get(address)
+        if account is None:
+            account = Account()
+            self.write(self.accounts, address, account)
+        return account
+
+    def global_get(self, app_id, key, default):
+        self.stats["global_reads"] += 1
+        app = self.apps.get(app_id)
+        return default if app is None else app.global_state.get(key, default)
+
+    def global_put(self, app_id, key, value):
+        self.stats["global_writes"] += 1
+        app = self.apps[app_id]
+        if len(key) + (len(value) if isinstance(value, bytes) else 0) > 128:
+            raise AVMError("key/value too long")
+        if key not in app.global_state:
+            self.check_schema(app.global_state, app.global_schema, value)
+        self.write(app.global_state, key, value)
+
+    def global_del(self, app_id, key):
+        self.stats["global_writes"] += 1
+        self.write(self.apps[app_id].global_state, key, MISSING)
+
+    def check_schema(self, state, schema, value):
+        num_uints, num_byte_slices = schema
+        uints = sum(1 for v in state.values() if isinstance(v, int)) + isinstance(value, int)
+        byte_slices = sum(1 for v in state.values() if isinstance(v, bytes)) + isinstance(value, bytes)
+        if uints > num_uints or byte_slices > num_byte_slices:
+            raise AVMError("store exceeds state schema")
+
+    def opted_in(self, address, app_id):
+        account = self.accounts.get(address)
+        return account is not None and app_id in account.local_state
+
+    def local_state(self, address, app_id):
+        account = self.accounts.get(address)
+        if account is None or app_id not in account.local_state:
+            raise AVMError(f"account has not opted in to app {app_id}")
+        return account.local_state[app_id]
+
+    def local_get(self, address, app_id, key, default):
+        self.stats["local_reads"] += 1
+        account = self.accounts.get(address)
+        if account is None or app_id not in account.local_state:
+            if default is None:
+                return None
+            raise AVMError(f"account has not opted in to app {app_id}")
+        return account.local_state[app_id].get(key, default)
+
+    def local_put(self, address, app_id, key, value):
+        self.stats["local_writes"] += 1
+        state = self.local_state(address, app_id)
+        if key not in state:
+            self.check_schema(state, self.apps[app_id].local_schema, value)
+        self.write(state, key, value)
+
+    def local_del(self, address, app_id, key):
+        self.stats["local_writes"] += 1
+        self.write(self.local_state(address, app_id), key, MISSING)
+
+    def box_get(self, app_id, name):
+        self.stats["box_reads"] += 1
+        return self.apps[app_id].boxes.get(name)
+
+    def box_put(self, app_id, name, value):
+        self.stats["box_writes"] += 1
+        if len(value) > MAX_BOX_SIZE:
+            raise AVMError("box size too large")
+        self.write(self.apps[app_id].boxes, name, value)
+
+    def box_del(self, app_id, name):
+        self.stats["box_writes"] += 1
+        existed = name in self.apps[app_id].boxes
+        self.write(self.apps[app_id].boxes, name, MISSING)
+        return existed
+
+    def holding(self, address, asset_id):
+        account = self.accounts.get(address)
+        return None if account is None else account.holdings.get(asset_id)
+
+    # Fields every inner transaction starts with
+    def inner_defaults(self, vm):
+        return {
+            "Sender": application_address(vm.app_id),
+            "Fee": 0,
+            "FirstValid": vm.txn.get("FirstValid", 0),
+            "LastValid": vm.txn.get("LastValid", 0)
+        }
+
+    # Apply a top-level transaction group atomically; returns one result per
+    # transaction or raises AVMError after rolling back
+    def apply_group(self, group):
+        results = self.evaluate_group(group)
+        self.journal = []
+        return results
+
+    # Evaluate a group like apply_group and then undo all of its effects
+    def simulate_group(self, group):
+        mark = len(self.journal)
+        next_id = self.next_id
+        try:
+            return self.evaluate_group(group)
+        finally:
+            self.rollback(mark)
+            self.next_id = next_id
+
+    # Evaluate a group, leaving its writes in the journal
+    def evaluate_group(self, group):
+        mark = len(self.journal)
+        self.budget = [APP_CALL_BUDGET * sum(1 for txn in group if txn["TypeEnum"] == 6)]
+        self.group_boxes = set()
+        for txn in group:
+            app_id = txn.get("ApplicationID", 0)
+            for index, name in txn.get("Boxes", []):
+                self.group_boxes.add((app_id if index == 0 else txn["Applications"][index - 1], name))
+        try:
+            results = []
+            for group_index, txn in enumerate(group):
+                txn["GroupIndex"] = group_index
+                results.append(self.apply_txn(txn, group))
+        except AVMError:
+            self.rollback(mark)
+            raise
+        return results
+
+    # Apply inner transactions submitted by a running program
+    def apply_inner_group(self, group, vm):
+        results = []
+        for group_index, txn in enumerate(group):
+            txn["GroupIndex"] = group_index
+            for field in ("Receiver", "AssetReceiver", "AssetSender", "FreezeAssetAccount", "CloseRemainderTo", "AssetCloseTo"):
+                if txn.get(field, ZERO_ADDRESS) != ZERO_ADDRESS:
+                    vm.account(txn[field])
+            for field in ("XferAsset", "FreezeAsset", "ConfigAsset"):
+                if txn.get(field):
+                    vm.asset(txn[field])
+            if txn["TypeEnum"] == 6:
+                if txn.get("ApplicationID"):
+                    vm.application(txn["ApplicationID"])
+                self.budget[0] += APP_CALL_BUDGET
+            result = self.apply_txn(txn, group, caller_app_id=vm.app_id)
+            if "CreatedAssetID" in result:
+                vm.created_assets.add(result["CreatedAssetID"])
+            results.append(result)
+        return results
+
+    # Apply a single transaction and return it with its apply data filled in
+    def apply_txn(self, txn, group, caller_app_id=0):
+        type_enum = txn["TypeEnum"]
+        if type_enum == 1:
+            self.apply_payment(txn)
+        elif type_enum == 3:
+            self.apply_asset_config(txn)
+        elif type_enum == 4:
+            self.apply_asset_transfer(txn)
+        elif type_enum == 5:
+            self.apply_asset_freeze(txn)
+        elif type_enum == 6:
+            self.apply_app_call(txn, group, caller_app_id)
+        else:
+            raise AVMError(f"unsupported transaction type {type_enum}")
+        return txn
+
+    def apply_payment(self, txn):
+        amount = txn.get("Amount", 0)
+        sender = self.account(txn["Sender"])
+        receiver = self.account(txn.get("Receiver", ZERO_ADDRESS))
+        self.write(sender.__dict__, "amount", sender.amount - amount)
+        self.write(receiver.__dict__, "amount", receiver.amount + amount)
+
+    def apply_asset_config(self, txn):
+        asset_id = txn.get("ConfigAsset", 0)
+        addresses = {
+            field: txn.get("ConfigAsset" + field.capitalize(), ZERO_ADDRESS)
+            for field in ("manager", "reserve", "freeze", "clawback")
+        }
+        if asset_id == 0:
+            asset_id = self.allocate_id()
+            params = {
+                "total": txn.get("ConfigAssetTotal", 0),
+                "decimals": txn.get("ConfigAssetDecimals", 0),
+                "default_frozen": txn.get("ConfigAssetDefaultFrozen", 0),
+                "unit_name": txn.get("ConfigAssetUnitName", b""),
+                "name": txn.get("ConfigAssetName", b""),
+                "url": txn.get("ConfigAssetURL", b""),
+                "metadata_hash": txn.get("ConfigAssetMetadataHash", b""),
+                "creator": txn["Sender"]
+            }
+            params.update(addresses)
+            self.write(self.assets, asset_id, params)
+            creator = self.account(txn["Sender"])
+            self.write(creator.holdings, asset_id, {"amount": params["total"], "frozen": False})
+            txn["CreatedAssetID"] = asset_id
+            return
+
+        params = self.assets.get(asset_id)
+        if params is None:
+            raise AVMError(f"asset {asset_id} does not exist")
+        if params["manager"] != txn["Sender"]:
+            raise AVMError("this transaction should be issued by the manager")
+        if all(address == ZERO_ADDRESS for address in addresses.values()):
+            creator = self.accounts[params["creator"]]
+            if creator.holdings[asset_id]["amount"] != params["total"]:
+                raise AVMError("cannot destroy asset: creator is holding only part of the total")
+            self.write(creator.holdings, asset_id, MISSING)
+            self.write(self.assets, asset_id, MISSING)
+            return
+        for field, address in addresses.items():
+            if params[field] == ZERO_ADDRESS and address != ZERO_ADDRESS:
+                raise AVMError(f"cannot change {field} address once cleared")
+            self.write(params, field, address)
+
+    def apply_asset_transfer(self, txn):
+        asset_id = txn["XferAsset"]
+        params = self.assets.get(asset_id)
+        if params is None:
+            raise AVMError(f"asset {asset_id} does not exist")
+        amount = txn.get("AssetAmount", 0)
+        receiver_address = txn.get("AssetReceiver", ZERO_ADDRESS)
+        clawback = txn.get("AssetSender", ZERO_ADDRESS) != ZERO_ADDRESS
+        source_address = txn["AssetSender"] if clawback else txn["Sender"]
+        if clawback and params["clawback"] != txn["Sender"]:
+            raise AVMError("clawback not authorized")
+
+        if not clawback and amount == 0 and receiver_address == source_address:
+            if self.holding(source_address, asset_id) is None:
+                account = self.account(source_address)
+                self.write(account.holdings, asset_id, {"amount": 0, "frozen": bool(params["default_frozen"])})
+            return
+
+        source = self.holding(source_address, asset_id)
+        receiver = self.holding(receiver_address, asset_id)
+        if source is None or receiver is None:
+            raise AVMError(f"asset {asset_id} missing from account")
+        if not clawback and (source["frozen"] or receiver["frozen"]):
+            raise AVMError(f"asset {asset_id} frozen")
+        if source["amount"] < amount:
+            raise AVMError("underflow on subtracting asset amount")
+        self.write(source, "amount", source["amount"] - amount)
+        self.write(receiver, "amount", receiver["amount"] + amount)
+
+    def apply_asset_freeze(self, txn):
+        asset_id = txn["FreezeAsset"]
+        params = self.assets.get(asset_id)
+        if params is None:
+            raise AVMError(f"asset {asset_id} does not exist")
+        if params["freeze"] != txn["Sender"]:
+            raise AVMError("freeze not authorized")
+        holding = self.holding(txn["FreezeAssetAccount"], asset_id)
+        if holding is None:
+            raise AVMError(f"asset {asset_id} missing from account")
+        self.write(holding, "frozen", bool(txn.get("FreezeAssetFrozen", 0)))
+
+    def apply_app_call(self, txn, group, caller_app_id):
+        self.stats["app_calls"] += 1
+        app_id = txn.get("ApplicationID", 0)
+        on_completion = txn.get("OnCompletion", 0)
+        sender = txn["Sender"]
+
+        if app_id == 0:
+            app_id = self.allocate_id()
+            app = Application(
+                app_id,
+                sender,
+                self.program(txn["ApprovalProgram"]),
+                self.program(txn["ClearStateProgram"]),
+                (txn.get("GlobalNumUint", 0), txn.get("GlobalNumByteSlice", 0)),
+                (txn.get("LocalNumUint", 0), txn.get("LocalNumByteSlice", 0))
+            )
+            self.write(self.apps, app_id, app)
+            self.account(sender)
+            txn["CreatedApplicationID"] = app_id
+            boxes = [(0, name) for index, name in txn.get("Boxes", []) if index == 0]
+            self.group_boxes.update((app_id, name) for _, name in boxes)
+        else:
+            app = self.apps.get(app_id)
+            if app is None:
+                raise AVMError(f"application {app_id} does not exist")
+
+        if on_completion == 1:
+            account = self.account(sender)
+            if app_id in account.local_state:
+                raise AVMError(f"account has already opted in to app {app_id}")
+            self.write(account.local_state, app_id, {})
+        if on_completion == 3:
+            self.run_clear_state(txn, group, app, caller_app_id)
+            return
+
+        evaluator = Evaluator(self, txn, group, app_id, app.approval, caller_app_id)
+        approved = evaluator.run()
+        txn["Logs"] = evaluator.logs
+        txn["InnerTxns"] = evaluator.inner_results
+        if not approved:
+            raise AVMError(f"transaction rejected by ApprovalProgram of app {app_id}")
+
+        if on_completion == 2:
+            self.write(self.accounts[sender].local_state, app_id, MISSING)
+        elif on_completion == 4:
+            self.write(app.__dict__, "approval", self.program(txn["ApprovalProgram"]))
+            self.write(app.__dict__, "clear", self.program(txn["ClearStateProgram"]))
+        elif on_completion == 5:
+            self.write(self.apps, app_id, MISSING)
+
+    def run_clear_state(self, txn, group, app, caller_app_id):
+        mark = len(self.journal)
+        try:
+            evaluator = Evaluator(self, txn, group, app.app_id, app.clear, caller_app_id)
+            evaluator.run()
+            txn["Logs"] = evaluator.logs
+        except AVMError:
+            # A failing clear state program still clears the local state
+            self.rollback(mark)
+        self.write(self.accounts[txn["Sender"]].local_state, app.app_id, MISSING)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# Offline throughput benchmark of inventory contract calls.
+#
+# Deploys the inventory approval program into the in-process evaluator
+# (avm.py), creates a product and replays a stream of update_quantity and
+# reorder calls, reporting calls per second together with opcodes and state
+# accesses per call. By default transactions are applied to the ledger
+# directly; --client sends signed transactions through LocalAlgodClient to
+# include encoding and confirmation in the measurement.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+import inventory_contract
+from inventory_contract import product_box_name
+from pyteal import compileTeal, Mode
+from router import TEAL_VERSION, method_selector
+from avm import Ledger, itob
+from deploy import CONTRACTS
+
+# Methods replayed by the benchmark
+BENCH_METHODS = ["update_quantity", "reorder"]
+
+# Stats counters reported per call
+STATE_COUNTERS = [
+    "opcodes", "logs", "global_reads", "global_writes",
+    "local_reads", "local_writes", "box_reads", "box_writes"
+]
+
+PRODUCT_ID = 1
+MIN_THRESHOLD = 100
+
+# Deployment spec of the inventory app, so the benchmark creates it with the
+# state schema deploy.py uses
+INVENTORY_SPEC = next(contract for contract in CONTRACTS if contract["name"] == "inventory")
+
+def app_call(sender, app_id, app_args):
+    return {
+        "TypeEnum": 6,
+        "Sender": sender,
+        "ApplicationID": app_id,
+        "ApplicationArgs": app_args,
+        "Boxes": [(0, product_box_name(PRODUCT_ID))]
+    }
+
+# Arguments of the benchmarked calls; update_quantity alternates between
+# quantities above and below the reorder threshold so both paths are taken
+def call_args(method, index):
+    selector = method_selector(inventory_contract.METHODS, method)
+    if method == "update_quantity":
+        quantity = MIN_THRESHOLD // 2 if index % 2 else MIN_THRESHOLD * 2
+        return [selector, itob(PRODUCT_ID), itob(quantity)]
+    return [selector, itob(PRODUCT_ID), itob(1)]
+
+def create_product_args():
+    return [
+        method_selector(inventory_contract.METHODS, "create_product"),
+        itob(PRODUCT_ID), itob(MIN_THRESHOLD), itob(1000), b"warehouse-1", itob(0), b"supplier-1"
+    ]
+
+# Deploy the inventory contract into a fresh ledger and create one product
+# owned by the admin; returns (ledger, app_id, admin)
+def setup_ledger():
+    admin = os.urandom(32)
+    ledger = Ledger(timestamp=int(time.time()))
+    create = {
+        "TypeEnum": 6,
+        "Sender": admin,
+        "ApplicationID": 0,
+        "ApprovalProgram": inventory_contract.approval_program(),
+        "ClearStateProgram": compileTeal(inventory_contract.clear_state_program(), Mode.Application, version=TEAL_VERSION),
+        "GlobalNumUint": INVENTORY_SPEC["global_schema"].num_uints,
+        "GlobalNumByteSlice": INVENTORY_SPEC["global_schema"].num_byte_slices,
+        "ApplicationArgs": [admin, admin]
+    }
+    app_id = ledger.apply_group([create])[0]["CreatedApplicationID"]
+    ledger.apply_group([app_call(admin, app_id, create_product_args())])
+    return ledger, app_id, admin
+
+# Replay calls against the ledger directly, one block per call
+def run_direct(calls, methods, seed):
+    ledger, app_id, admin = setup_ledger()
+    rng = random.Random(seed)
+    results = {method: {"calls": 0, "seconds": 0.0, **{counter: 0 for counter in STATE_COUNTERS}} for method in methods}
+
+    for index in range(calls):
+        method = rng.choice(methods)
+        txn = app_call(admin, app_id, call_args(method, index))
+        before = [ledger.stats[counter] for counter in STATE_COUNTERS]
+        start = time.perf_counter()
+        ledger.apply_group([txn])
+        elapsed = time.perf_counter() - start
+        ledger.round += 1
+        result = results[method]
+        result["calls"] += 1
+        result["seconds"] += elapsed
+        for counter, value in zip(STATE_COUNTERS, before):
+            result[counter] += ledger.stats[counter] - value
+    return results
+
+# Replay signed calls through LocalAlgodClient, one block per call
+def run_client(calls, methods, seed):
+    from algosdk import account, encoding
+    from algosdk.future.transaction import ApplicationNoOpTxn
+    from local_algod import LocalAlgodClient
+    from deploy import compile_program, create_app
+
+    client = LocalAlgodClient()
+    private_key, sender = account.generate_account()
+    client.fund(sender, 10_000_000_000)
+    admin = encoding.decode_address(sender)
+    app_id = create_app(
+        client,
+        private_key,
+        compile_program(client, inventory_contract.approval_program),
+        compile_program(client, inventory_contract.clear_state_program),
+        INVENTORY_SPEC["global_schema"],
+        INVENTORY_SPEC["local_schema"],
+        [admin, admin]
+    )
+    params = client.suggested_params()
+    boxes = [(app_id, product_box_name(PRODUCT_ID))]
+    client.send_transaction(ApplicationNoOpTxn(sender, params, app_id, create_product_args(), boxes=boxes).sign(private_key))
+
+    ledger = client.ledger
+    rng = random.Random(seed)
+    results = {method: {"calls": 0, "seconds": 0.0, **{counter: 0 for counter in STATE_COUNTERS}} for method in methods}
+    for index in range(calls):
+        method = rng.choice(methods)
+        # The note keeps otherwise identical transactions distinct
+        txn = ApplicationNoOpTxn(sender, params, app_id, call_args(method, index), note=itob(index), boxes=boxes)
+        before = [ledger.stats[counter] for counter in STATE_COUNTERS]
+        start = time.perf_counter()
+        tx_id = client.send_transaction(txn.sign(private_key))
+        client.pending_transaction_info(tx_id)
+        elapsed = time.perf_counter() - start
+        result = results[method]
+        result["calls"] += 1
+        result["seconds"] += elapsed
+        for counter, value in zip(STATE_COUNTERS, before):
+            result[counter] += ledger.stats[counter] - value
+    return results
+
+# Per-call averages and throughput of the raw results
+def summarize(results):
+    summary = {}
+    for method, result in results.items():
+        calls = result["calls"]
+        if not calls:
+            continue
+        summary[method] = {
+            "calls": calls,
+            "calls_per_second": round(calls / result["seconds"], 1) if result["seconds"] else 0.0,
+            **{f"{counter}_per_call": round(result[counter] / calls, 2) for counter in STATE_COUNTERS}
+        }
+    return summary
+
+def print_report(summary, total_seconds):
+    total_calls = sum(result["calls"] for result in summary.values())
+    print(f"{total_calls} calls in {total_seconds:.2f}s ({total_calls / total_seconds:.0f} calls/s overall)")
+    for method, result in summary.items():
+        print(f"  {method}: {result['calls']} calls, {result['calls_per_second']:.0f} calls/s")
+        accesses = ", ".join(f"{counter} {result[counter + '_per_call']}" for counter in STATE_COUNTERS)
+        print(f"    per call: {accesses}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay inventory contract calls in the local evaluator')
+    parser.add_argument('--calls', type=int, default=100000, help='Number of calls to replay')
+    parser.add_argument('--method', action='append', choices=BENCH_METHODS,
+                        help='Method to replay (repeatable, default: all)')
+    parser.add_argument('--client', action='store_true',
+                        help='Send signed transactions through LocalAlgodClient instead of the ledger')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the method mix')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    run = run_client if args.client else run_direct
+    start = time.perf_counter()
+    summary = summarize(run(args.calls, args.method or BENCH_METHODS, args.seed))
+    total_seconds = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps({"seconds": round(total_seconds, 3), "methods": summary}, indent=2))
+    else:
+        print_report(summary, total_seconds)
+
+if __name__ == "__main__":
+    main()
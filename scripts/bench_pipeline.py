@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+# Benchmark of the client-side transaction pipeline.
+#
+# Every transaction the scripts send goes through the same stages: fetch
+# suggested params, build the ApplicationNoOpTxn, sign it, msgpack-encode it,
+# submit it and wait for its confirmation. This measures each stage on its
+# own over COUNT transactions and reports its throughput and p50/p99
+# latency. By default it runs against the local algod stand-in, served over
+# HTTP in this process so requests pay the same client overhead as with a
+# node; --algod points it at a real node instead (using account.json).
+# Results are appended to a JSON history keyed by git commit, like the
+# opcode-cost history, and compared with the previous entry.
+
+import argparse
+import base64
+import json
+import os
+import subprocess
+import threading
+import time
+from algosdk import account, encoding, mnemonic
+from algosdk.v2client import algod
+from algosdk.future.transaction import ApplicationCreateTxn, ApplicationNoOpTxn, OnComplete, StateSchema
+from confirmation import ConfirmationTracker, fetch_block_txids
+from local_algod import LocalAlgodClient, serve
+from signer_pool import sign_raw
+from nacl.signing import SigningKey
+
+# Algorand node connection parameters of --algod
+algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+
+# Default location of the results history
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'pipeline.json')
+
+# Transactions measured per stage
+DEFAULT_COUNT = 500
+
+# Pipeline stages in the order a transaction goes through them
+STAGES = ["params", "construct", "sign", "sign_raw", "encode", "submit", "confirm"]
+
+# Program of the benchmark app; it approves every call
+APPROVAL_PROGRAM = "#pragma version 8\nint 1\nreturn\n"
+
+# Value at percentile pct of sorted samples (nearest rank)
+def percentile(samples, pct):
+    index = max(0, -(-len(samples) * pct // 100) - 1)
+    return samples[int(index)]
+
+# Throughput and latency of a stage from its per-transaction latencies
+# (seconds) and the wall time of the whole stage
+def stage_stats(latencies, elapsed):
+    samples = sorted(latencies)
+    return {
+        "count": len(samples),
+        "txns_per_sec": round(len(samples) / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3)
+    }
+
+# Run fn on every item, timing each call; returns the results, the
+# per-call latencies and the wall time
+def timed(fn, items):
+    results, latencies = [], []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - call_start)
+    return results, latencies, time.perf_counter() - start
+
+# Follows new blocks on a thread and records when each transaction ID was
+# first seen in one
+class BlockWatcher:
+    def __init__(self, client):
+        self.client = client
+        self.seen_at = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.last_round = client.status().get("last-round")
+
+    def start(self):
+        threading.Thread(target=self.follow, daemon=True).start()
+
+    def follow(self):
+        while not self.stopped:
+            try:
+                latest = self.client.status_after_block(self.last_round).get("last-round")
+            except Exception:
+                # The node may go away while a stopped watcher is still waiting
+                if self.stopped:
+                    return
+                raise
+            while self.last_round < latest:
+                self.last_round += 1
+                tx_ids = fetch_block_txids(self.client, self.last_round)
+                now = time.perf_counter()
+                with self.condition:
+                    for tx_id in tx_ids:
+                        self.seen_at.setdefault(tx_id, now)
+                    self.condition.notify_all()
+
+    # Block until every transaction was seen, then stop following; returns
+    # {transaction ID: time seen}
+    def wait(self, tx_ids):
+        with self.condition:
+            self.condition.wait_for(lambda: all(tx_id in self.seen_at for tx_id in tx_ids))
+            self.stopped = True
+            return dict(self.seen_at)
+
+# Start the local algod stand-in on a free port with the sender funded;
+# returns its address and the HTTP server
+def start_local_algod(address):
+    local = LocalAlgodClient()
+    local.fund(address, 10_000_000_000)
+    server = serve(local, "localhost", 0, algod_token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://localhost:{server.server_address[1]}", server
+
+# Create the app the benchmark calls
+def create_bench_app(client, private_key):
+    sender = account.address_from_private_key(private_key)
+    program = base64.b64decode(client.compile(APPROVAL_PROGRAM)["result"])
+    txn = ApplicationCreateTxn(
+        sender, client.suggested_params(), OnComplete.NoOpOC.real, program, program,
+        StateSchema(0, 0), StateSchema(0, 0)
+    )
+    tx_id = client.send_transaction(txn.sign(private_key))
+    return ConfirmationTracker(client).wait([tx_id])[0]["application-index"]
+
+# Measure every stage over count transactions and return their stats
+def run_pipeline(client, private_key, app_id, count):
+    sender = account.address_from_private_key(private_key)
+    results = {}
+
+    params_list, latencies, elapsed = timed(lambda _: client.suggested_params(), range(count))
+    results["params"] = stage_stats(latencies, elapsed)
+
+    # A distinct note per transaction keeps every transaction ID unique
+    txns, latencies, elapsed = timed(
+        lambda index: ApplicationNoOpTxn(sender, params_list[index], app_id, [b"bench"], note=index.to_bytes(8, "big")),
+        range(count)
+    )
+    results["construct"] = stage_stats(latencies, elapsed)
+
+    signed, latencies, elapsed = timed(lambda txn: txn.sign(private_key), txns)
+    results["sign"] = stage_stats(latencies, elapsed)
+
+    # The signer pool's path, which signs and encodes in one step
+    signing_keys = {sender: SigningKey(base64.b64decode(private_key)[:32])}
+    _, latencies, elapsed = timed(lambda txn: sign_raw(txn, signing_keys), txns)
+    results["sign_raw"] = stage_stats(latencies, elapsed)
+
+    encoded, latencies, elapsed = timed(encoding.msgpack_encode, signed)
+    results["encode"] = stage_stats(latencies, elapsed)
+
+    submitted_at = {}
+    watcher = BlockWatcher(client)
+    watcher.start()
+
+    def submit(raw):
+        sent = time.perf_counter()
+        tx_id = client.send_raw_transaction(raw)
+        submitted_at[tx_id] = sent
+        return tx_id
+
+    start = time.perf_counter()
+    tx_ids, latencies, elapsed = timed(submit, encoded)
+    results["submit"] = stage_stats(latencies, elapsed)
+
+    # Confirmation latency runs from sending a transaction until it is seen
+    # in a block (a DevMode node commits it before the submission returns);
+    # throughput covers the first submission to the last confirmation
+    seen_at = watcher.wait(tx_ids)
+    results["confirm"] = stage_stats(
+        [seen_at[tx_id] - submitted_at[tx_id] for tx_id in tx_ids],
+        max(seen_at[tx_id] for tx_id in tx_ids) - start
+    )
+    return results
+
+def load_results(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"history": []}
+
+# Short hash of the checked-out commit, used to key recorded results
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Append (or replace) the entry of a commit and target in the results file;
+# returns the previous entry of the same target, if any
+def record_results(path, entry):
+    results = load_results(path)
+    history = [
+        previous for previous in results["history"]
+        if (previous["commit"], previous["target"]) != (entry["commit"], entry["target"])
+    ]
+    baseline = next((previous for previous in reversed(history) if previous["target"] == entry["target"]), None)
+    results["history"] = history + [entry]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    return baseline
+
+def print_report(stages, baseline=None):
+    print(f"{'stage':<10} {'txn/s':>10} {'p50 ms':>9} {'p99 ms':>9}  change")
+    for name in STAGES:
+        stats = stages[name]
+        change = ""
+        previous = (baseline or {}).get("stages", {}).get(name)
+        if previous and previous.get("txns_per_sec") and stats["txns_per_sec"]:
+            change = f"{(stats['txns_per_sec'] / previous['txns_per_sec'] - 1) * 100:+.1f}% txn/s"
+        print(f"{name:<10} {stats['txns_per_sec']:>10} {stats['p50_ms']:>9} {stats['p99_ms']:>9}  {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure throughput and latency of each transaction pipeline stage')
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT, help='Transactions measured per stage')
+    parser.add_argument('--algod', metavar='URL',
+                        help='Benchmark against this node with account.json (default: the local stand-in)')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help='Results history file')
+    parser.add_argument('--no_record', action='store_true', help='Print the results without recording them')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    server = None
+    if args.algod:
+        try:
+            with open("account.json", "r") as f:
+                private_key = mnemonic.to_private_key(json.load(f)["mnemonic"])
+        except (OSError, ValueError, KeyError):
+            print("Error: account.json not found. Please run deploy.py first.")
+            return
+        address, target = args.algod, args.algod
+    else:
+        private_key, sender = account.generate_account()
+        address, server = start_local_algod(sender)
+        target = "local"
+
+    client = algod.AlgodClient(algod_token, address)
+    try:
+        app_id = create_bench_app(client, private_key)
+        stages = run_pipeline(client, private_key, app_id, args.count)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    entry = {"commit": current_commit(), "timestamp": int(time.time()), "target": target,
+             "count": args.count, "stages": stages}
+    baseline = None
+    if not args.no_record:
+        baseline = record_results(args.output, entry)
+    if args.json:
+        print(json.dumps(entry, indent=2))
+    else:
+        print_report(stages, baseline)
+    if not args.no_record:
+        print(f"Recorded results for commit {entry['commit']} in {args.output}")
+
+if __name__ == "__main__":
+    main()
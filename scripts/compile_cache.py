@@ -0,0 +1,133 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+import time
+from importlib import metadata
+
+# Default location of the on-disk compile cache, relative to the working directory
+DEFAULT_CACHE_DIR = ".teal_cache"
+
+def pyteal_version():
+    try:
+        return metadata.version("pyteal")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def sha256_hex(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# On-disk cache of compiled TEAL programs.
+#
+# Entries live in two namespaces:
+# - "teal": keyed by the hash of the generated TEAL source, TEAL version and
+#   node, holding the bytecode and program hash returned by algod's compile
+#   endpoint.
+# - "source": keyed by the hash of the contract sources, the program function,
+#   the PyTeal version, the TEAL version and the node, pointing at a "teal"
+#   entry. A hit here skips building the PyTeal AST altogether.
+#
+# The node is identified by its genesis ID and hash, so a cache directory
+# shared between networks never serves one node's compile output to another
+# (the local algod stand-in returns the TEAL source itself as bytecode).
+class CompileCache:
+    def __init__(self, path=DEFAULT_CACHE_DIR):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.node_keys = {}
+
+    def entry_path(self, namespace, key):
+        return os.path.join(self.path, namespace, f"{key}.json")
+
+    def load(self, namespace, key):
+        path = self.entry_path(namespace, key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Refresh the modification time so pruning keeps entries in use
+        os.utime(path)
+        return entry
+
+    def store(self, namespace, key, entry):
+        path = self.entry_path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        return entry
+
+    # Genesis ID and hash of the network a client's node is on, fetched once
+    # per client
+    def node_key(self, client):
+        with self.lock:
+            node_key = self.node_keys.get(client)
+        if node_key is None:
+            params = client.suggested_params()
+            node_key = f"{params.gen}:{params.gh}"
+            with self.lock:
+                self.node_keys[client] = node_key
+        return node_key
+
+    # Key a program function by every contract source next to it, so edits to
+    # shared helpers invalidate dependent programs as well
+    def source_key(self, program, version, node_key):
+        source_dir = os.path.dirname(os.path.abspath(inspect.getsourcefile(program)))
+        parts = [program.__module__, program.__qualname__, pyteal_version(), version, node_key]
+        for path in sorted(glob.glob(os.path.join(source_dir, "*.py"))):
+            with open(path, "rb") as f:
+                parts += [os.path.basename(path), f.read()]
+        return sha256_hex(*parts)
+
+    # Compile TEAL source through algod unless an identical program was
+    # compiled by a node of the same network
+    def compile_teal(self, client, teal, version):
+        teal_key = sha256_hex(teal, version, self.node_key(client))
+        entry = self.load("teal", teal_key)
+        if entry is None:
+            result = client.compile(teal)
+            entry = self.store("teal", teal_key, {"result": result["result"], "hash": result["hash"]})
+        return teal_key, entry
+
+    # Return the compile result for a program function, building TEAL with
+    # build_teal only when the contract sources changed
+    def compile(self, client, program, version, build_teal):
+        source_key = self.source_key(program, version, self.node_key(client))
+        source_entry = self.load("source", source_key)
+        if source_entry is not None:
+            entry = self.load("teal", source_entry["teal_key"])
+            if entry is not None:
+                with self.lock:
+                    self.hits += 1
+                return entry
+
+        with self.lock:
+            self.misses += 1
+        teal_key, entry = self.compile_teal(client, build_teal(), version)
+        self.store("source", source_key, {"teal_key": teal_key})
+        return entry
+
+    # Remove every cached entry
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # Remove entries that have not been used for max_age_days; returns the number removed
+    def prune(self, max_age_days):
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for path in glob.glob(os.path.join(self.path, "*", "*.json")):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
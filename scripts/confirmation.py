@@ -0,0 +1,217 @@
+import asyncio
+import base64
+import msgpack
+from metrics import CONFIRMATION_ROUNDS
+
+# Number of rounds a transaction may stay unseen before the tracker gives up
+DEFAULT_WAIT_ROUNDS = 1000
+
+class ConfirmationTimeout(Exception):
+    pass
+
+# Build a pending_transaction_info-style record from a transaction in a block
+def block_txn_info(stxn, confirmed_round):
+    txinfo = {"confirmed-round": confirmed_round}
+    if b"caid" in stxn:
+        txinfo["asset-index"] = stxn[b"caid"]
+    if b"apid" in stxn:
+        txinfo["application-index"] = stxn[b"apid"]
+
+    eval_delta = stxn.get(b"dt", {})
+    if eval_delta.get(b"lg"):
+        txinfo["logs"] = [base64.b64encode(log).decode() for log in eval_delta[b"lg"]]
+    if eval_delta.get(b"itx"):
+        txinfo["inner-txns"] = [block_txn_info(itxn, confirmed_round) for itxn in eval_delta[b"itx"]]
+    return txinfo
+
+# Fetch the IDs of the transactions in a block, in block order
+def fetch_block_txids(client, round_num):
+    return client.algod_request("GET", f"/blocks/{round_num}/txids")["blockTxids"] or []
+
+# Pair each transaction of a msgpack-encoded block with its ID
+def decode_block_txns(raw_block, tx_ids):
+    block = msgpack.unpackb(raw_block, raw=True, strict_map_key=False)[b"block"]
+    return list(zip(tx_ids, block.get(b"txns", [])))
+
+# Fetch a block and pair each of its transactions with its ID
+def fetch_block_txns(client, round_num, tx_ids=None):
+    if tx_ids is None:
+        tx_ids = fetch_block_txids(client, round_num)
+    return decode_block_txns(client.block_info(round_num, response_format="msgpack"), tx_ids)
+
+# Tracks many pending transactions at once. Each round it waits on
+# status_after_block a single time and resolves every tracked transaction in
+# the new block, so algod traffic grows with rounds rather than transactions.
+class ConfirmationTracker:
+    def __init__(self, client, wait_rounds=DEFAULT_WAIT_ROUNDS):
+        self.client = client
+        self.wait_rounds = wait_rounds
+        self.pending = set()
+        self.confirmed = {}
+        # Round each pending transaction was added in
+        self.added_round = {}
+        self.last_round = client.status().get("last-round")
+        # The latest round may already contain transactions submitted just
+        # before the tracker was created, so scanning starts there
+        self.next_round = self.last_round
+
+    # Start tracking transaction IDs
+    def add(self, *tx_ids):
+        for tx_id in tx_ids:
+            if tx_id not in self.confirmed:
+                self.pending.add(tx_id)
+                self.added_round.setdefault(tx_id, self.last_round)
+
+    # Resolve tracked transactions contained in a single round
+    def scan_round(self, round_num):
+        tx_ids = fetch_block_txids(self.client, round_num)
+        if self.pending.isdisjoint(tx_ids):
+            return
+
+        for tx_id, stxn in fetch_block_txns(self.client, round_num, tx_ids):
+            if tx_id in self.pending:
+                self.pending.discard(tx_id)
+                self.confirmed[tx_id] = block_txn_info(stxn, round_num)
+                CONFIRMATION_ROUNDS.observe(max(0, round_num - self.added_round.pop(tx_id)))
+
+    # Scan every round produced since the last poll, waiting for a new
+    # round first if all known rounds were already scanned
+    def poll(self):
+        if self.next_round > self.last_round:
+            print("Waiting for confirmation...")
+            self.last_round = self.client.status_after_block(self.last_round).get("last-round")
+        while self.next_round <= self.last_round:
+            self.scan_round(self.next_round)
+            self.next_round += 1
+
+    # Fall back to pending_transaction_info for transactions the block scan
+    # never saw, e.g. ones confirmed before tracking started
+    def resolve_stragglers(self, tx_ids):
+        for tx_id in tx_ids:
+            txinfo = self.client.pending_transaction_info(tx_id)
+            if txinfo.get("confirmed-round", 0) > 0:
+                self.pending.discard(tx_id)
+                self.confirmed[tx_id] = txinfo
+                CONFIRMATION_ROUNDS.observe(max(0, txinfo["confirmed-round"] - self.added_round.pop(tx_id)))
+            elif txinfo.get("pool-error"):
+                raise ConfirmationTimeout(f"Transaction {tx_id} rejected: {txinfo['pool-error']}")
+
+    # Block until every given transaction is confirmed and return their infos
+    def wait(self, tx_ids):
+        tx_ids = list(tx_ids)
+        self.add(*tx_ids)
+
+        start_round = self.next_round
+        while any(tx_id in self.pending for tx_id in tx_ids):
+            if self.next_round - start_round >= self.wait_rounds:
+                self.resolve_stragglers([tx_id for tx_id in tx_ids if tx_id in self.pending])
+                unresolved = [tx_id for tx_id in tx_ids if tx_id in self.pending]
+                if unresolved:
+                    raise ConfirmationTimeout(f"Transactions not confirmed after {self.wait_rounds} rounds: {unresolved}")
+                break
+            self.poll()
+
+        return [self.confirmed[tx_id] for tx_id in tx_ids]
+
+# Wait for a single transaction to be confirmed
+def wait_for_confirmation(client, tx_id):
+    txinfo = ConfirmationTracker(client).wait([tx_id])[0]
+    print(f"Transaction {tx_id} confirmed in round {txinfo.get('confirmed-round')}.")
+    return txinfo
+
+# asyncio counterpart of ConfirmationTracker for use with AsyncAlgodClient.
+# A single background task follows the chain while any waiter is pending and
+# resolves the waiters' futures from each new block. Concurrent callers that
+# share a tracker must add() their transaction IDs before sending them: a
+# block the tracker already scanned is not scanned again, so a transaction
+# added after it landed would only be found by the wait_rounds fallback.
+class AsyncConfirmationTracker:
+    def __init__(self, client, wait_rounds=DEFAULT_WAIT_ROUNDS):
+        self.client = client
+        self.wait_rounds = wait_rounds
+        # Future of every added transaction until its result is collected,
+        # and the round each unresolved one was added in
+        self.futures = {}
+        self.pending = {}
+        self.last_round = None
+        self.next_round = None
+        self.task = None
+
+    # Resolve tracked transactions contained in a single round
+    async def scan_round(self, round_num):
+        response = await self.client.algod_request("GET", f"/blocks/{round_num}/txids")
+        tx_ids = response["blockTxids"] or []
+        if not any(tx_id in self.pending for tx_id in tx_ids):
+            return
+
+        raw_block = await self.client.block_info(round_num, response_format="msgpack")
+        for tx_id, stxn in decode_block_txns(raw_block, tx_ids):
+            if tx_id in self.pending:
+                added_round = self.pending.pop(tx_id)
+                CONFIRMATION_ROUNDS.observe(max(0, round_num - added_round))
+                self.resolve(tx_id, result=block_txn_info(stxn, round_num))
+
+    def resolve(self, tx_id, result=None, error=None):
+        future = self.futures[tx_id]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # Check transactions that stayed unseen for too long and fail the ones
+    # that are still not confirmed
+    async def expire(self):
+        expired = [tx_id for tx_id, added_round in self.pending.items() if self.next_round - added_round >= self.wait_rounds]
+        for tx_id in expired:
+            self.pending.pop(tx_id)
+            txinfo = await self.client.pending_transaction_info(tx_id)
+            if txinfo.get("confirmed-round", 0) > 0:
+                self.resolve(tx_id, result=txinfo)
+            else:
+                self.resolve(tx_id, error=ConfirmationTimeout(
+                    f"Transaction {tx_id} not confirmed after {self.wait_rounds} rounds: {txinfo.get('pool-error', '')}"
+                ))
+
+    async def run(self):
+        try:
+            while self.pending:
+                if self.next_round > self.last_round:
+                    status = await self.client.status_after_block(self.last_round)
+                    self.last_round = status.get("last-round")
+                while self.next_round <= self.last_round:
+                    await self.scan_round(self.next_round)
+                    self.next_round += 1
+                await self.expire()
+        except Exception as e:
+            for tx_id in self.pending:
+                self.resolve(tx_id, error=e)
+            self.pending.clear()
+
+    # Start tracking transaction IDs; call before sending them
+    async def add(self, *tx_ids):
+        if self.last_round is None:
+            status = await self.client.status()
+            if self.last_round is None:
+                self.last_round = status.get("last-round")
+                self.next_round = self.last_round
+
+        loop = asyncio.get_running_loop()
+        for tx_id in tx_ids:
+            if tx_id not in self.futures:
+                self.futures[tx_id] = loop.create_future()
+                self.pending[tx_id] = self.next_round
+
+    # Wait until every given transaction is confirmed and return their infos
+    async def wait(self, tx_ids):
+        tx_ids = list(tx_ids)
+        await self.add(*tx_ids)
+        futures = [self.futures[tx_id] for tx_id in tx_ids]
+        if self.pending and (self.task is None or self.task.done()):
+            self.task = asyncio.ensure_future(self.run())
+        try:
+            return await asyncio.gather(*futures)
+        finally:
+            for tx_id in tx_ids:
+                self.futures.pop(tx_id, None)
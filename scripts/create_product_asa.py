@@ -5,41 +5,35 @@ import os
 import json
 import time
 import argparse
+import csv
+from collections import deque
 from algosdk import account, mnemonic
 from algosdk.v2client import algod
 from algosdk.future import transaction
 from algosdk.future.transaction import AssetConfigTxn
+from confirmation import AsyncConfirmationTracker, ConfirmationTracker, wait_for_confirmation
+from params_cache import SuggestedParamsProvider, get_suggested_params, get_suggested_params_async, unique_note
+from metrics import instrument_client
 
 # Algorand node connection parameters
 algod_address = "http://localhost:4001"
 algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
+# Maximum number of transactions in an atomic group
+MAX_GROUP_SIZE = 16
+
 # Initialize Algod client
 def get_algod_client():
-    return algod.AlgodClient(algod_token, algod_address)
+    return instrument_client(algod.AlgodClient(algod_token, algod_address))
 
-# Wait for a transaction to be confirmed
-def wait_for_confirmation(client, tx_id):
-    last_round = client.status().get("last-round")
-    txinfo = client.pending_transaction_info(tx_id)
-    while not (txinfo.get("confirmed-round") and txinfo.get("confirmed-round") > 0):
-        print("Waiting for confirmation...")
-        last_round += 1
-        client.status_after_block(last_round)
-        txinfo = client.pending_transaction_info(tx_id)
-    print(f"Transaction {tx_id} confirmed in round {txinfo.get('confirmed-round')}.")
-    return txinfo
+# Initialize asyncio Algod client (requires aiohttp)
+def get_async_algod_client(max_concurrency=64):
+    from async_algod import AsyncAlgodClient
+    return instrument_client(AsyncAlgodClient(algod_token, algod_address, max_concurrency=max_concurrency))
 
-# Create a new ASA for a product
-def create_product_asa(client, private_key, product_data):
-    # Get suggested parameters
-    params = client.suggested_params()
-    
-    # Get sender address
-    sender = account.address_from_private_key(private_key)
-    
-    # Create unsigned asset creation transaction
-    txn = AssetConfigTxn(
+# Build an unsigned asset creation transaction for a product
+def build_product_asa_txn(sender, params, product_data):
+    return AssetConfigTxn(
         sender=sender,
         sp=params,
         total=product_data["quantity"],
@@ -52,8 +46,20 @@ def create_product_asa(client, private_key, product_data):
         clawback=sender,
         url=product_data["url"],
         metadata_hash=base64.b64decode(product_data["metadata_hash"]) if product_data["metadata_hash"] else None,
-        decimals=0
+        decimals=0,
+        note=unique_note()
     )
+
+# Create a new ASA for a product
+def create_product_asa(client, private_key, product_data, params_provider=None):
+    # Get suggested parameters
+    params = get_suggested_params(client, params_provider)
+    
+    # Get sender address
+    sender = account.address_from_private_key(private_key)
+    
+    # Create unsigned asset creation transaction
+    txn = build_product_asa_txn(sender, params, product_data)
     
     # Sign transaction
     signed_txn = txn.sign(private_key)
@@ -69,17 +75,123 @@ def create_product_asa(client, private_key, product_data):
     
     return asset_id
 
+# Create a new ASA for a product through the asyncio client
+async def create_product_asa_async(client, private_key, product_data, tracker=None, params_provider=None):
+    params = await get_suggested_params_async(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    
+    txn = build_product_asa_txn(sender, params, product_data)
+    signed_txn = txn.sign(private_key)
+    
+    # Track the transaction before sending it, so a shared tracker cannot
+    # scan its block first
+    if tracker is None:
+        tracker = AsyncConfirmationTracker(client)
+    tx_id = signed_txn.get_txid()
+    await tracker.add(tx_id)
+    await client.send_transaction(signed_txn)
+    txinfos = await tracker.wait([tx_id])
+    return txinfos[0]["asset-index"]
+
+# Load a product manifest from a CSV or JSONL file
+def load_manifest(path):
+    products = []
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            products.append({
+                "name": row["name"],
+                "unit_name": row["unit_name"],
+                "quantity": int(row["quantity"]),
+                "url": row["url"],
+                "metadata_hash": row.get("metadata_hash") or None
+            })
+    return products
+
+# Sign and submit one atomic group of asset creation transactions
+def submit_product_group(client, private_key, products, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    
+    txns = [build_product_asa_txn(sender, params, product_data) for product_data in products]
+    transaction.assign_group_id(txns)
+    signed_txns = [txn.sign(private_key) for txn in txns]
+    
+    client.send_transactions(signed_txns)
+    return [txn.get_txid() for txn in txns]
+
+# Wait for a submitted group and collect the asset ID of every product in it.
+# Each product is saved as soon as its group confirms, so an interrupted run
+# still leaves a file for every ASA it created.
+def collect_product_group(tracker, products, tx_ids):
+    txinfos = tracker.wait(tx_ids)
+    results = [dict(product_data, asset_id=txinfo["asset-index"]) for product_data, txinfo in zip(products, txinfos)]
+    for product_data in results:
+        save_product(product_data)
+    return results
+
+# Create ASAs for many products, packing them into atomic groups and keeping
+# several groups in flight so throughput is bound by block capacity
+def create_product_asas_bulk(client, private_key, products, group_size=MAX_GROUP_SIZE, max_in_flight=8):
+    if not 1 <= group_size <= MAX_GROUP_SIZE:
+        raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+    
+    groups = [products[i:i + group_size] for i in range(0, len(products), group_size)]
+    tracker = ConfirmationTracker(client)
+    in_flight = deque()
+    results = []
+    
+    with SuggestedParamsProvider(client) as params_provider:
+        for group in groups:
+            # Retire the oldest group once the in-flight window is full
+            if len(in_flight) >= max_in_flight:
+                results.extend(collect_product_group(tracker, *in_flight.popleft()))
+            
+            tx_ids = submit_product_group(client, private_key, group, params_provider)
+            tracker.add(*tx_ids)
+            in_flight.append((group, tx_ids))
+            print(f"Submitted group of {len(group)} products ({len(in_flight)} groups in flight)")
+        
+        while in_flight:
+            results.extend(collect_product_group(tracker, *in_flight.popleft()))
+        
+        stats = params_provider.stats()
+        print(f"Suggested params cache: {stats['hits']} hits, {stats['misses']} misses")
+    
+    return results
+
+# Save product data to products/<asset_id>.json
+def save_product(product_data):
+    # Create products directory if it doesn't exist
+    os.makedirs("products", exist_ok=True)
+    
+    path = f"products/{product_data['asset_id']}.json"
+    with open(path, "w") as f:
+        json.dump(product_data, f, indent=2)
+    return path
+
 # Main function
 def main():
     parser = argparse.ArgumentParser(description='Create a new product ASA')
-    parser.add_argument('--name', required=True, help='Product name')
-    parser.add_argument('--unit_name', required=True, help='Product unit name (max 8 chars)')
-    parser.add_argument('--quantity', required=True, type=int, help='Initial quantity')
-    parser.add_argument('--url', required=True, help='Product URL (IPFS or other)')
+    parser.add_argument('--name', help='Product name')
+    parser.add_argument('--unit_name', help='Product unit name (max 8 chars)')
+    parser.add_argument('--quantity', type=int, help='Initial quantity')
+    parser.add_argument('--url', help='Product URL (IPFS or other)')
     parser.add_argument('--metadata_hash', help='Base64-encoded metadata hash')
+    parser.add_argument('--manifest', help='CSV or JSONL product manifest for bulk creation')
+    parser.add_argument('--group_size', type=int, default=MAX_GROUP_SIZE,
+                        help=f'Products per atomic group in bulk mode (max {MAX_GROUP_SIZE})')
+    parser.add_argument('--max_in_flight', type=int, default=8,
+                        help='Maximum number of unconfirmed groups in bulk mode')
     
     args = parser.parse_args()
     
+    if not args.manifest and None in (args.name, args.unit_name, args.quantity, args.url):
+        parser.error("--name, --unit_name, --quantity and --url are required without --manifest")
+    
     # Load account
     try:
         with open("account.json", "r") as f:
@@ -91,6 +203,22 @@ def main():
         print("Error: account.json not found. Please run deploy.py first.")
         return
     
+    # Initialize Algod client
+    client = get_algod_client()
+    
+    if args.manifest:
+        products = load_manifest(args.manifest)
+        print(f"Creating ASAs for {len(products)} products from {args.manifest}...")
+        results = create_product_asas_bulk(
+            client,
+            private_key,
+            products,
+            group_size=args.group_size,
+            max_in_flight=args.max_in_flight
+        )
+        print(f"Created {len(results)} product ASAs, data saved to products/")
+        return
+    
     # Create product data
     product_data = {
         "name": args.name,
@@ -100,9 +228,6 @@ def main():
         "metadata_hash": args.metadata_hash
     }
     
-    # Initialize Algod client
-    client = get_algod_client()
-    
     # Create product ASA
     print(f"Creating ASA for product: {product_data['name']}...")
     asset_id = create_product_asa(client, private_key, product_data)
@@ -110,14 +235,9 @@ def main():
     
     # Save product data to a file
     product_data["asset_id"] = asset_id
+    path = save_product(product_data)
     
-    # Create products directory if it doesn't exist
-    os.makedirs("products", exist_ok=True)
-    
-    with open(f"products/{asset_id}.json", "w") as f:
-        json.dump(product_data, f, indent=2)
-    
-    print(f"Product data saved to products/{asset_id}.json")
+    print(f"Product data saved to {path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
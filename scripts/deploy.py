@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 
+import argparse
 import base64
 import os
 import json
+import threading
 import time
-from algosdk import account, mnemonic
+from concurrent.futures import ThreadPoolExecutor
+from algosdk import account, encoding, logic, mnemonic
 from algosdk.v2client import algod
 from algosdk.future import transaction
-from algosdk.future.transaction import ApplicationCreateTxn, StateSchema, OnComplete
+from algosdk.future.transaction import ApplicationCreateTxn, ApplicationNoOpTxn, PaymentTxn, StateSchema, OnComplete
 from pyteal import compileTeal, Mode
+from compile_cache import CompileCache
+from confirmation import AsyncConfirmationTracker, ConfirmationTracker, wait_for_confirmation
+from params_cache import get_suggested_params, get_suggested_params_async, unique_note
+from metrics import instrument_client
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
 
@@ -16,25 +23,95 @@ from inventory_contract import approval_program as inventory_approval, clear_sta
 from asset_manager import approval_program as asset_approval, clear_state_program as asset_clear
 from oracle_contract import approval_program as oracle_approval, clear_state_program as oracle_clear
 from security_contract import approval_program as security_approval, clear_state_program as security_clear
+from inventory_contract import METHODS as inventory_methods, PRODUCT_BOX_MIN_BALANCE
+from asset_manager import ASSET_MIN_BALANCE
+from oracle_contract import METHODS as oracle_methods
+from security_contract import ROLE_BOX_MIN_BALANCE
+from router import TEAL_VERSION, method_selector
 
 # Algorand node connection parameters
 algod_address = "http://localhost:4001"
 algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
+# Contracts in deployment order
+CONTRACTS = [
+    {
+        "name": "security",
+        "label": "security contract",
+        "app_id_key": "security_app_id",
+        "programs": (security_approval, security_clear),
+        "global_schema": StateSchema(num_uints=2, num_byte_slices=1),  # Roles are stored in boxes
+        "local_schema": StateSchema(num_uints=0, num_byte_slices=0)
+    },
+    {
+        "name": "inventory",
+        "label": "inventory contract",
+        "app_id_key": "inventory_app_id",
+        "programs": (inventory_approval, inventory_clear),
+        "global_schema": StateSchema(num_uints=4, num_byte_slices=2),  # Product count and running totals
+        "local_schema": StateSchema(num_uints=0, num_byte_slices=0)  # Products are stored in boxes
+    },
+    {
+        "name": "asset_manager",
+        "label": "asset manager contract",
+        "app_id_key": "asset_app_id",
+        "programs": (asset_approval, asset_clear),
+        "global_schema": StateSchema(num_uints=1, num_byte_slices=1),
+        "local_schema": StateSchema(num_uints=0, num_byte_slices=0)
+    },
+    {
+        "name": "oracle",
+        "label": "oracle contract",
+        "app_id_key": "oracle_app_id",
+        "programs": (oracle_approval, oracle_clear),
+        "global_schema": StateSchema(num_uints=4, num_byte_slices=1),
+        "local_schema": StateSchema(num_uints=0, num_byte_slices=0)
+    }
+]
+
+# Minimum balance of an application account
+APP_MIN_BALANCE = 100000
+
+# PyTeal's compiler keeps global counters, so TEAL is built one program at a
+# time even when compiling concurrently
+pyteal_lock = threading.Lock()
+
 # Initialize Algod client
 def get_algod_client():
-    return algod.AlgodClient(algod_token, algod_address)
+    return instrument_client(algod.AlgodClient(algod_token, algod_address))
 
-# Compile PyTeal to TEAL
-def compile_program(client, source_code):
-    teal = compileTeal(source_code, Mode.Application, version=6)
-    result = client.compile(teal)
+# Initialize asyncio Algod client (requires aiohttp)
+def get_async_algod_client(max_concurrency=64):
+    from async_algod import AsyncAlgodClient
+    return instrument_client(AsyncAlgodClient(algod_token, algod_address, max_concurrency=max_concurrency))
+
+# Compile a PyTeal program function to TEAL bytecode, reusing cached results
+# when a compile cache is given
+def compile_program(client, program, cache=None):
+    def build_teal():
+        with pyteal_lock:
+            source = program()
+            # Routed approval programs are assembled to TEAL source directly
+            if isinstance(source, str):
+                return source
+            return compileTeal(source, Mode.Application, version=TEAL_VERSION)
+    
+    if cache is None:
+        result = client.compile(build_teal())
+    else:
+        result = cache.compile(client, program, TEAL_VERSION, build_teal)
     return base64.b64decode(result["result"])
 
+# Compile several programs at once; the algod round-trips and cache lookups
+# overlap while the PyTeal builds are serialized
+def compile_programs_concurrently(client, programs, cache=None):
+    with ThreadPoolExecutor(max_workers=len(programs)) as executor:
+        return list(executor.map(lambda program: compile_program(client, program, cache), programs))
+
 # Create a new application
-def create_app(client, private_key, approval_program, clear_program, global_schema, local_schema, app_args):
+def create_app(client, private_key, approval_program, clear_program, global_schema, local_schema, app_args, params_provider=None):
     # Get suggested parameters
-    params = client.suggested_params()
+    params = get_suggested_params(client, params_provider)
     
     # Create unsigned transaction
     sender = account.address_from_private_key(private_key)
@@ -46,7 +123,8 @@ def create_app(client, private_key, approval_program, clear_program, global_sche
         clear_program=clear_program,
         global_schema=global_schema,
         local_schema=local_schema,
-        app_args=app_args
+        app_args=app_args,
+        note=unique_note()
     )
     
     # Sign transaction
@@ -56,28 +134,146 @@ def create_app(client, private_key, approval_program, clear_program, global_sche
     tx_id = client.send_transaction(signed_txn)
     
     # Wait for confirmation
-    wait_for_confirmation(client, tx_id)
+    txinfo = wait_for_confirmation(client, tx_id)
     
     # Get the application ID
-    transaction_response = client.pending_transaction_info(tx_id)
-    app_id = transaction_response["application-index"]
+    app_id = txinfo["application-index"]
     
     return app_id
 
-# Wait for a transaction to be confirmed
-def wait_for_confirmation(client, tx_id):
-    last_round = client.status().get("last-round")
-    txinfo = client.pending_transaction_info(tx_id)
-    while not (txinfo.get("confirmed-round") and txinfo.get("confirmed-round") > 0):
-        print("Waiting for confirmation...")
-        last_round += 1
-        client.status_after_block(last_round)
-        txinfo = client.pending_transaction_info(tx_id)
-    print(f"Transaction {tx_id} confirmed in round {txinfo.get('confirmed-round')}.")
-    return txinfo
+# Create several applications in one atomic group and return their app IDs
+# in order, taken from the group's confirmed results
+def create_apps_grouped(client, private_key, app_specs, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    
+    txns = [
+        ApplicationCreateTxn(
+            sender=sender,
+            sp=params,
+            on_complete=OnComplete.NoOpOC,
+            approval_program=approval_program,
+            clear_program=clear_program,
+            global_schema=global_schema,
+            local_schema=local_schema,
+            app_args=app_args,
+            note=unique_note()
+        )
+        for approval_program, clear_program, global_schema, local_schema, app_args in app_specs
+    ]
+    transaction.assign_group_id(txns)
+    signed_txns = [txn.sign(private_key) for txn in txns]
+    
+    client.send_transactions(signed_txns)
+    txinfos = ConfirmationTracker(client).wait([txn.get_txid() for txn in txns])
+    print(f"Group confirmed in round {txinfos[0]['confirmed-round']}.")
+    
+    return [txinfo["application-index"] for txinfo in txinfos]
+
+# Payment of amount microAlgos to an application account
+def fund_app_txn(sender, params, app_id, amount):
+    return PaymentTxn(sender, params, logic.get_application_address(app_id), amount, note=unique_note())
+
+# Fund an application account, e.g. to cover the minimum balance of its boxes
+def fund_app(client, private_key, app_id, amount, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    tx_id = client.send_transaction(fund_app_txn(sender, params, app_id, amount).sign(private_key))
+    return wait_for_confirmation(client, tx_id)
+
+# Calls registering the inventory app in the oracle and accepting the
+# oracle app's account as the inventory oracle, so the oracle's tick can
+# check products with inner calls
+def link_oracle_txns(sender, params, oracle_app_id, inventory_app_id):
+    return [
+        ApplicationNoOpTxn(sender, params, oracle_app_id, [
+            method_selector(oracle_methods, "register_inventory_app"),
+            inventory_app_id.to_bytes(8, "big")
+        ], note=unique_note()),
+        ApplicationNoOpTxn(sender, params, inventory_app_id, [
+            method_selector(inventory_methods, "set_oracle_address"),
+            encoding.decode_address(logic.get_application_address(oracle_app_id))
+        ], note=unique_note())
+    ]
+
+# Link the oracle and inventory apps; both calls are sent as one group
+def link_oracle(client, private_key, oracle_app_id, inventory_app_id, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    txns = link_oracle_txns(sender, params, oracle_app_id, inventory_app_id)
+    transaction.assign_group_id(txns)
+    client.send_transactions([txn.sign(private_key) for txn in txns])
+    return ConfirmationTracker(client).wait([txn.get_txid() for txn in txns])
+
+# Fund application accounts ((app ID, amount) pairs) and link the oracle and
+# inventory apps in one atomic group
+def fund_and_link_grouped(client, private_key, fundings, oracle_app_id, inventory_app_id, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    txns = [fund_app_txn(sender, params, app_id, amount) for app_id, amount in fundings]
+    txns += link_oracle_txns(sender, params, oracle_app_id, inventory_app_id)
+    transaction.assign_group_id(txns)
+    client.send_transactions([txn.sign(private_key) for txn in txns])
+    txinfos = ConfirmationTracker(client).wait([txn.get_txid() for txn in txns])
+    print(f"Group confirmed in round {txinfos[0]['confirmed-round']}.")
+    return txinfos
+
+# Create a new application through the asyncio client
+async def create_app_async(client, private_key, approval_program, clear_program, global_schema, local_schema, app_args, tracker=None, params_provider=None):
+    params = await get_suggested_params_async(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    
+    txn = ApplicationCreateTxn(
+        sender=sender,
+        sp=params,
+        on_complete=OnComplete.NoOpOC,
+        approval_program=approval_program,
+        clear_program=clear_program,
+        global_schema=global_schema,
+        local_schema=local_schema,
+        app_args=app_args,
+        note=unique_note()
+    )
+    signed_txn = txn.sign(private_key)
+    
+    # Track the transaction before sending it, so a shared tracker cannot
+    # scan its block first
+    if tracker is None:
+        tracker = AsyncConfirmationTracker(client)
+    tx_id = signed_txn.get_txid()
+    await tracker.add(tx_id)
+    await client.send_transaction(signed_txn)
+    txinfos = await tracker.wait([tx_id])
+    return txinfos[0]["application-index"]
 
 # Main deployment function
 def main():
+    parser = argparse.ArgumentParser(description='Deploy the inventory management contracts')
+    parser.add_argument('--no_cache', action='store_true', help='Always rebuild and recompile every program')
+    parser.add_argument('--cache_dir', default=".teal_cache", help='Directory of the TEAL compile cache')
+    parser.add_argument('--clear_cache', action='store_true', help='Remove all cached programs before deploying')
+    parser.add_argument('--prune_cache', type=float, metavar='DAYS',
+                        help='Remove cached programs unused for DAYS days and exit')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Compile all programs concurrently, create all apps in one atomic group and fund and link them in another')
+    parser.add_argument('--product_capacity', type=int, default=100,
+                        help='Number of product boxes to fund the inventory app account for')
+    parser.add_argument('--role_capacity', type=int, default=50,
+                        help='Number of role boxes to fund the security app account for')
+    parser.add_argument('--asset_capacity', type=int, default=10,
+                        help='Number of assets to fund the asset manager app account for')
+    
+    args = parser.parse_args()
+    
+    cache = None if args.no_cache else CompileCache(args.cache_dir)
+    if args.clear_cache:
+        CompileCache(args.cache_dir).clear()
+        print(f"Cleared compile cache in {args.cache_dir}")
+    if args.prune_cache is not None:
+        removed = CompileCache(args.cache_dir).prune(args.prune_cache)
+        print(f"Pruned {removed} cached entries from {args.cache_dir}")
+        return
+    
     # Generate or load account
     try:
         with open("account.json", "r") as f:
@@ -102,95 +298,82 @@ def main():
     client = get_algod_client()
     
     # Compile programs
-    inventory_approval_compiled = compile_program(client, inventory_approval())
-    inventory_clear_compiled = compile_program(client, inventory_clear())
-    
-    asset_approval_compiled = compile_program(client, asset_approval())
-    asset_clear_compiled = compile_program(client, asset_clear())
-    
-    oracle_approval_compiled = compile_program(client, oracle_approval())
-    oracle_clear_compiled = compile_program(client, oracle_clear())
-    
-    security_approval_compiled = compile_program(client, security_approval())
-    security_clear_compiled = compile_program(client, security_clear())
-    
-    # Define schemas
-    inventory_global_schema = StateSchema(num_uints=3, num_byte_slices=2)
-    inventory_local_schema = StateSchema(num_uints=5, num_byte_slices=3)
-    
-    asset_global_schema = StateSchema(num_uints=1, num_byte_slices=1)
-    asset_local_schema = StateSchema(num_uints=0, num_byte_slices=0)
-    
-    oracle_global_schema = StateSchema(num_uints=4, num_byte_slices=1)
-    oracle_local_schema = StateSchema(num_uints=0, num_byte_slices=0)
-    
-    security_global_schema = StateSchema(num_uints=2, num_byte_slices=50)  # Allow for up to 50 users with roles
-    security_local_schema = StateSchema(num_uints=0, num_byte_slices=0)
-    
-    # Deploy security contract first
-    print("Deploying security contract...")
-    security_app_args = [sender_address.encode()]
-    security_app_id = create_app(
-        client,
-        private_key,
-        security_approval_compiled,
-        security_clear_compiled,
-        security_global_schema,
-        security_local_schema,
-        security_app_args
-    )
-    print(f"Security contract deployed with app ID: {security_app_id}")
-    
-    # Deploy inventory contract
-    print("Deploying inventory contract...")
-    inventory_app_args = [sender_address.encode(), sender_address.encode()]  # Admin and oracle addresses
-    inventory_app_id = create_app(
-        client,
-        private_key,
-        inventory_approval_compiled,
-        inventory_clear_compiled,
-        inventory_global_schema,
-        inventory_local_schema,
-        inventory_app_args
-    )
-    print(f"Inventory contract deployed with app ID: {inventory_app_id}")
-    
-    # Deploy asset manager contract
-    print("Deploying asset manager contract...")
-    asset_app_args = [sender_address.encode()]
-    asset_app_id = create_app(
-        client,
-        private_key,
-        asset_approval_compiled,
-        asset_clear_compiled,
-        asset_global_schema,
-        asset_local_schema,
-        asset_app_args
-    )
-    print(f"Asset manager contract deployed with app ID: {asset_app_id}")
-    
-    # Deploy oracle contract
-    print("Deploying oracle contract...")
-    oracle_app_args = [sender_address.encode()]
-    oracle_app_id = create_app(
-        client,
-        private_key,
-        oracle_approval_compiled,
-        oracle_clear_compiled,
-        oracle_global_schema,
-        oracle_local_schema,
-        oracle_app_args
-    )
-    print(f"Oracle contract deployed with app ID: {oracle_app_id}")
+    compile_start = time.time()
+    if args.parallel:
+        compiled = compile_programs_concurrently(client, [program for contract in CONTRACTS for program in contract["programs"]], cache)
+    else:
+        compiled = [compile_program(client, program, cache) for contract in CONTRACTS for program in contract["programs"]]
+    print(f"Compiled {len(compiled)} programs in {time.time() - compile_start:.2f}s")
     
-    # Save app IDs to a file
-    app_ids = {
-        "security_app_id": security_app_id,
-        "inventory_app_id": inventory_app_id,
-        "asset_app_id": asset_app_id,
-        "oracle_app_id": oracle_app_id
+    if cache is not None:
+        print(f"Compile cache: {cache.hits} hits, {cache.misses} misses")
+    
+    # Admin (and inventory oracle) address passed to every contract at creation
+    admin_address = encoding.decode_address(sender_address)
+    app_args = {
+        "security": [admin_address],
+        "inventory": [admin_address, admin_address],  # Admin and oracle addresses
+        "asset_manager": [admin_address],
+        "oracle": [admin_address]
     }
     
+    app_specs = []
+    for i, contract in enumerate(CONTRACTS):
+        app_specs.append((
+            compiled[2 * i],
+            compiled[2 * i + 1],
+            contract["global_schema"],
+            contract["local_schema"],
+            app_args[contract["name"]]
+        ))
+    
+    if args.parallel:
+        # None of the creates depends on another's app ID, so all four go out
+        # in one atomic group and are confirmed in the same round
+        print("Deploying all contracts in one atomic group...")
+        deployed_ids = create_apps_grouped(client, private_key, app_specs)
+    else:
+        deployed_ids = []
+        for contract, app_spec in zip(CONTRACTS, app_specs):
+            print(f"Deploying {contract['label']}...")
+            deployed_ids.append(create_app(client, private_key, *app_spec))
+    
+    for contract, app_id in zip(CONTRACTS, deployed_ids):
+        print(f"{contract['label'].capitalize()} deployed with app ID: {app_id}")
+    
+    app_ids_by_name = {contract["name"]: app_id for contract, app_id in zip(CONTRACTS, deployed_ids)}
+    inventory_app_id = app_ids_by_name["inventory"]
+    oracle_app_id = app_ids_by_name["oracle"]
+    
+    # Product records are boxes, so the inventory app account must hold
+    # their minimum balance. Likewise every user's role is a box of the
+    # security app, and the asset manager creates and holds its assets
+    # through inner transactions.
+    fundings = [
+        ("inventory", inventory_app_id, APP_MIN_BALANCE + args.product_capacity * PRODUCT_BOX_MIN_BALANCE,
+         f"{args.product_capacity} products"),
+        ("security", app_ids_by_name["security"], APP_MIN_BALANCE + args.role_capacity * ROLE_BOX_MIN_BALANCE,
+         f"{args.role_capacity} users"),
+        ("asset manager", app_ids_by_name["asset_manager"], APP_MIN_BALANCE + args.asset_capacity * ASSET_MIN_BALANCE,
+         f"{args.asset_capacity} assets")
+    ]
+    for label, app_id, funding, capacity in fundings:
+        print(f"Funding {label} app account with {funding} microAlgos for {capacity}...")
+        if not args.parallel:
+            fund_app(client, private_key, app_id, funding)
+    
+    print(f"Linking oracle app {oracle_app_id} to inventory app {inventory_app_id}...")
+    if args.parallel:
+        # The payments and the link calls don't depend on each other, so
+        # they go out as one atomic group and are confirmed in one round
+        fund_and_link_grouped(client, private_key, [(app_id, funding) for _, app_id, funding, _ in fundings],
+                              oracle_app_id, inventory_app_id)
+    else:
+        link_oracle(client, private_key, oracle_app_id, inventory_app_id)
+    
+    # Save app IDs to a file
+    app_ids = {contract["app_id_key"]: app_id for contract, app_id in zip(CONTRACTS, deployed_ids)}
+    
     with open("app_ids.json", "w") as f:
         json.dump(app_ids, f)
     
@@ -0,0 +1,80 @@
+import base64
+import os
+import struct
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from events import EVENTS, event_selector, field_size
+
+# struct format of the fixed-width part of each event
+def field_format(field_type):
+    if field_type == "uint64":
+        return "Q"
+    return f"{field_size(field_type)}s"
+
+# Decoder of one event type. The fixed-width fields are unpacked with one
+# precompiled struct straight from the log buffer; a trailing uint64[] is
+# read through its ABI offset.
+class EventLayout:
+    def __init__(self, name, fields):
+        self.name = name
+        self.selector = event_selector(name)
+        self.names = [field_name for field_name, _ in fields]
+        self.types = [field_type for _, field_type in fields]
+        self.has_list = bool(fields) and fields[-1][1] == "uint64[]"
+        static_fields = fields[:-1] if self.has_list else fields
+        fmt = ">" + "".join(field_format(field_type) for _, field_type in static_fields)
+        if self.has_list:
+            fmt += "H"
+        self.struct = struct.Struct(fmt)
+        self.size = 4 + self.struct.size
+
+    # Field values in declaration order
+    def unpack(self, buffer):
+        if len(buffer) < self.size:
+            raise ValueError(f"{self.name} event is {len(buffer)} bytes, expected at least {self.size}")
+        values = self.struct.unpack_from(buffer, 4)
+        if not self.has_list:
+            return values
+        start = 4 + values[-1]
+        (length,) = struct.unpack_from(">H", buffer, start)
+        return values[:-1] + (struct.unpack_from(f">{length}Q", buffer, start + 2),)
+
+# Decodes contract logs into (event name, fields) by their 4-byte selector
+class EventDecoder:
+    def __init__(self, events=EVENTS):
+        self.layouts = {}
+        for name, fields in events.items():
+            layout = EventLayout(name, fields)
+            self.layouts[layout.selector] = layout
+
+    # Decode one raw log; returns None for logs that are not known events
+    def decode(self, log):
+        buffer = memoryview(log)
+        layout = self.layouts.get(bytes(buffer[:4]))
+        if layout is None:
+            return None
+        return layout.name, dict(zip(layout.names, layout.unpack(buffer)))
+
+    # Decode the base64 logs of a transaction info
+    def decode_txinfo(self, txinfo):
+        events = []
+        for log in txinfo.get("logs", []):
+            event = self.decode(base64.b64decode(log))
+            if event is not None:
+                events.append(event)
+        return events
+
+    # Decode many raw logs, yielding (name, values tuple) without building
+    # dicts; unknown logs are skipped
+    def iter_decode(self, logs):
+        layouts = self.layouts
+        for log in logs:
+            buffer = memoryview(log)
+            layout = layouts.get(bytes(buffer[:4]))
+            if layout is not None:
+                yield layout.name, layout.unpack(buffer)
+
+# Text fields are zero-padded to their fixed width
+def strip_padding(value):
+    return value.rstrip(b"\0")
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+# Block follower that indexes contract events into a local SQLite store.
+#
+# Blocks are streamed from algod (or replayed from a block file written with
+# --archive), application calls to the apps in app_ids.json are picked out,
+# including inner calls, and their logs are decoded with EventDecoder. Rows
+# are bulk-inserted together with the checkpoint round in one SQLite
+# transaction, so a restarted follower resumes after the last indexed round
+# without gaps or duplicates.
+
+import argparse
+import json
+import sqlite3
+import struct
+import sys
+import msgpack
+from algosdk import encoding
+from algosdk.v2client import algod
+from algosdk.error import AlgodHTTPError
+from event_decoder import EventDecoder, strip_padding
+from metrics import instrument_client
+
+# Algorand node connection parameters
+algod_address = "http://localhost:4001"
+algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+
+# Default location of the event store, relative to the working directory
+DEFAULT_DB_PATH = "events.db"
+
+# Number of blocks indexed per SQLite transaction while catching up
+DEFAULT_BATCH_BLOCKS = 500
+
+# Event fields used as the indexed subject of an event
+SUBJECT_FIELDS = ["product_id", "asset_id"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    round INTEGER NOT NULL,
+    txn_index INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    app_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    subject INTEGER,
+    fields TEXT NOT NULL,
+    PRIMARY KEY (round, txn_index, log_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_name ON events (name, round);
+CREATE INDEX IF NOT EXISTS events_by_app ON events (app_id, round);
+CREATE INDEX IF NOT EXISTS events_by_subject ON events (subject, round) WHERE subject IS NOT NULL;
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    round INTEGER NOT NULL
+);
+"""
+
+def get_algod_client():
+    return instrument_client(algod.AlgodClient(algod_token, algod_address))
+
+# JSON form of a decoded field: addresses in their base32 form, text fields
+# without their zero padding and other byte fields as hex
+def json_field(field_type, value):
+    if field_type == "address":
+        return encoding.encode_address(value)
+    if isinstance(value, bytes):
+        text = strip_padding(value)
+        try:
+            decoded = text.decode("utf-8")
+        except UnicodeDecodeError:
+            return value.hex()
+        return decoded if decoded.isprintable() else value.hex()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+# SQLite store of decoded events and the last indexed round
+class EventStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # Last indexed round, or None for an empty store
+    def checkpoint(self):
+        row = self.db.execute("SELECT round FROM checkpoint WHERE id = 0").fetchone()
+        return row[0] if row else None
+
+    # Insert event rows and advance the checkpoint atomically. Rows already
+    # present (a replayed round) are ignored.
+    def write(self, rows, last_round):
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute(
+                "INSERT INTO checkpoint (id, round) VALUES (0, ?) ON CONFLICT (id) DO UPDATE SET round = excluded.round",
+                (last_round,)
+            )
+
+    # Most recent events first, optionally filtered by name, app, subject
+    # (product or asset ID) and first round
+    def query(self, name=None, app_id=None, subject=None, min_round=None, limit=100):
+        conditions = []
+        params = []
+        for column, value in [("name", name), ("app_id", app_id), ("subject", subject)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_round is not None:
+            conditions.append("round >= ?")
+            params.append(min_round)
+        sql = "SELECT round, txn_index, log_index, timestamp, app_id, name, fields FROM events"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY round DESC, txn_index DESC, log_index DESC LIMIT ?"
+        params.append(limit)
+        return [
+            {
+                "round": row[0], "txn_index": row[1], "log_index": row[2], "timestamp": row[3],
+                "app_id": row[4], "name": row[5], "fields": json.loads(row[6])
+            }
+            for row in self.db.execute(sql, params)
+        ]
+
+# Yields (application ID, log) for every call to a watched app in a block
+# transaction and its inner transactions, outer logs first
+def app_call_logs(stxn, app_ids):
+    txn = stxn.get(b"txn", {})
+    eval_delta = stxn.get(b"dt", {})
+    if txn.get(b"type") == b"appl":
+        # Application creations carry the new ID in the apply data
+        app_id = txn.get(b"apid") or stxn.get(b"apid", 0)
+        if app_id in app_ids:
+            for log in eval_delta.get(b"lg", []):
+                yield app_id, log
+    for inner in eval_delta.get(b"itx", []):
+        yield from app_call_logs(inner, app_ids)
+
+# Turns blocks into event rows for the watched apps
+class EventIndexer:
+    def __init__(self, app_ids, decoder=None):
+        self.app_ids = set(app_ids)
+        self.decoder = decoder or EventDecoder()
+        self.skipped_logs = 0
+
+    # Event rows of a decoded block (msgpack with raw keys)
+    def block_rows(self, block):
+        round_num = block.get(b"rnd", 0)
+        timestamp = block.get(b"ts", 0)
+        layouts = self.decoder.layouts
+        rows = []
+        for txn_index, stxn in enumerate(block.get(b"txns", [])):
+            for log_index, (app_id, log) in enumerate(app_call_logs(stxn, self.app_ids)):
+                layout = layouts.get(log[:4])
+                if layout is None:
+                    continue
+                try:
+                    values = layout.unpack(memoryview(log))
+                except (ValueError, struct.error):
+                    self.skipped_logs += 1
+                    continue
+                fields = {
+                    field_name: json_field(field_type, value)
+                    for field_name, field_type, value in zip(layout.names, layout.types, values)
+                }
+                subject = next((fields[field] for field in SUBJECT_FIELDS if field in fields), None)
+                rows.append((
+                    round_num, txn_index, log_index, timestamp, app_id, layout.name, subject,
+                    json.dumps(fields, separators=(",", ":"))
+                ))
+        return rows
+
+    # Index a stream of blocks into the store. Rows are written every
+    # batch_blocks blocks and whenever the source yields None to signal that
+    # it caught up with the chain.
+    def run(self, store, blocks, batch_blocks=DEFAULT_BATCH_BLOCKS, on_write=None):
+        rows = []
+        pending = 0
+        last_round = None
+        for block in blocks:
+            if block is not None:
+                rows += self.block_rows(block)
+                last_round = block.get(b"rnd", 0)
+                pending += 1
+            if pending and (block is None or pending >= batch_blocks):
+                store.write(rows, last_round)
+                if on_write:
+                    on_write(last_round, len(rows))
+                rows = []
+                pending = 0
+        if pending:
+            store.write(rows, last_round)
+            if on_write:
+                on_write(last_round, len(rows))
+
+def unpack_block(raw):
+    return msgpack.unpackb(raw, raw=True, strict_map_key=False)[b"block"]
+
+# Stream blocks from algod starting at start_round. Raw blocks are appended
+# to archive when given, producing a file that block_file_source replays.
+# Yields None each time it reaches the latest round; with follow=False it
+# stops there instead of waiting for new blocks.
+def algod_source(client, start_round, follow=True, archive=None):
+    next_round = start_round
+    last_round = client.status().get("last-round")
+    while True:
+        while next_round <= last_round:
+            raw = client.block_info(next_round, response_format="msgpack")
+            if archive is not None:
+                archive.write(raw)
+            yield unpack_block(raw)
+            next_round += 1
+        if archive is not None:
+            archive.flush()
+        yield None
+        if not follow:
+            return
+        last_round = client.status_after_block(last_round).get("last-round")
+
+# Replay blocks from a file of concatenated msgpack block responses,
+# skipping rounds before start_round
+def block_file_source(path, start_round=0):
+    unpacker = msgpack.Unpacker(raw=True, strict_map_key=False)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            unpacker.feed(chunk)
+            for response in unpacker:
+                block = response[b"block"]
+                if block.get(b"rnd", 0) >= start_round:
+                    yield block
+
+def load_app_ids(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='Index contract events from algod blocks into SQLite')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Path of the SQLite event store')
+    parser.add_argument('--app_ids', default='app_ids.json', help='Path of the deployed app IDs')
+    parser.add_argument('--start_round', type=int, default=1,
+                        help='First round to index when the store has no checkpoint')
+    parser.add_argument('--replay', metavar='FILE', help='Index blocks from a block file instead of algod')
+    parser.add_argument('--archive', metavar='FILE', help='Append the raw blocks fetched from algod to a block file')
+    parser.add_argument('--once', action='store_true', help='Stop at the latest round instead of following the chain')
+    parser.add_argument('--batch_blocks', type=int, default=DEFAULT_BATCH_BLOCKS,
+                        help='Blocks indexed per SQLite transaction while catching up')
+    parser.add_argument('--query', nargs='?', const='', metavar='EVENT',
+                        help='Print the latest indexed events (optionally of one event type) and exit')
+    parser.add_argument('--subject', type=int, help='Product or asset ID to filter --query by')
+    parser.add_argument('--limit', type=int, default=20, help='Number of events printed by --query')
+
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.query is not None:
+        for event in reversed(store.query(name=args.query or None, subject=args.subject, limit=args.limit)):
+            fields = " ".join(f"{name}={value}" for name, value in event["fields"].items())
+            print(f"round {event['round']} app {event['app_id']} {event['name']} {fields}")
+        store.close()
+        return
+
+    try:
+        app_ids = load_app_ids(args.app_ids)
+    except (OSError, ValueError):
+        print(f"Error: {args.app_ids} not found. Please run deploy.py first.")
+        return
+    indexer = EventIndexer(app_ids.values())
+
+    checkpoint = store.checkpoint()
+    start_round = args.start_round if checkpoint is None else checkpoint + 1
+    print(f"Indexing events of apps {', '.join(map(str, app_ids.values()))} from round {start_round}")
+
+    def report(last_round, count):
+        print(f"Indexed through round {last_round} ({count} events)")
+        sys.stdout.flush()
+
+    archive = open(args.archive, "ab") if args.archive else None
+    try:
+        if args.replay:
+            blocks = block_file_source(args.replay, start_round)
+        else:
+            blocks = algod_source(get_algod_client(), start_round, follow=not args.once, archive=archive)
+        indexer.run(store, blocks, args.batch_blocks, on_write=report)
+    except KeyboardInterrupt:
+        pass
+    except AlgodHTTPError as e:
+        print(f"Error: {e}")
+    finally:
+        if archive is not None:
+            archive.close()
+        store.close()
+    if indexer.skipped_logs:
+        print(f"Skipped {indexer.skipped_logs} malformed event logs")
+
+if __name__ == "__main__":
+    main()
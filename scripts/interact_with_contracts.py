@@ -1,65 +1,365 @@
 #!/usr/bin/env python3
 
 import base64
+import copy
 import os
 import json
 import time
 import argparse
-from algosdk import account, mnemonic
+import asyncio
+from algosdk import account, encoding, mnemonic
 from algosdk.v2client import algod
 from algosdk.future import transaction
 from algosdk.future.transaction import ApplicationNoOpTxn
+from event_decoder import EventDecoder, strip_padding
+from confirmation import AsyncConfirmationTracker, ConfirmationTracker, wait_for_confirmation
+from params_cache import AsyncSuggestedParamsProvider, get_suggested_params, get_suggested_params_async, unique_note
+from metrics import STAGE_SECONDS, add_metrics_arguments, exporting_metrics, instrument_client
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from inventory_contract import METHODS as inventory_methods, pack_quantity_updates, product_box_name
+from asset_manager import METHODS as asset_methods, MAX_BATCH_RECORDS, pack_asset_freezes, pack_asset_transfers
+from oracle_contract import METHODS as oracle_methods
+from security_contract import METHODS as security_methods, pack_role_updates, role_box_name
+from router import method_selector
+from role_cache import RoleCheckError, open_role_cache
 
 # Algorand node connection parameters
 algod_address = "http://localhost:4001"
 algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
-# Initialize Algod client
+# Maximum number of transactions in an atomic group
+MAX_GROUP_SIZE = 16
+
+# Box references one application call can carry
+MAX_BOX_REFS = 8
+
+# Accounts one application call can reference, and references of all kinds
+# (accounts, assets, apps and boxes) it can carry
+MAX_ACCOUNT_REFS = 4
+MAX_REFS = 8
+
+# Method lists of each contract, used to encode one-byte method selectors
+CONTRACT_METHODS = {
+    "inventory": inventory_methods,
+    "asset": asset_methods,
+    "oracle": oracle_methods,
+    "security": security_methods
+}
+
+# Initialize Algod client, with every request counted and timed in metrics
 def get_algod_client():
-    return algod.AlgodClient(algod_token, algod_address)
-
-# Wait for a transaction to be confirmed
-def wait_for_confirmation(client, tx_id):
-    last_round = client.status().get("last-round")
-    txinfo = client.pending_transaction_info(tx_id)
-    while not (txinfo.get("confirmed-round") and txinfo.get("confirmed-round") > 0):
-        print("Waiting for confirmation...")
-        last_round += 1
-        client.status_after_block(last_round)
-        txinfo = client.pending_transaction_info(tx_id)
-    print(f"Transaction {tx_id} confirmed in round {txinfo.get('confirmed-round')}.")
-    return txinfo
+    return instrument_client(algod.AlgodClient(algod_token, algod_address))
 
-# Call application
-def call_app(client, private_key, app_id, app_args, accounts=None, foreign_apps=None, foreign_assets=None):
+# Initialize asyncio Algod client (requires aiohttp)
+def get_async_algod_client(max_concurrency=64):
+    from async_algod import AsyncAlgodClient
+    return instrument_client(AsyncAlgodClient(algod_token, algod_address, max_concurrency=max_concurrency))
+
+# Call application. A call issuing inner transactions pays their fees too.
+def call_app(client, private_key, app_id, app_args, accounts=None, foreign_apps=None, foreign_assets=None, boxes=None, params_provider=None, inner_txns=0):
     # Get suggested parameters
-    params = client.suggested_params()
+    with STAGE_SECONDS.time(operation="call_app", stage="params"):
+        params = get_suggested_params(client, params_provider)
+    if inner_txns:
+        params.flat_fee = True
+        params.fee = (1 + inner_txns) * params.min_fee
     
     # Get sender address
     sender = account.address_from_private_key(private_key)
     
     # Create unsigned application call transaction
-    txn = ApplicationNoOpTxn(
-        sender=sender,
-        sp=params,
-        index=app_id,
-        app_args=app_args,
-        accounts=accounts,
-        foreign_apps=foreign_apps,
-        foreign_assets=foreign_assets
-    )
+    with STAGE_SECONDS.time(operation="call_app", stage="construct"):
+        txn = ApplicationNoOpTxn(
+            sender=sender,
+            sp=params,
+            index=app_id,
+            app_args=app_args,
+            accounts=accounts,
+            foreign_apps=foreign_apps,
+            foreign_assets=foreign_assets,
+            boxes=boxes,
+            note=unique_note()
+        )
     
     # Sign transaction
-    signed_txn = txn.sign(private_key)
+    with STAGE_SECONDS.time(operation="call_app", stage="sign"):
+        signed_txn = txn.sign(private_key)
     
     # Submit transaction
-    tx_id = client.send_transaction(signed_txn)
+    with STAGE_SECONDS.time(operation="call_app", stage="submit"):
+        tx_id = client.send_transaction(signed_txn)
     
     # Wait for confirmation
-    txinfo = wait_for_confirmation(client, tx_id)
+    with STAGE_SECONDS.time(operation="call_app", stage="confirm"):
+        txinfo = wait_for_confirmation(client, tx_id)
     
     return txinfo
 
+# Call application through the asyncio client. Pass a shared tracker when
+# driving many calls concurrently so they are confirmed from the same blocks.
+async def call_app_async(client, private_key, app_id, app_args, accounts=None, foreign_apps=None, foreign_assets=None, boxes=None, tracker=None, params_provider=None):
+    with STAGE_SECONDS.time(operation="call_app", stage="params"):
+        params = await get_suggested_params_async(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    
+    with STAGE_SECONDS.time(operation="call_app", stage="construct"):
+        txn = ApplicationNoOpTxn(
+            sender=sender,
+            sp=params,
+            index=app_id,
+            app_args=app_args,
+            accounts=accounts,
+            foreign_apps=foreign_apps,
+            foreign_assets=foreign_assets,
+            boxes=boxes,
+            note=unique_note()
+        )
+    with STAGE_SECONDS.time(operation="call_app", stage="sign"):
+        signed_txn = txn.sign(private_key)
+    
+    # Track the transaction before sending it, so a shared tracker cannot
+    # scan its block first
+    if tracker is None:
+        tracker = AsyncConfirmationTracker(client)
+    tx_id = signed_txn.get_txid()
+    await tracker.add(tx_id)
+    with STAGE_SECONDS.time(operation="call_app", stage="submit"):
+        await client.send_transaction(signed_txn)
+    with STAGE_SECONDS.time(operation="call_app", stage="confirm"):
+        txinfos = await tracker.wait([tx_id])
+    return txinfos[0]
+
+# Call application once per entry of app_args_list, all concurrently, sharing
+# one confirmation tracker and one suggested params cache
+async def call_app_many_async(client, private_key, app_id, app_args_list, **kwargs):
+    tracker = AsyncConfirmationTracker(client)
+    async with AsyncSuggestedParamsProvider(client) as params_provider:
+        return await asyncio.gather(*(
+            call_app_async(client, private_key, app_id, app_args, tracker=tracker, params_provider=params_provider, **kwargs)
+            for app_args in app_args_list
+        ))
+
+# Build the application calls of a batch_update_quantity run, split into
+# atomic groups. Every call carries the records of the products whose boxes
+# it references, so a group of 16 calls updates up to 128 products with the
+# opcode budget of all 16 pooled.
+def build_batch_update_groups(sender, params, app_id, updates, records_per_call=MAX_BOX_REFS, group_size=MAX_GROUP_SIZE):
+    if not 1 <= records_per_call <= MAX_BOX_REFS:
+        raise ValueError(f"records_per_call must be between 1 and {MAX_BOX_REFS}")
+    if not 1 <= group_size <= MAX_GROUP_SIZE:
+        raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+    
+    selector = method_selector(inventory_methods, "batch_update_quantity")
+    txns = []
+    for i in range(0, len(updates), records_per_call):
+        chunk = updates[i:i + records_per_call]
+        txns.append(ApplicationNoOpTxn(
+            sender=sender,
+            sp=params,
+            index=app_id,
+            app_args=[selector, pack_quantity_updates(chunk)],
+            boxes=[(app_id, product_box_name(product_id)) for product_id, _ in chunk],
+            note=unique_note()
+        ))
+    return group_transactions(txns, group_size)
+
+# Split transactions into atomic groups of group_size and assign group IDs
+def group_transactions(txns, group_size=MAX_GROUP_SIZE):
+    groups = [txns[i:i + group_size] for i in range(0, len(txns), group_size)]
+    for group in groups:
+        if len(group) > 1:
+            transaction.assign_group_id(group)
+    return groups
+
+# Update the quantities of many products with batched calls; returns the IDs
+# of the products reported below their reorder threshold
+def batch_update_quantities(client, private_key, app_id, updates, records_per_call=MAX_BOX_REFS, group_size=MAX_GROUP_SIZE, params_provider=None):
+    with STAGE_SECONDS.time(operation="batch_update", stage="params"):
+        params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    with STAGE_SECONDS.time(operation="batch_update", stage="construct"):
+        groups = build_batch_update_groups(sender, params, app_id, updates, records_per_call, group_size)
+    
+    tracker = ConfirmationTracker(client)
+    tx_ids = []
+    for group in groups:
+        with STAGE_SECONDS.time(operation="batch_update", stage="sign"):
+            signed = [txn.sign(private_key) for txn in group]
+        with STAGE_SECONDS.time(operation="batch_update", stage="submit"):
+            client.send_transactions(signed)
+        tx_ids += [txn.get_txid() for txn in group]
+    
+    decoder = EventDecoder()
+    low_stock = []
+    with STAGE_SECONDS.time(operation="batch_update", stage="confirm"):
+        txinfos = tracker.wait(tx_ids)
+    for txinfo in txinfos:
+        for name, fields in decoder.decode_txinfo(txinfo):
+            if name == "ReorderNeededBatch":
+                low_stock += fields["product_ids"]
+    print(f"Updated {len(updates)} products in {len(tx_ids)} calls across {len(groups)} groups.")
+    return low_stock
+
+# Build the calls of a batch_transfer_asset or batch_freeze_asset run for
+# (asset_id, address, value) records, split into atomic groups. Records are
+# taken in order; a call carries as many as its account and asset references
+# allow, and pays the fees of its inner transactions.
+def build_asset_batch_groups(sender, params, app_id, method, records, group_size=MAX_GROUP_SIZE):
+    if method not in ("batch_transfer_asset", "batch_freeze_asset"):
+        raise ValueError(f"{method} is not an asset batch method")
+    if not 1 <= group_size <= MAX_GROUP_SIZE:
+        raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+    
+    pack = pack_asset_transfers if method == "batch_transfer_asset" else pack_asset_freezes
+    selector = method_selector(asset_methods, method)
+    
+    def call(chunk, accounts, assets):
+        call_params = copy.copy(params)
+        call_params.flat_fee = True
+        call_params.fee = (1 + len(chunk)) * params.min_fee
+        return ApplicationNoOpTxn(
+            sender=sender,
+            sp=call_params,
+            index=app_id,
+            app_args=[selector, pack(chunk)],
+            accounts=accounts,
+            foreign_assets=assets,
+            note=unique_note()
+        )
+    
+    txns = []
+    chunk, accounts, assets = [], [], []
+    for record in records:
+        asset_id, address, _ = record
+        account_refs = len(accounts) + (address not in accounts)
+        asset_refs = len(assets) + (asset_id not in assets)
+        if chunk and (
+            len(chunk) == MAX_BATCH_RECORDS
+            or account_refs > MAX_ACCOUNT_REFS
+            or account_refs + asset_refs > MAX_REFS
+        ):
+            txns.append(call(chunk, accounts, assets))
+            chunk, accounts, assets = [], [], []
+        chunk.append(record)
+        if address not in accounts:
+            accounts.append(address)
+        if asset_id not in assets:
+            assets.append(asset_id)
+    if chunk:
+        txns.append(call(chunk, accounts, assets))
+    return group_transactions(txns, group_size)
+
+# Transfer (asset_id, receiver, amount) or freeze (asset_id, target, frozen)
+# records with batched calls; receivers must be opted in to the assets
+def batch_asset_operations(client, private_key, app_id, method, records, group_size=MAX_GROUP_SIZE, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    groups = build_asset_batch_groups(sender, params, app_id, method, records, group_size)
+    
+    tracker = ConfirmationTracker(client)
+    tx_ids = []
+    for group in groups:
+        client.send_transactions([txn.sign(private_key) for txn in group])
+        tx_ids += [txn.get_txid() for txn in group]
+    tracker.wait(tx_ids)
+    print(f"Ran {len(records)} asset operations in {len(tx_ids)} calls across {len(groups)} groups.")
+
+def batch_transfer_assets(client, private_key, app_id, transfers, group_size=MAX_GROUP_SIZE, params_provider=None):
+    batch_asset_operations(client, private_key, app_id, "batch_transfer_asset", transfers, group_size, params_provider)
+
+def batch_freeze_assets(client, private_key, app_id, freezes, group_size=MAX_GROUP_SIZE, params_provider=None):
+    batch_asset_operations(client, private_key, app_id, "batch_freeze_asset", freezes, group_size, params_provider)
+
+# Build the set_roles calls for (address, role) pairs, split into atomic
+# groups. Each call references the role boxes of its records. A sender other
+# than the creator admin is checked through its own role box, so with
+# reference_sender every call also references that box and carries one
+# record less.
+def build_set_roles_groups(sender, params, app_id, updates, records_per_call=MAX_BOX_REFS, group_size=MAX_GROUP_SIZE, reference_sender=False):
+    max_records = MAX_BOX_REFS - 1 if reference_sender else MAX_BOX_REFS
+    records_per_call = min(records_per_call, max_records)
+    if not 1 <= records_per_call:
+        raise ValueError(f"records_per_call must be between 1 and {max_records}")
+    if not 1 <= group_size <= MAX_GROUP_SIZE:
+        raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+    
+    selector = method_selector(security_methods, "set_roles")
+    txns = []
+    for i in range(0, len(updates), records_per_call):
+        chunk = updates[i:i + records_per_call]
+        txns.append(ApplicationNoOpTxn(
+            sender=sender,
+            sp=params,
+            index=app_id,
+            app_args=[selector, pack_role_updates(chunk)],
+            boxes=[(app_id, role_box_name(address)) for address, _ in chunk]
+                  + ([(app_id, role_box_name(sender))] if reference_sender else []),
+            note=unique_note()
+        ))
+    return group_transactions(txns, group_size)
+
+# Set the roles of many users with batched set_roles calls (role 0 removes
+# a user)
+def set_roles(client, private_key, app_id, updates, records_per_call=MAX_BOX_REFS, group_size=MAX_GROUP_SIZE, params_provider=None, reference_sender=False):
+    params = get_suggested_params(client, params_provider)
+    sender = account.address_from_private_key(private_key)
+    groups = build_set_roles_groups(sender, params, app_id, updates, records_per_call, group_size, reference_sender)
+    
+    tracker = ConfirmationTracker(client)
+    tx_ids = []
+    for group in groups:
+        client.send_transactions([txn.sign(private_key) for txn in group])
+        tx_ids += [txn.get_txid() for txn in group]
+    tracker.wait(tx_ids)
+    print(f"Set {len(updates)} roles in {len(tx_ids)} calls across {len(groups)} groups.")
+
+# Run the oracle's check cycle in one call, checking the given products with
+# inner check_inventory calls to the inventory app. The call references the
+# inventory app and the product boxes and pays the fee of the inner calls.
+def tick(client, private_key, oracle_app_id, inventory_app_id, product_ids=(), params_provider=None):
+    if len(product_ids) > MAX_BOX_REFS:
+        raise ValueError(f"tick checks at most {MAX_BOX_REFS} products per call")
+    params = get_suggested_params(client, params_provider)
+    params.flat_fee = True
+    params.fee = (1 + len(product_ids)) * params.min_fee
+    app_args = [method_selector(oracle_methods, "tick")]
+    if product_ids:
+        app_args.append(b"".join(product_id.to_bytes(8, "big") for product_id in product_ids))
+    
+    sender = account.address_from_private_key(private_key)
+    txn = ApplicationNoOpTxn(
+        sender=sender,
+        sp=params,
+        index=oracle_app_id,
+        app_args=app_args,
+        foreign_apps=[inventory_app_id],
+        boxes=[(inventory_app_id, product_box_name(product_id)) for product_id in product_ids],
+        note=unique_note()
+    )
+    tx_id = client.send_transaction(txn.sign(private_key))
+    return wait_for_confirmation(client, tx_id)
+
+def print_events(logs, decoder, indent="  "):
+    for log in logs:
+        event = decoder.decode(base64.b64decode(log))
+        if event is None:
+            print(f"{indent}(unknown log) {log}")
+            continue
+        name, fields = event
+        print(f"{indent}{name} " + " ".join(f"{field}={format_field(value)}" for field, value in fields.items()))
+
+# Readable form of a decoded event field
+def format_field(value):
+    if isinstance(value, bytes):
+        if len(value) == 32 and strip_padding(value) == value:
+            return encoding.encode_address(value)
+        return strip_padding(value).decode('utf-8', errors='replace')
+    if isinstance(value, tuple):
+        return "[" + ", ".join(map(str, value)) + "]"
+    return str(value)
+
 # Main function
 def main():
     parser = argparse.ArgumentParser(description='Interact with inventory management contracts')
@@ -67,9 +367,14 @@ def main():
                         help='Contract to interact with')
     parser.add_argument('--action', required=True, help='Action to perform')
     parser.add_argument('--args', nargs='*', help='Arguments for the action')
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
-    
+    with exporting_metrics(args):
+        run(args)
+
+# Perform the action given on the command line
+def run(args):
     # Load account
     try:
         with open("account.json", "r") as f:
@@ -105,26 +410,121 @@ def main():
         print(f"Error: Unknown contract {args.contract}")
         return
     
-    # Prepare app args
-    app_args = [args.action.encode()]
+    # Prepare app args, encoding known methods as their one-byte selector
+    if args.action in CONTRACT_METHODS[args.contract]:
+        app_args = [method_selector(CONTRACT_METHODS[args.contract], args.action)]
+    else:
+        app_args = [args.action.encode()]
     if args.args:
         for arg in args.args:
-            # Try to convert to int, otherwise treat as string
+            # Try to convert to int, then to an address, otherwise treat as string
             try:
                 app_args.append(int(arg).to_bytes(8, byteorder='big'))
             except ValueError:
-                app_args.append(arg.encode())
+                if encoding.is_valid_address(arg):
+                    app_args.append(encoding.decode_address(arg))
+                else:
+                    app_args.append(arg.encode())
+    
+    # Batched updates take product_id quantity pairs and are split into groups
+    if args.contract == 'inventory' and args.action == 'batch_update_quantity':
+        values = [int(arg) for arg in args.args or []]
+        if not values or len(values) % 2:
+            print("Error: batch_update_quantity takes pairs of product_id quantity")
+            return
+        low_stock = batch_update_quantities(client, private_key, app_id, list(zip(values[::2], values[1::2])))
+        if low_stock:
+            print(f"Products below reorder threshold: {', '.join(map(str, low_stock))}")
+        print("Transaction successful!")
+        return
+    
+    # A tick runs the oracle's whole check cycle, checking the given products
+    # in the inventory app with inner calls
+    if args.contract == 'oracle' and args.action == 'tick':
+        product_ids = [int(arg) for arg in args.args or []]
+        print(f"Running oracle tick for {len(product_ids)} products...")
+        txinfo = tick(client, private_key, app_id, app_ids["inventory_app_id"], product_ids)
+        decoder = EventDecoder()
+        print("Transaction events:")
+        print_events(txinfo.get("logs", []), decoder)
+        for inner in txinfo.get("inner-txns", []):
+            print_events(inner.get("logs", []), decoder)
+        print("Transaction successful!")
+        return
+    
+    # Batched asset operations take asset_id address value triples and are
+    # split into calls and groups by their references
+    if args.contract == 'asset' and args.action in ('batch_transfer_asset', 'batch_freeze_asset'):
+        values = args.args or []
+        if not values or len(values) % 3 or not all(encoding.is_valid_address(address) for address in values[1::3]):
+            print(f"Error: {args.action} takes triples of asset_id address value")
+            return
+        records = [(int(asset_id), address, int(value)) for asset_id, address, value in zip(values[::3], values[1::3], values[2::3])]
+        batch_asset_operations(client, private_key, app_id, args.action, records)
+        print("Transaction successful!")
+        return
+    
+    # Check the sender's role against the cached security roles first, so
+    # calls the contract would reject are not sent
+    is_admin = True
+    if args.contract == 'security':
+        role_cache = open_role_cache(client, app_id)
+        try:
+            role_cache.require(sender_address, args.action)
+        except RoleCheckError as e:
+            print(f"Error: {e}")
+            return
+        is_admin = sender_address == role_cache.admin
+    
+    # Roles are set in bulk from address role pairs
+    if args.contract == 'security' and args.action == 'set_roles':
+        values = args.args or []
+        if not values or len(values) % 2 or not all(encoding.is_valid_address(address) for address in values[::2]):
+            print("Error: set_roles takes pairs of address role")
+            return
+        updates = [(address, int(role)) for address, role in zip(values[::2], values[1::2])]
+        set_roles(client, private_key, app_id, updates, reference_sender=not is_admin)
+        print("Transaction successful!")
+        return
+    
+    # Inventory methods read and write the box of the product given as
+    # their first argument, and user methods the role box of the address
+    boxes = None
+    if args.contract == 'inventory' and args.action in inventory_methods and args.args:
+        boxes = [(app_id, product_box_name(int(args.args[0])))]
+    if args.contract == 'security' and args.action in ('add_user', 'remove_user', 'change_role') and args.args:
+        boxes = [(app_id, role_box_name(args.args[0]))]
+    if not is_admin:
+        boxes = (boxes or []) + [(app_id, role_box_name(sender_address))]
+    
+    # The valuation reads the inventory app's running totals
+    foreign_apps = None
+    if args.contract == 'oracle' and args.action == 'update_valuation':
+        foreign_apps = [app_ids["inventory_app_id"]]
+    
+    # Asset methods run one inner transaction on the asset given as their
+    # first argument, and transfers and freezes on the account given next
+    foreign_assets = None
+    accounts = None
+    inner_txns = 0
+    if args.contract == 'asset' and args.action in asset_methods:
+        inner_txns = 1
+        if args.action != 'create_asset' and args.args:
+            foreign_assets = [int(args.args[0])]
+        if args.action in ('transfer_asset', 'freeze_asset') and len(args.args or []) > 1:
+            accounts = [args.args[1]]
     
     # Call the application
     print(f"Calling {args.contract} contract with action {args.action}...")
-    txinfo = call_app(client, private_key, app_id, app_args)
+    txinfo = call_app(
+        client, private_key, app_id, app_args, accounts=accounts, foreign_apps=foreign_apps,
+        foreign_assets=foreign_assets, boxes=boxes, inner_txns=inner_txns
+    )
     
-    # Check for logs in the transaction info
+    # Check for events in the transaction logs
     if "logs" in txinfo and txinfo["logs"]:
-        print("Transaction logs:")
-        for log in txinfo["logs"]:
-            decoded_log = base64.b64decode(log).decode('utf-8', errors='replace')
-            print(f"  {decoded_log}")
+        print("Transaction events:")
+        print_events(txinfo["logs"], EventDecoder())
     
     print("Transaction successful!")
 
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+# Client-side materialized view of the inventory contract's product boxes.
+#
+# The view is loaded with one scan of the app's boxes and then kept current
+# from confirmed blocks: the boxes referenced by calls to the inventory app
+# in a block are the only ones that can have changed, so just those are
+# re-read. Sorted indexes on the quantity/threshold ratio and on expiration
+# answer low-stock and expiring-soon queries with a bisect instead of a
+# check_inventory transaction per product.
+
+import argparse
+import base64
+import bisect
+import itertools
+import json
+import os
+import sys
+import time
+from event_indexer import algod_source, get_algod_client
+from state_reader import DEFAULT_READ_CONCURRENCY, StateReader
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from inventory_contract import PRODUCT_RECORD_SIZE, decode_product_record
+
+# Width of the expiring-soon window printed by default
+DEFAULT_EXPIRY_WINDOW = 7 * 24 * 3600
+
+# Sort key of the low-stock index; products without a threshold sort last
+def stock_ratio(record):
+    if not record["min_threshold"]:
+        return float("inf")
+    return record["quantity"] / record["min_threshold"]
+
+def product_id_of(box_name):
+    return int.from_bytes(box_name, "big")
+
+# Product record of raw box contents, or None when the box no longer exists
+def product_from_box(value):
+    if value is None or len(value) != PRODUCT_RECORD_SIZE:
+        return None
+    return decode_product_record(value)
+
+# Names of the boxes of app_id referenced by an application call in a block
+# and by its inner calls
+def referenced_boxes(stxn, app_id):
+    names = set()
+    txn = stxn.get(b"txn", {})
+    if txn.get(b"type") == b"appl":
+        called = txn.get(b"apid", 0)
+        foreign_apps = txn.get(b"apfa", [])
+        for ref in txn.get(b"apbx", []):
+            index = ref.get(b"i", 0)
+            ref_app = called if index == 0 else foreign_apps[index - 1]
+            if ref_app == app_id:
+                names.add(ref.get(b"n", b""))
+    for inner in stxn.get(b"dt", {}).get(b"itx", []):
+        names |= referenced_boxes(inner, app_id)
+    return names
+
+# Product records keyed by product ID with sorted (key, product ID) indexes
+class InventoryView:
+    def __init__(self):
+        self.records = {}
+        self.ratio_index = []
+        self.expiration_index = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, product_id):
+        return self.records.get(product_id)
+
+    # Insert or replace a product record and move its index entries
+    def upsert(self, product_id, record):
+        old = self.records.get(product_id)
+        if old is not None:
+            if old == record:
+                return
+            self.unindex(product_id, old)
+        self.records[product_id] = record
+        bisect.insort(self.ratio_index, (stock_ratio(record), product_id))
+        bisect.insort(self.expiration_index, (record["expiration"], product_id))
+
+    # Replace the whole view, building the indexes with one sort each
+    def load(self, records):
+        self.records = dict(records)
+        self.ratio_index = sorted((stock_ratio(record), product_id) for product_id, record in self.records.items())
+        self.expiration_index = sorted((record["expiration"], product_id) for product_id, record in self.records.items())
+
+    def remove(self, product_id):
+        old = self.records.pop(product_id, None)
+        if old is not None:
+            self.unindex(product_id, old)
+
+    def unindex(self, product_id, record):
+        for index, key in [(self.ratio_index, stock_ratio(record)), (self.expiration_index, record["expiration"])]:
+            del index[bisect.bisect_left(index, (key, product_id))]
+
+    # Products below their reorder threshold, lowest stock ratio first
+    def low_stock(self, limit=None):
+        end = bisect.bisect_right(self.ratio_index, (1.0, float("inf")))
+        results = []
+        for _, product_id in itertools.islice(self.ratio_index, end):
+            record = self.records[product_id]
+            # The float ratio only narrows the candidates; the comparison
+            # itself is exact
+            if record["quantity"] < record["min_threshold"]:
+                results.append((product_id, record))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    # Products expiring by the given timestamp, soonest first; an
+    # expiration of 0 means the product does not expire
+    def expiring(self, before, limit=None):
+        start = bisect.bisect_left(self.expiration_index, (1,))
+        end = bisect.bisect_right(self.expiration_index, (before, float("inf")))
+        if limit is not None:
+            end = min(end, start + limit)
+        return [(product_id, self.records[product_id]) for _, product_id in self.expiration_index[start:end]]
+
+# Keeps an InventoryView in sync with the inventory app through algod
+class InventoryViewSync:
+    def __init__(self, client, app_id, view=None, concurrency=DEFAULT_READ_CONCURRENCY):
+        self.client = client
+        self.app_id = app_id
+        self.view = view or InventoryView()
+        self.last_round = None
+        self.box_reads = 0
+        # Box reads go through an uncached reader, which issues the reads of
+        # a load concurrently
+        self.reader = StateReader(client, cache_seconds=0, concurrency=concurrency)
+
+    # Read one product record, or None when its box no longer exists
+    def read_box(self, name):
+        self.box_reads += 1
+        return product_from_box(self.reader.box(self.app_id, name))
+
+    def refresh_box(self, name):
+        record = self.read_box(name)
+        if record is None:
+            self.view.remove(product_id_of(name))
+        else:
+            self.view.upsert(product_id_of(name), record)
+
+    # Load every product box. The round is taken before the scan so changes
+    # made during it are picked up again by follow().
+    def load(self):
+        self.last_round = self.client.status().get("last-round")
+        names = [base64.b64decode(box["name"]) for box in self.client.application_boxes(self.app_id).get("boxes", [])]
+        self.box_reads += len(names)
+        records = {}
+        for name, value in self.reader.boxes(self.app_id, names).items():
+            record = product_from_box(value)
+            if record is not None:
+                records[product_id_of(name)] = record
+        self.view.load(records)
+
+    # Apply confirmed blocks after the loaded round. Boxes touched in a run
+    # of blocks are re-read once, when the follower reaches the latest
+    # round; on_update is then called with the changed product IDs.
+    def follow(self, follow=True, on_update=None):
+        touched = set()
+        for block in algod_source(self.client, self.last_round + 1, follow=follow):
+            if block is not None:
+                for stxn in block.get(b"txns", []):
+                    touched |= referenced_boxes(stxn, self.app_id)
+                self.last_round = block.get(b"rnd", 0)
+                continue
+            for name in touched:
+                self.refresh_box(name)
+            if touched and on_update:
+                on_update(sorted(product_id_of(name) for name in touched))
+            touched = set()
+
+def product_json(product_id, record):
+    return dict(
+        record,
+        product_id=product_id,
+        location=record["location"].decode("utf-8", errors="replace"),
+        supplier=record["supplier"].decode("utf-8", errors="replace")
+    )
+
+def print_products(title, products):
+    print(f"{title} ({len(products)}):")
+    for product_id, record in products:
+        print(f"  product {product_id}: quantity {record['quantity']}, threshold {record['min_threshold']}, "
+              f"expiration {record['expiration']}, location {record['location'].decode('utf-8', errors='replace')}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialized view of inventory records with low-stock and expiry queries')
+    parser.add_argument('--app_ids', default='app_ids.json', help='Path of the deployed app IDs')
+    parser.add_argument('--expiring_within', type=int, default=DEFAULT_EXPIRY_WINDOW,
+                        help='Seconds ahead to look for expiring products')
+    parser.add_argument('--limit', type=int, help='Maximum number of products per query')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep the view updated from new blocks and print queries after each change')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.app_ids, "r") as f:
+            app_id = json.load(f)["inventory_app_id"]
+    except (OSError, ValueError, KeyError):
+        print(f"Error: {args.app_ids} not found. Please run deploy.py first.")
+        return
+
+    sync = InventoryViewSync(get_algod_client(), app_id)
+    start = time.perf_counter()
+    sync.load()
+    print(f"Loaded {len(sync.view)} products at round {sync.last_round} in {time.perf_counter() - start:.2f}s")
+
+    def report(changed=None):
+        if changed:
+            print(f"Round {sync.last_round}: updated products {', '.join(map(str, changed))}")
+        start = time.perf_counter()
+        low_stock = sync.view.low_stock(args.limit)
+        expiring = sync.view.expiring(int(time.time()) + args.expiring_within, args.limit)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        if args.json:
+            print(json.dumps({
+                "round": sync.last_round,
+                "low_stock": [product_json(*product) for product in low_stock],
+                "expiring": [product_json(*product) for product in expiring]
+            }, indent=2))
+        else:
+            print_products("Below reorder threshold", low_stock)
+            print_products(f"Expiring within {args.expiring_within}s", expiring)
+            print(f"Queries took {elapsed_us:.0f}us")
+        sys.stdout.flush()
+
+    report()
+    if args.follow:
+        try:
+            sync.follow(on_update=report)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
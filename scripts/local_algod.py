@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+
+# Local stand-in for algod backed by the in-process evaluator in avm.py.
+#
+# LocalAlgodClient exposes the parts of AlgodClient the scripts use, so it can
+# be passed anywhere a client is expected. Like a node in DevMode it commits a
+# block for every submitted transaction group. Program "compilation" returns
+# the TEAL source itself, which the evaluator runs directly, so results must
+# not be mixed with a compile cache shared with a real node (deploy with
+# --no_cache or a separate --cache_dir). Run this file to serve the same
+# ledger over HTTP on the port the scripts connect to.
+
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import msgpack
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+
+from avm import AVMError, Ledger, TYPE_NAMES, itob
+
+# Genesis of the local network
+GENESIS_ID = "local-v1"
+GENESIS_HASH = bytes(32)
+
+# Validity window of suggested params
+MAX_TXN_LIFE = 1000
+
+# Longest status_after_block waits before returning the current status, like algod
+STATUS_WAIT_TIMEOUT = 60
+
+# Signed transaction fields (msgpack keys) mapped to TEAL transaction fields
+TXN_FIELDS = {
+    "snd": "Sender", "fee": "Fee", "fv": "FirstValid", "lv": "LastValid", "note": "Note",
+    "lx": "Lease", "rekey": "RekeyTo", "grp": "GroupID",
+    "rcv": "Receiver", "amt": "Amount", "close": "CloseRemainderTo",
+    "caid": "ConfigAsset",
+    "xaid": "XferAsset", "aamt": "AssetAmount", "asnd": "AssetSender", "arcv": "AssetReceiver",
+    "aclose": "AssetCloseTo",
+    "faid": "FreezeAsset", "fadd": "FreezeAssetAccount", "afrz": "FreezeAssetFrozen",
+    "apid": "ApplicationID", "apan": "OnCompletion", "apap": "ApprovalProgram",
+    "apsu": "ClearStateProgram", "apaa": "ApplicationArgs", "apat": "Accounts",
+    "apfa": "Applications", "apas": "Assets", "apep": "ExtraProgramPages"
+}
+
+ASSET_PARAM_FIELDS = {
+    "t": "ConfigAssetTotal", "dc": "ConfigAssetDecimals", "df": "ConfigAssetDefaultFrozen",
+    "un": "ConfigAssetUnitName", "an": "ConfigAssetName", "au": "ConfigAssetURL",
+    "am": "ConfigAssetMetadataHash", "m": "ConfigAssetManager", "r": "ConfigAssetReserve",
+    "f": "ConfigAssetFreeze", "c": "ConfigAssetClawback"
+}
+
+SCHEMA_FIELDS = {
+    "apgs": ("GlobalNumUint", "GlobalNumByteSlice"),
+    "apls": ("LocalNumUint", "LocalNumByteSlice")
+}
+
+TYPE_ENUMS = {name.decode(): enum for enum, name in TYPE_NAMES.items()}
+
+def as_teal_value(value):
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+# Convert a decoded msgpack transaction into a TEAL field dict
+def teal_txn(txn):
+    fields = {"TypeEnum": TYPE_ENUMS[txn["type"]]}
+    for key, value in txn.items():
+        if key in TXN_FIELDS:
+            if isinstance(value, list):
+                value = [as_teal_value(item) for item in value]
+            fields[TXN_FIELDS[key]] = as_teal_value(value)
+        elif key == "apar":
+            for param_key, param_value in value.items():
+                fields[ASSET_PARAM_FIELDS[param_key]] = as_teal_value(param_value)
+        elif key in SCHEMA_FIELDS:
+            uint_field, byte_slice_field = SCHEMA_FIELDS[key]
+            fields[uint_field] = value.get("nui", 0)
+            fields[byte_slice_field] = value.get("nbs", 0)
+        elif key == "apbx":
+            fields["Boxes"] = [(box.get("i", 0), box.get("n", b"")) for box in value]
+    return fields
+
+# Convert a TEAL field dict back into a msgpack transaction, dropping zero values
+def msgpack_txn(fields):
+    txn = {"type": TYPE_NAMES[fields["TypeEnum"]].decode()}
+    for key, field in TXN_FIELDS.items():
+        if fields.get(field):
+            txn[key] = fields[field]
+    asset_params = {key: fields[field] for key, field in ASSET_PARAM_FIELDS.items() if fields.get(field)}
+    if asset_params:
+        txn["apar"] = asset_params
+    return dict(sorted(txn.items()))
+
+# Apply data of an applied transaction in block encoding
+def apply_data(fields):
+    stxn = {}
+    if fields.get("CreatedAssetID"):
+        stxn["caid"] = fields["CreatedAssetID"]
+    if fields.get("CreatedApplicationID"):
+        stxn["apid"] = fields["CreatedApplicationID"]
+    eval_delta = {}
+    if fields.get("Logs"):
+        eval_delta["lg"] = fields["Logs"]
+    if fields.get("InnerTxns"):
+        eval_delta["itx"] = [dict(apply_data(inner), txn=msgpack_txn(inner)) for inner in fields["InnerTxns"]]
+    if eval_delta:
+        stxn["dt"] = eval_delta
+    return stxn
+
+# pending_transaction_info-style record of an applied transaction
+def txn_info(fields, confirmed_round):
+    txinfo = {"confirmed-round": confirmed_round, "pool-error": ""}
+    if fields.get("CreatedAssetID"):
+        txinfo["asset-index"] = fields["CreatedAssetID"]
+    if fields.get("CreatedApplicationID"):
+        txinfo["application-index"] = fields["CreatedApplicationID"]
+    if fields.get("Logs"):
+        txinfo["logs"] = [base64.b64encode(log).decode() for log in fields["Logs"]]
+    if fields.get("InnerTxns"):
+        txinfo["inner-txns"] = [txn_info(inner, confirmed_round) for inner in fields["InnerTxns"]]
+    return txinfo
+
+def transaction_id(txn):
+    return base64.b32encode(encoding.checksum(b"TX" + msgpack.packb(txn, use_bin_type=True))).decode().rstrip("=")
+
+# Split concatenated msgpack-encoded signed transactions
+def decode_signed_txns(raw):
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(raw)
+    return list(unpacker)
+
+def teal_value(value):
+    if isinstance(value, bytes):
+        return {"type": 1, "bytes": base64.b64encode(value).decode(), "uint": 0}
+    return {"type": 2, "bytes": "", "uint": value}
+
+def teal_key_value(state):
+    return [{"key": base64.b64encode(key).decode(), "value": teal_value(value)} for key, value in state.items()]
+
+# In-process algod stand-in running in DevMode
+class LocalAlgodClient:
+    def __init__(self, ledger=None, clock=time.time):
+        self.clock = clock
+        self.ledger = ledger or Ledger(timestamp=int(clock()))
+        self.blocks = [{"rnd": 0, "ts": self.ledger.timestamp, "txns": []}]
+        self.txids_by_round = [[]]
+        self.confirmed = {}
+        self.round_times = [time.time()]
+        self.condition = threading.Condition()
+
+    # Credit an account with microAlgos outside of any transaction
+    def fund(self, address, amount):
+        with self.condition:
+            if isinstance(address, str):
+                address = encoding.decode_address(address)
+            account = self.ledger.account(address)
+            account.amount += amount
+            self.ledger.journal = []
+
+    def status(self, **kwargs):
+        with self.condition:
+            return {
+                "last-round": self.ledger.round,
+                "last-version": "future",
+                "time-since-last-round": int((time.time() - self.round_times[-1]) * 1e9),
+                "catchup-time": 0
+            }
+
+    def status_after_block(self, block_num=None, round_num=None, **kwargs):
+        round_num = block_num if block_num is not None else round_num
+        with self.condition:
+            self.condition.wait_for(lambda: self.ledger.round > round_num, timeout=STATUS_WAIT_TIMEOUT)
+        return self.status()
+
+    def suggested_params(self, **kwargs):
+        with self.condition:
+            first = self.ledger.round
+        return transaction.SuggestedParams(
+            0,
+            first,
+            first + MAX_TXN_LIFE,
+            base64.b64encode(GENESIS_HASH).decode(),
+            GENESIS_ID,
+            min_fee=1000
+        )
+
+    # Evaluate a group of signed transactions and commit it as a new block
+    def submit(self, raw):
+        stxns = decode_signed_txns(raw)
+        if not stxns:
+            raise AlgodHTTPError("empty transaction group", 400)
+        tx_ids = [transaction_id(stxn["txn"]) for stxn in stxns]
+        group = [teal_txn(stxn["txn"]) for stxn in stxns]
+        for tx_id, fields in zip(tx_ids, group):
+            fields["TxID"] = base64.b32decode(tx_id + "====")
+
+        with self.condition:
+            try:
+                applied = self.ledger.apply_group(group)
+            except (AVMError, KeyError, IndexError, TypeError) as e:
+                raise AlgodHTTPError(f"TransactionPool.Remember: transaction {tx_ids[0]}: logic eval error: {e}", 400)
+
+            round_num = self.ledger.round + 1
+            timestamp = max(int(self.clock()), self.ledger.timestamp)
+            block_txns = []
+            for tx_id, stxn, fields in zip(tx_ids, stxns, applied):
+                block_txn = dict(stxn, **apply_data(fields))
+                block_txns.append(block_txn)
+                self.confirmed[tx_id] = txn_info(fields, round_num)
+            self.blocks.append({"rnd": round_num, "ts": timestamp, "txns": block_txns})
+            self.txids_by_round.append(tx_ids)
+            self.round_times.append(time.time())
+            self.ledger.round = round_num
+            self.ledger.timestamp = timestamp
+            self.condition.notify_all()
+        return tx_ids[0]
+
+    # Evaluate the transaction groups of a msgpack simulate request against
+    # the current state without committing them. Signatures are not checked.
+    def simulate(self, raw):
+        request = msgpack.unpackb(raw, raw=False, strict_map_key=False)
+        response = {"version": 2, "last-round": self.ledger.round, "txn-groups": []}
+        with self.condition:
+            for txn_group in request.get("txn-groups", []):
+                stxns = txn_group.get("txns", [])
+                group = [teal_txn(stxn["txn"]) for stxn in stxns]
+                result = {"txn-results": []}
+                try:
+                    applied = self.ledger.simulate_group(group)
+                except (AVMError, KeyError, IndexError, TypeError) as e:
+                    result["failure-message"] = f"logic eval error: {e}"
+                    # The failing transaction is the last one that started evaluating
+                    result["failed-at"] = [max(sum(1 for fields in group if "GroupIndex" in fields) - 1, 0)]
+                    applied = []
+                for stxn, fields in zip(stxns, applied):
+                    txinfo = txn_info(fields, 0)
+                    del txinfo["confirmed-round"]
+                    result["txn-results"].append({"txn-result": dict(txinfo, txn=stxn)})
+                response["txn-groups"].append(result)
+        return response
+
+    def send_raw_transaction(self, txn, **kwargs):
+        return self.submit(base64.b64decode(txn))
+
+    def send_transaction(self, txn, **kwargs):
+        return self.send_raw_transaction(encoding.msgpack_encode(txn))
+
+    def send_transactions(self, txns, **kwargs):
+        return self.submit(b"".join(base64.b64decode(encoding.msgpack_encode(txn)) for txn in txns))
+
+    def pending_transaction_info(self, transaction_id, response_format="json", **kwargs):
+        txinfo = self.confirmed.get(transaction_id)
+        if txinfo is None:
+            raise AlgodHTTPError("txn does not exist", 404)
+        return txinfo
+
+    def block_info(self, block=None, response_format="json", round_num=None, **kwargs):
+        round_num = block if block is not None else round_num
+        if not 0 <= round_num < len(self.blocks):
+            raise AlgodHTTPError(f"failed to retrieve information from the ledger: round {round_num}", 404)
+        response = {"block": self.blocks[round_num]}
+        if response_format == "msgpack":
+            return msgpack.packb(response, use_bin_type=True)
+        return response
+
+    def block_txids(self, round_num):
+        return {"blockTxids": list(self.txids_by_round[round_num])}
+
+    # Return the TEAL source as the "bytecode"; the evaluator runs it as is
+    def compile(self, source, source_map=False, **kwargs):
+        program = source.encode()
+        return {
+            "hash": encoding.encode_address(encoding.checksum(b"Program" + program)),
+            "result": base64.b64encode(program).decode()
+        }
+
+    def application_info(self, application_id, **kwargs):
+        app = self.ledger.apps.get(application_id)
+        if app is None:
+            raise AlgodHTTPError("application does not exist", 404)
+        return {
+            "id": application_id,
+            "params": {
+                "creator": encoding.encode_address(app.creator),
+                "approval-program": base64.b64encode(app.approval.source.encode()).decode(),
+                "clear-state-program": base64.b64encode(app.clear.source.encode()).decode(),
+                "global-state": teal_key_value(app.global_state),
+                "global-state-schema": {"num-uint": app.global_schema[0], "num-byte-slice": app.global_schema[1]},
+                "local-state-schema": {"num-uint": app.local_schema[0], "num-byte-slice": app.local_schema[1]}
+            }
+        }
+
+    def application_boxes(self, application_id, limit=0, **kwargs):
+        names = sorted(self.application(application_id).boxes)
+        if limit:
+            names = names[:limit]
+        return {"boxes": [{"name": base64.b64encode(name).decode()} for name in names]}
+
+    def application_box_by_name(self, application_id, box_name, **kwargs):
+        value = self.application(application_id).boxes.get(box_name)
+        if value is None:
+            raise AlgodHTTPError("box not found", 404)
+        return {
+            "name": base64.b64encode(box_name).decode(),
+            "round": self.ledger.round,
+            "value": base64.b64encode(value).decode()
+        }
+
+    def application(self, application_id):
+        app = self.ledger.apps.get(application_id)
+        if app is None:
+            raise AlgodHTTPError("application does not exist", 404)
+        return app
+
+    def account_info(self, address, exclude=None, **kwargs):
+        account = self.ledger.accounts.get(encoding.decode_address(address))
+        info = {"address": address, "amount": 0, "assets": [], "apps-local-state": [], "round": self.ledger.round}
+        if account is not None:
+            info["amount"] = account.amount
+            info["assets"] = [
+                {"asset-id": asset_id, "amount": holding["amount"], "is-frozen": holding["frozen"]}
+                for asset_id, holding in sorted(account.holdings.items())
+            ]
+            info["apps-local-state"] = [
+                {"id": app_id, "key-value": teal_key_value(state)}
+                for app_id, state in sorted(account.local_state.items())
+            ]
+        return info
+
+    def asset_info(self, asset_id, **kwargs):
+        params = self.ledger.assets.get(asset_id)
+        if params is None:
+            raise AlgodHTTPError("asset does not exist", 404)
+        info = {
+            "total": params["total"],
+            "decimals": params["decimals"],
+            "default-frozen": bool(params["default_frozen"]),
+            "unit-name": params["unit_name"].decode(errors="replace"),
+            "name": params["name"].decode(errors="replace"),
+            "url": params["url"].decode(errors="replace")
+        }
+        if params["metadata_hash"]:
+            info["metadata-hash"] = base64.b64encode(params["metadata_hash"]).decode()
+        for field in ("creator", "manager", "reserve", "freeze", "clawback"):
+            if params[field] != bytes(32):
+                info[field] = encoding.encode_address(params[field])
+        return {"index": asset_id, "params": info}
+
+    # Route an algod REST path (without the /v2 prefix) to the client methods
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json"):
+        path = requrl.split("?")[0].rstrip("/")
+        params = params or {}
+        for pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, f"{method.upper()} {path}")
+            if match:
+                return handler(self, *match.groups(), params=params, data=data, response_format=response_format)
+        raise AlgodHTTPError(f"unsupported endpoint {method} {requrl}", 404)
+
+def box_name_param(value):
+    encoding_name, _, name = value.partition(":")
+    if encoding_name == "b64":
+        return base64.b64decode(name)
+    if encoding_name == "str":
+        return name.encode()
+    if encoding_name == "int":
+        return itob(int(name))
+    raise AlgodHTTPError(f"unsupported box name encoding {encoding_name}", 400)
+
+# REST endpoints served by LocalAlgodClient.algod_request
+ROUTES = [
+    (r"GET /status", lambda c, **kw: c.status()),
+    (r"GET /status/wait-for-block-after/(\d+)", lambda c, r, **kw: c.status_after_block(int(r))),
+    (r"GET /transactions/params", lambda c, **kw: suggested_params_json(c)),
+    (r"POST /transactions", lambda c, data, **kw: {"txId": c.submit(data)}),
+    (r"POST /transactions/simulate", lambda c, data, **kw: c.simulate(data)),
+    (r"GET /transactions/pending/(\w+)", lambda c, tx_id, **kw: c.pending_transaction_info(tx_id)),
+    (r"GET /blocks/(\d+)/txids", lambda c, r, **kw: c.block_txids(int(r))),
+    (r"GET /blocks/(\d+)", lambda c, r, response_format, **kw: c.block_info(int(r), response_format=response_format)),
+    (r"POST /teal/compile", lambda c, data, **kw: c.compile(data.decode() if isinstance(data, bytes) else data)),
+    (r"GET /applications/(\d+)", lambda c, app_id, **kw: c.application_info(int(app_id))),
+    (r"GET /applications/(\d+)/boxes", lambda c, app_id, params, **kw: c.application_boxes(int(app_id), int(params.get("max", 0)))),
+    (r"GET /applications/(\d+)/box",
+     lambda c, app_id, params, **kw: c.application_box_by_name(int(app_id), box_name_param(params["name"]))),
+    (r"GET /accounts/(\w+)", lambda c, address, **kw: c.account_info(address)),
+    (r"GET /assets/(\d+)", lambda c, asset_id, **kw: c.asset_info(int(asset_id)))
+]
+
+def suggested_params_json(client):
+    params = client.suggested_params()
+    return {
+        "fee": params.fee,
+        "min-fee": params.min_fee,
+        "last-round": params.first,
+        "genesis-hash": params.gh,
+        "genesis-id": params.gen,
+        "consensus-version": "future"
+    }
+
+# JSON responses carry raw bytes (e.g. in blocks) base64-encoded, like algod
+def json_bytes(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# HTTP front end exposing a LocalAlgodClient under /v2
+def make_handler(client, token):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self, status, body, content_type="application/json"):
+            if content_type == "application/json":
+                body = json.dumps(body, default=json_bytes).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_request(self, method):
+            if token and self.headers.get("X-Algo-API-Token") != token:
+                return self.respond(401, {"message": "Invalid API Token"})
+            url = urlparse(self.path)
+            if not url.path.startswith("/v2/"):
+                return self.respond(404, {"message": "not found"})
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            response_format = params.pop("format", "json")
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length) if length else None
+            try:
+                result = client.algod_request(method, url.path[3:], params, data, response_format=response_format)
+            except AlgodHTTPError as e:
+                return self.respond(e.code or 500, {"message": str(e)})
+            if isinstance(result, bytes):
+                return self.respond(200, result, "application/msgpack")
+            self.respond(200, result)
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+    return Handler
+
+# HTTP server of the stand-in. The listen backlog is raised from
+# socketserver's 5 so concurrent readers (state_reader, role_cache,
+# inventory_view) don't have connections dropped and retried a second later.
+class StandInHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+def serve(client, host="localhost", port=4001, token=None):
+    server = StandInHTTPServer((host, port), make_handler(client, token))
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve an in-process algod stand-in for local testing')
+    parser.add_argument('--host', default="localhost", help='Address to listen on')
+    parser.add_argument('--port', type=int, default=4001, help='Port to listen on')
+    parser.add_argument('--token', help='Require this X-Algo-API-Token header')
+    parser.add_argument('--fund', action='append', default=[], metavar='ADDRESS',
+                        help='Fund an account with 10,000 Algos at genesis (repeatable)')
+
+    args = parser.parse_args()
+
+    client = LocalAlgodClient()
+    for address in args.fund:
+        client.fund(address, 10_000_000_000)
+
+    server = serve(client, args.host, args.port, args.token)
+    print(f"Local algod listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
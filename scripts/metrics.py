@@ -0,0 +1,277 @@
+# Process-wide metrics of the scripts, exported in the Prometheus text
+# format or OpenMetrics.
+#
+# Counters, gauges and histograms are kept in a registry (REGISTRY unless
+# given another) and keyed by their label values. instrument_client wraps an
+# algod client so every request is counted and timed by method and
+# endpoint; the scripts time their pipeline stages with STAGE_SECONDS,
+# labelled by operation and stage, and record confirmation rounds and
+# retries where they happen. Metrics are served from a local HTTP endpoint
+# (serve_metrics, for long-running scripts) or written to a file
+# (write_metrics, e.g. for node_exporter's textfile collector at the end of
+# a one-shot script).
+
+import asyncio
+import contextlib
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from algosdk.error import AlgodHTTPError
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Histogram buckets of durations in seconds, rounds and retry counts
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROUND_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100, 1000)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+# Path segments holding IDs (rounds, app/asset IDs, transaction IDs,
+# addresses), replaced in endpoint labels to keep their number bounded
+ID_SEGMENT = re.compile(r"\d+|[A-Z2-7]{52}|[A-Z2-7]{58}")
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help = help_text
+        self.lock = lock
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    # Exposition lines of the metric; counters are named with a _total
+    # suffix, which OpenMetrics leaves out of the metric family name
+    def render(self, openmetrics=False):
+        family = self.name if openmetrics or self.kind != "counter" else self.name + "_total"
+        lines = [f"# HELP {family} {self.help}", f"# TYPE {family} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines += self.samples(labels, value)
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self, labels, value):
+        return [f"{self.name}_total{format_labels(labels)} {format_value(value)}"]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def samples(self, labels, value):
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, lock, buckets=SECONDS_BUCKETS):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    # Values are [count per bucket..., sum, count]
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    # Context manager observing the seconds spent in its block
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            bucket_labels = labels + (("le", "+Inf" if bound == float("inf") else repr(float(bound))),)
+            lines.append(f"{self.name}_bucket{format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(value[-2])}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {value[-1]}")
+        return lines
+
+# Named metrics of a process; asking for an existing name returns it
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, cls, name, help_text, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, threading.Lock(), **kwargs)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self.register(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        return self.register(Histogram, name, help_text, buckets=buckets)
+
+    def render(self, openmetrics=False):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = [line for metric in metrics for line in metric.render(openmetrics)]
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+ALGOD_REQUESTS = REGISTRY.counter("algod_requests", "Algod requests by method, endpoint and status")
+ALGOD_REQUEST_SECONDS = REGISTRY.histogram("algod_request_seconds", "Algod request latency by method and endpoint")
+STAGE_SECONDS = REGISTRY.histogram("pipeline_stage_seconds", "Time spent in each transaction pipeline stage, by operation")
+CONFIRMATION_ROUNDS = REGISTRY.histogram(
+    "confirmation_rounds", "Rounds from tracking a transaction to seeing it confirmed", ROUND_BUCKETS
+)
+RETRIES = REGISTRY.histogram("retries", "Retries before an operation succeeded", RETRY_BUCKETS)
+
+# Endpoint of an algod request path with its IDs replaced by placeholders
+def endpoint_label(requrl):
+    path = requrl.split("?", 1)[0]
+    return "/".join(":id" if ID_SEGMENT.fullmatch(segment) else segment for segment in path.split("/"))
+
+def observe_request(method, requrl, status, seconds):
+    endpoint = endpoint_label(requrl)
+    ALGOD_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+    ALGOD_REQUEST_SECONDS.observe(seconds, method=method, endpoint=endpoint)
+
+def request_status(error):
+    if isinstance(error, AlgodHTTPError) and error.code:
+        return str(error.code)
+    return "error"
+
+# Count and time every request of an AlgodClient or AsyncAlgodClient. The
+# clients' methods all go through algod_request, which is replaced on the
+# instance.
+def instrument_client(client):
+    request = client.algod_request
+    if getattr(request, "instrumented", False):
+        return client
+
+    if asyncio.iscoroutinefunction(request):
+        async def algod_request(method, requrl, *args, **kwargs):
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                return await request(method, requrl, *args, **kwargs)
+            except Exception as e:
+                status = request_status(e)
+                raise
+            finally:
+                observe_request(method, requrl, status, time.perf_counter() - start)
+    else:
+        def algod_request(method, requrl, *args, **kwargs):
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                return request(method, requrl, *args, **kwargs)
+            except Exception as e:
+                status = request_status(e)
+                raise
+            finally:
+                observe_request(method, requrl, status, time.perf_counter() - start)
+
+    algod_request.instrumented = True
+    client.algod_request = algod_request
+    return client
+
+# Write the metrics to path, replacing it atomically so a collector never
+# reads a partial file
+def write_metrics(path, openmetrics=False, registry=REGISTRY):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(registry.render(openmetrics))
+    os.replace(temp_path, path)
+
+def make_handler(registry):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            body = registry.render(openmetrics).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Serve the metrics at http://host:port/metrics from a background thread,
+# in OpenMetrics when the scraper asks for it; returns the server
+def serve_metrics(port, host="localhost", registry=REGISTRY):
+    server = ThreadingHTTPServer((host, port), make_handler(registry))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics_port', type=int, help='Serve metrics at http://localhost:PORT/metrics')
+    parser.add_argument('--metrics_file', help='Write metrics to this file when done')
+    parser.add_argument('--openmetrics', action='store_true',
+                        help='Write the metrics file in OpenMetrics instead of the Prometheus text format')
+
+# Export metrics as the --metrics_* arguments ask while the block runs
+@contextlib.contextmanager
+def exporting_metrics(args):
+    server = serve_metrics(args.metrics_port) if args.metrics_port else None
+    try:
+        yield
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if args.metrics_file:
+            write_metrics(args.metrics_file, args.openmetrics)
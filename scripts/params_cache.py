@@ -0,0 +1,194 @@
+import asyncio
+import copy
+import os
+import threading
+
+# Longest validity window the protocol accepts for a transaction
+MAX_VALID_ROUNDS = 1000
+
+# Bytes of random nonce in the note of every transaction built from
+# suggested params
+NONCE_SIZE = 8
+
+# Holds the most recent SuggestedParams together with the latest known round.
+# Cached params stay usable while the current round is comfortably inside
+# their first/last window, which is stretched to the protocol maximum so one
+# fetch serves a whole burst of transactions.
+class ParamsCache:
+    def __init__(self, refresh_rounds=10, valid_rounds=MAX_VALID_ROUNDS, expiry_margin=10):
+        self.refresh_rounds = refresh_rounds
+        self.valid_rounds = valid_rounds
+        self.expiry_margin = expiry_margin
+        self.params = None
+        self.last_round = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    # Return a copy of the cached params if they are still usable
+    def lookup(self):
+        if self.params is None or self.last_round + self.expiry_margin >= self.params.last:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.copy(self.params)
+
+    # Replace the cached params with freshly fetched ones
+    def store(self, params):
+        params.last = params.first + self.valid_rounds
+        self.params = params
+        self.last_round = max(self.last_round, params.first)
+        return copy.copy(params)
+
+    # Record a new round; returns True when the cached params should be refreshed
+    def advance(self, last_round):
+        self.last_round = max(self.last_round, last_round)
+        return self.params is None or self.last_round - self.params.first >= self.refresh_rounds
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+# Shared provider of SuggestedParams for the synchronous algod client. A
+# background thread follows the chain with status_after_block and refetches
+# the params once the round has advanced by refresh_rounds.
+class SuggestedParamsProvider:
+    def __init__(self, client, refresh_rounds=10, valid_rounds=MAX_VALID_ROUNDS, background=True):
+        self.client = client
+        self.cache = ParamsCache(refresh_rounds, valid_rounds)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        if background:
+            self.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.follow_rounds, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def fetch(self):
+        params = self.client.suggested_params()
+        with self.lock:
+            return self.cache.store(params)
+
+    def follow_rounds(self):
+        while not self.stopped.is_set():
+            try:
+                status = self.client.status_after_block(self.cache.last_round)
+                with self.lock:
+                    refresh = self.cache.advance(status.get("last-round"))
+                if refresh and not self.stopped.is_set():
+                    self.fetch()
+                    with self.lock:
+                        self.cache.refreshes += 1
+            except Exception as e:
+                print(f"Suggested params refresh failed: {e}")
+                self.stopped.wait(1)
+
+    # Return suggested params, from the cache when possible
+    def get(self):
+        with self.lock:
+            params = self.cache.lookup()
+        if params is not None:
+            return params
+        return self.fetch()
+
+    def stats(self):
+        return self.cache.stats()
+
+# asyncio counterpart of SuggestedParamsProvider for AsyncAlgodClient
+class AsyncSuggestedParamsProvider:
+    def __init__(self, client, refresh_rounds=10, valid_rounds=MAX_VALID_ROUNDS):
+        self.client = client
+        self.cache = ParamsCache(refresh_rounds, valid_rounds)
+        self.fetching = None
+        self.task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.follow_rounds())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    # Fetch params once even when many coroutines miss at the same time
+    async def fetch(self):
+        if self.fetching is None:
+            self.fetching = asyncio.ensure_future(self.client.suggested_params())
+        fetching = self.fetching
+        try:
+            params = await fetching
+        finally:
+            if self.fetching is fetching:
+                self.fetching = None
+        return self.cache.store(copy.copy(params))
+
+    async def follow_rounds(self):
+        while True:
+            try:
+                status = await self.client.status_after_block(self.cache.last_round)
+                if self.cache.advance(status.get("last-round")):
+                    await self.fetch()
+                    self.cache.refreshes += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Suggested params refresh failed: {e}")
+                await asyncio.sleep(1)
+
+    # Return suggested params, from the cache when possible
+    async def get(self):
+        params = self.cache.lookup()
+        if params is not None:
+            return params
+        return await self.fetch()
+
+    def stats(self):
+        return self.cache.stats()
+
+# Note carrying a random nonce. Cached params keep the same first/last rounds
+# for many rounds, so two identical transactions built from them (repeated
+# call arguments, duplicate manifest rows) would otherwise get the same ID
+# and all but the first be rejected as already in the ledger.
+def unique_note():
+    return os.urandom(NONCE_SIZE)
+
+# Get suggested params from a provider if one is given, otherwise from algod
+def get_suggested_params(client, params_provider=None):
+    if params_provider is not None:
+        return params_provider.get()
+    return client.suggested_params()
+
+# asyncio counterpart of get_suggested_params
+async def get_suggested_params_async(client, params_provider=None):
+    if params_provider is not None:
+        return await params_provider.get()
+    return await client.suggested_params()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+
+# Static opcode-cost profiler for the approval programs in smart_contracts/.
+#
+# For every method it reports the cost of reaching the handler through the
+# router, the worst-case cost of the handler itself and the share of the
+# per-call opcode budget it uses, plus each program's size. Results can be
+# appended to a history file keyed by a hash of the contract sources, and
+# --check fails when a gated method regresses against the last recorded
+# entry.
+
+import argparse
+import base64
+import glob
+import hashlib
+import heapq
+import json
+import os
+import sys
+import time
+
+# Directory of the contract sources
+CONTRACTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'smart_contracts')
+sys.path.append(CONTRACTS_DIR)
+
+import inventory_contract
+import asset_manager
+import oracle_contract
+import security_contract
+from router import TEAL_VERSION, method_label
+from avm import OPCODE_COSTS
+
+# Contracts to profile, keyed by the name used in reports
+CONTRACTS = {
+    "inventory": inventory_contract,
+    "asset_manager": asset_manager,
+    "oracle": oracle_contract,
+    "security": security_contract
+}
+
+# Opcode budget of a single application call
+OPCODE_BUDGET = 700
+
+# Maximum size of an approval program without extra pages
+MAX_PROGRAM_SIZE = 2048
+
+# Methods whose regressions fail --check by default
+DEFAULT_GATES = ["inventory.update_quantity"]
+
+# Most records a call of each looping method processes, as documented with
+# the method; its loop is checked against the budget at this many passes
+MAX_RECORDS = {
+    "inventory.batch_update_quantity": 8,
+    "security.set_roles": 8,
+    "asset_manager.batch_transfer_asset": asset_manager.MAX_BATCH_RECORDS,
+    "asset_manager.batch_freeze_asset": asset_manager.MAX_BATCH_RECORDS,
+    "oracle.tick": 8
+}
+
+# Default history file of recorded costs
+DEFAULT_RECORD_PATH = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'opcode_costs.json')
+
+# Opcodes whose immediates are labels
+BRANCH_OPS = ("b", "bz", "bnz", "callsub")
+MULTI_BRANCH_OPS = ("switch", "match")
+TERMINAL_OPS = ("return", "err", "retsub")
+
+# Size in bytes of opcodes that take immediates, excluding constants and branches
+IMMEDIATE_SIZES = {
+    "txn": 2, "global": 2, "txna": 3, "gtxn": 3, "gtxna": 4, "gtxns": 2, "gtxnsa": 3,
+    "itxn": 2, "itxna": 3, "itxn_field": 2, "gitxn": 3, "gitxna": 4,
+    "load": 2, "store": 2, "gload": 3, "gloads": 2, "gaid": 2,
+    "extract": 3, "substring": 3, "dig": 2, "bury": 2, "cover": 2, "uncover": 2,
+    "popn": 2, "dupn": 2, "frame_dig": 2, "frame_bury": 2, "proto": 3,
+    "app_params_get": 2, "asset_params_get": 2, "asset_holding_get": 2, "acct_params_get": 2,
+    "replace2": 2, "json_ref": 2, "base64_decode": 2, "ecdsa_verify": 2,
+    "ecdsa_pk_decompress": 2, "ecdsa_pk_recover": 2, "vrf_verify": 2, "block": 2
+}
+
+def varint_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+# Length in bytes of a TEAL byte constant
+def byte_constant_length(arg):
+    if arg.startswith('"'):
+        return len(arg[1:-1].encode().decode("unicode_escape").encode("latin-1"))
+    if arg.startswith("0x"):
+        return (len(arg) - 2) // 2
+    encoding, _, value = arg.partition(" ")
+    if encoding in ("base64", "b64"):
+        return len(base64.b64decode(value))
+    if encoding in ("base32", "b32"):
+        return len(base64.b32decode(value + "=" * (-len(value) % 8)))
+    return len(arg)
+
+# Parsed TEAL program: a list of (op, args) instructions and a label index
+class TealProgram:
+    def __init__(self, teal):
+        self.instructions = []
+        self.labels = {}
+        for line in teal.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#pragma") or line.startswith("//"):
+                continue
+            if line.endswith(":") and " " not in line:
+                self.labels[line[:-1]] = len(self.instructions)
+                continue
+            op, _, args = line.partition(" ")
+            self.instructions.append((op, args))
+
+    def cost(self, index):
+        return OPCODE_COSTS.get(self.instructions[index][0], 1)
+
+    # Instructions execution may continue with after the given one
+    def successors(self, index):
+        op, args = self.instructions[index]
+        if op in TERMINAL_OPS:
+            return []
+        if op == "b":
+            return [self.labels[args]]
+        if op == "callsub":
+            return [index + 1] if index + 1 < len(self.instructions) else []
+        following = [index + 1] if index + 1 < len(self.instructions) else []
+        if op in ("bz", "bnz"):
+            return following + [self.labels[args]]
+        if op in MULTI_BRANCH_OPS:
+            return following + [self.labels[label] for label in args.split()]
+        return following
+
+    # Cheapest cost of reaching a label from the program entry
+    def min_cost_to(self, label):
+        target = self.labels[label]
+        best = {0: 0}
+        queue = [(0, 0)]
+        while queue:
+            cost, index = heapq.heappop(queue)
+            if index == target:
+                return cost
+            if cost > best.get(index, cost):
+                continue
+            for successor in self.successors(index):
+                successor_cost = cost + self.cost(index)
+                if successor_cost < best.get(successor, float("inf")):
+                    best[successor] = successor_cost
+                    heapq.heappush(queue, (successor_cost, successor))
+        raise ValueError(f"Label {label} is unreachable")
+
+    # Worst-case cost of executing from an instruction until the program
+    # exits. Back edges are cut, so a loop is counted for a single pass; the
+    # instructions heading the loops are returned with the cost.
+    def max_cost_from(self, start):
+        memo = {}
+        on_path = set()
+        loops = []
+
+        def visit(index):
+            if index in memo:
+                return memo[index]
+            if index in on_path:
+                loops.append(index)
+                return 0
+            on_path.add(index)
+            cost = self.cost(index)
+            op, args = self.instructions[index]
+            if op == "callsub":
+                cost += visit(self.labels[args])
+            cost += max((visit(successor) for successor in self.successors(index)), default=0)
+            on_path.discard(index)
+            memo[index] = cost
+            return cost
+
+        return visit(start), set(loops)
+
+    # Worst-case cost of executing from an instruction until the program
+    # exits, or until execution is back at stop when given, over the paths
+    # that never return to an instruction already on them
+    def max_acyclic_cost(self, start, stop=None):
+        memo = {}
+        on_path = set()
+
+        def visit(index):
+            if index == stop:
+                return 0
+            if index in memo:
+                return memo[index]
+            if index in on_path:
+                return float("-inf")
+            on_path.add(index)
+            op, args = self.instructions[index]
+            cost = self.cost(index)
+            if op == "callsub":
+                cost += self.max_cost_from(self.labels[args])[0]
+            successors = self.successors(index)
+            if successors:
+                cost += max(visit(successor) for successor in successors)
+            elif stop is not None:
+                cost = float("-inf")
+            on_path.discard(index)
+            memo[index] = cost
+            return cost
+
+        return visit(start)
+
+    # Worst-case cost of one pass of the loop headed by an instruction
+    def loop_pass_cost(self, head):
+        return self.cost(head) + max(
+            self.max_acyclic_cost(successor, stop=head) for successor in self.successors(head)
+        )
+
+    # Estimated assembled size in bytes
+    def size_estimate(self):
+        size = 1  # version byte
+        for op, args in self.instructions:
+            if op == "int":
+                value = int(args, 0) if args[:1].isdigit() else 0
+                size += 1 + varint_size(value)
+            elif op == "byte":
+                length = byte_constant_length(args)
+                size += 1 + varint_size(length) + length
+            elif op == "addr":
+                size += 34
+            elif op in BRANCH_OPS:
+                size += 3
+            elif op in MULTI_BRANCH_OPS:
+                size += 2 + 2 * len(args.split())
+            else:
+                size += IMMEDIATE_SIZES.get(op, 1)
+        return size
+
+# Profile every method of a contract module
+def profile_contract(module, client=None):
+    router = module.router()
+    teal = router.compile()
+    program = TealProgram(teal)
+
+    if client is not None:
+        size = len(base64.b64decode(client.compile(teal)["result"]))
+    else:
+        size = program.size_estimate()
+
+    methods = {}
+    for name in router.methods:
+        label = method_label(name)
+        dispatch = program.min_cost_to(label)
+        body, loops = program.max_cost_from(program.labels[label])
+        methods[name] = {
+            "dispatch": dispatch,
+            "body": body,
+            "total": dispatch + body,
+            "budget_pct": round(100.0 * (dispatch + body) / OPCODE_BUDGET, 1),
+            "has_loop": bool(loops)
+        }
+        if loops:
+            # Split for the budget check: the cost outside the loops, and the
+            # cost of one pass through each loop
+            methods[name]["outside_loop"] = program.max_acyclic_cost(program.labels[label])
+            methods[name]["loop_pass"] = sum(program.loop_pass_cost(head) for head in loops)
+    return {"size": size, "size_exact": client is not None, "methods": methods}
+
+def profile_all(client=None):
+    return {name: profile_contract(module, client) for name, module in CONTRACTS.items()}
+
+# Hash of every contract source. Entries are keyed by what was measured
+# rather than by git commit, so the change to a contract and the entry
+# recording its costs can go in the same commit.
+def source_hash():
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(CONTRACTS_DIR, "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode() + b"\0" + f.read() + b"\0")
+    return digest.hexdigest()[:12]
+
+def load_history(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"teal_version": TEAL_VERSION, "budget": OPCODE_BUDGET, "history": []}
+
+# Append the entry of the contract sources to the history file, or replace
+# it if they were recorded before. A regression accepted with max_regression
+# is kept in the entry.
+def record(path, source, profile, label=None, max_regression_pct=0.0):
+    history = load_history(path)
+    entry = {"source": source}
+    if label:
+        entry["label"] = label
+    entry.update(timestamp=int(time.time()), contracts=profile)
+    if max_regression_pct:
+        entry["max_regression"] = max_regression_pct
+    entries = [previous for previous in history["history"] if previous["source"] != source]
+    history["history"] = entries + [entry]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+        f.write("\n")
+
+# Entry the gate compares the contract sources against, and the regression
+# accepted for them: the last recorded entry, or the one before the sources'
+# own entry once they are recorded
+def baseline_entry(path, source):
+    history = load_history(path)["history"]
+    for index, entry in enumerate(history):
+        if entry["source"] == source:
+            return (history[index - 1] if index else None), entry.get("max_regression", 0.0)
+    return (history[-1] if history else None), 0.0
+
+# Worst-case cost of a call of a method: a looping method makes one loop
+# pass per record, up to its MAX_RECORDS
+def worst_case_cost(method, costs):
+    if not costs["has_loop"]:
+        return costs["total"]
+    return costs["dispatch"] + costs["outside_loop"] + costs["loop_pass"] * MAX_RECORDS[method]
+
+# Compare a profile against the budget and a baseline; returns failure messages
+def check(profile, baseline, gates, max_regression_pct):
+    failures = []
+    for contract, result in profile.items():
+        if result["size"] > MAX_PROGRAM_SIZE:
+            failures.append(f"{contract}: program size {result['size']} exceeds {MAX_PROGRAM_SIZE} bytes")
+        for name, costs in result["methods"].items():
+            method = f"{contract}.{name}"
+            if costs["has_loop"] and method not in MAX_RECORDS:
+                failures.append(f"{method}: loops over records but declares no maximum in MAX_RECORDS")
+                continue
+            cost = worst_case_cost(method, costs)
+            if cost > OPCODE_BUDGET:
+                records = f" at {MAX_RECORDS[method]} records" if costs["has_loop"] else ""
+                failures.append(f"{method}: cost {cost}{records} exceeds budget {OPCODE_BUDGET}")
+
+    if baseline is None:
+        return failures
+
+    for gate in gates:
+        contract, _, name = gate.partition(".")
+        current = profile.get(contract, {}).get("methods", {}).get(name)
+        previous = baseline["contracts"].get(contract, {}).get("methods", {}).get(name)
+        if current is None or previous is None:
+            continue
+        limit = previous["total"] * (1 + max_regression_pct / 100.0)
+        if current["total"] > limit:
+            failures.append(
+                f"{gate}: cost {current['total']} regressed from {previous['total']} ({entry_name(baseline)})"
+            )
+    return failures
+
+def entry_name(entry):
+    return entry.get("label") or f"source {entry['source']}"
+
+def print_report(profile):
+    for contract, result in profile.items():
+        size_kind = "bytes" if result["size_exact"] else "bytes (estimated)"
+        print(f"{contract}: {result['size']} {size_kind}")
+        for name, costs in result["methods"].items():
+            method = f"{contract}.{name}"
+            loop_note = ""
+            if costs["has_loop"] and method in MAX_RECORDS:
+                loop_note = (f" (one loop pass; {worst_case_cost(method, costs)} at "
+                             f"{MAX_RECORDS[method]} records)")
+            elif costs["has_loop"]:
+                loop_note = " (one loop pass)"
+            print(
+                f"  {name:<24} dispatch {costs['dispatch']:>3}  body {costs['body']:>4}  "
+                f"total {costs['total']:>4}  {costs['budget_pct']:>5}% of {OPCODE_BUDGET}{loop_note}"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description='Report static opcode cost and size of each contract method')
+    parser.add_argument('--record', action='store_true', help='Record the results for the current contract sources')
+    parser.add_argument('--label', help='Name of the recorded entry, e.g. the change it measures')
+    parser.add_argument('--check', action='store_true',
+                        help='Fail if a method exceeds the budget or a gated method regressed')
+    parser.add_argument('--history', default=DEFAULT_RECORD_PATH, help='History file of recorded costs')
+    parser.add_argument('--gate', action='append', help='contract.method to gate on regressions (repeatable)')
+    parser.add_argument('--max_regression', type=float, default=0.0,
+                        help='Allowed cost increase of gated methods, in percent')
+    parser.add_argument('--algod', action='store_true', help='Use algod to compile programs for exact sizes')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    client = None
+    if args.algod:
+        from deploy import get_algod_client
+        client = get_algod_client()
+
+    profile = profile_all(client)
+    if args.json:
+        print(json.dumps(profile, indent=2))
+    else:
+        print_report(profile)
+
+    source = source_hash()
+    # Recording makes the entry the baseline of later checks, so it is
+    # refused for a regression that --max_regression does not accept
+    if args.check or args.record:
+        baseline, accepted_pct = baseline_entry(args.history, source)
+        max_regression_pct = args.max_regression if args.record else max(args.max_regression, accepted_pct)
+        failures = check(profile, baseline, args.gate or DEFAULT_GATES, max_regression_pct)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            if args.record:
+                print("Not recorded; pass --max_regression to accept the regression")
+            sys.exit(1)
+        if args.check:
+            print("Opcode budget check passed")
+
+    if args.record:
+        record(args.history, source, profile, args.label, args.max_regression)
+        print(f"Recorded results for contract sources {source} in {args.history}")
+
+if __name__ == "__main__":
+    main()
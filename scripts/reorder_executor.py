@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+# Executor that settles the inventory contract's reorder intents.
+#
+# update_quantity and batch_update_quantity only emit ReorderNeeded and
+# ReorderNeededBatch when a product falls below its threshold; something
+# has to place the reorder. The executor follows confirmed blocks for those
+# events, journals each product as an intent in SQLite together with the
+# checkpoint round, and settles pending intents with reorder calls in
+# atomic groups of 16, keeping a bounded number of groups in flight.
+#
+# Every reorder call carries its intent key in the note. An intent counts as
+# settled once a block contains that note, and a submitted intent is only
+# planned again after its transaction's last valid round has passed without
+# it, so a restarted executor never places the same reorder twice.
+#
+# reorder adds the ordered quantity to the recorded stock at once, with no
+# delivery behind it, and so clears the low-stock signal. The executor
+# therefore only journals intents unless it is run with --execute.
+
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import sys
+from algosdk import account, encoding, mnemonic
+from algosdk.error import AlgodHTTPError
+from algosdk.future.transaction import ApplicationNoOpTxn, assign_group_id
+from nacl.signing import SigningKey
+from event_decoder import EventDecoder
+from event_indexer import algod_source, app_call_logs, get_algod_client
+from params_cache import get_suggested_params
+from signer_pool import sign_raw
+from state_reader import StateReader
+from interact_with_contracts import MAX_GROUP_SIZE
+from metrics import REGISTRY, RETRIES, STAGE_SECONDS, add_metrics_arguments, exporting_metrics
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from inventory_contract import METHODS as inventory_methods, product_box_name
+from router import method_selector
+
+# Default location of the journal, relative to the working directory
+DEFAULT_JOURNAL_PATH = "reorder_journal.db"
+
+# Groups submitted but not yet seen in a block
+DEFAULT_WINDOW = 4
+
+# Reorders bring a product up to this multiple of its threshold
+DEFAULT_TARGET_FACTOR = 2
+
+# Rounds a reorder transaction stays valid; an unconfirmed intent is
+# planned again once they have passed
+VALIDITY_ROUNDS = 50
+
+# Prefix of the note that carries an intent key
+NOTE_PREFIX = b"reorder:"
+
+REORDER_INTENTS = REGISTRY.gauge("reorder_intents", "Reorder intents in the journal by status")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intents (
+    intent TEXT PRIMARY KEY,
+    round INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    isolate INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER,
+    group_id TEXT,
+    signed BLOB,
+    last_valid INTEGER,
+    settled_round INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS intents_by_status ON intents (status, round);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    round INTEGER NOT NULL
+);
+"""
+
+# Intent statuses
+PENDING = "pending"
+SUBMITTED = "submitted"
+SETTLED = "settled"
+SKIPPED = "skipped"
+FAILED = "failed"
+STATUSES = (PENDING, SUBMITTED, SETTLED, SKIPPED, FAILED)
+
+# Key of the intent to reorder a product, raised by the event at
+# (round, txn_index, log_index)
+def intent_key(round_num, txn_index, log_index, product_id):
+    return f"{round_num}:{txn_index}:{log_index}:{product_id}"
+
+# Quantity that brings a product up to target_factor times its threshold
+def reorder_quantity(record, target_factor=DEFAULT_TARGET_FACTOR):
+    return max(record.min_threshold * target_factor - record.quantity, 1)
+
+# SQLite journal of reorder intents and the last scanned round
+class IntentJournal:
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def checkpoint(self):
+        row = self.db.execute("SELECT round FROM checkpoint WHERE id = 0").fetchone()
+        return row[0] if row else None
+
+    # Record the intents and settlements of a block and advance the
+    # checkpoint in one transaction
+    def apply_block(self, round_num, intents, settled):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO intents (intent, round, product_id, status) VALUES (?, ?, ?, ?)",
+                [(key, round_num, product_id, PENDING) for key, product_id in intents]
+            )
+            self.db.executemany(
+                "UPDATE intents SET status = ?, settled_round = ?, signed = NULL WHERE intent = ?",
+                [(SETTLED, round_num, key) for key in settled]
+            )
+            # Submitted intents whose transactions can no longer confirm
+            self.db.execute(
+                "UPDATE intents SET status = ?, group_id = NULL, signed = NULL, attempts = attempts + 1 "
+                "WHERE status = ? AND last_valid < ?",
+                (PENDING, SUBMITTED, round_num)
+            )
+            self.db.execute(
+                "INSERT INTO checkpoint (id, round) VALUES (0, ?) ON CONFLICT (id) DO UPDATE SET round = excluded.round",
+                (round_num,)
+            )
+
+    # Attempts of the intents among keys that are not settled yet
+    def attempts(self, keys):
+        return [row[0] for row in self.db.execute(
+            f"SELECT attempts FROM intents WHERE status != ? AND intent IN ({', '.join('?' * len(keys))})",
+            (SETTLED, *keys)
+        )]
+
+    # Oldest pending intents as (intent, product ID, isolate)
+    def pending(self, limit):
+        return self.db.execute(
+            "SELECT intent, product_id, isolate FROM intents WHERE status = ? ORDER BY round, intent LIMIT ?",
+            (PENDING, limit)
+        ).fetchall()
+
+    # Product IDs with a reorder in flight
+    def in_flight_products(self):
+        return {row[0] for row in self.db.execute("SELECT product_id FROM intents WHERE status = ?", (SUBMITTED,))}
+
+    def in_flight_groups(self):
+        return self.db.execute("SELECT COUNT(DISTINCT group_id) FROM intents WHERE status = ?", (SUBMITTED,)).fetchone()[0]
+
+    # Signed transactions of each group in flight, in group order
+    def in_flight_raw(self):
+        groups = {}
+        for group_id, signed in self.db.execute(
+            "SELECT group_id, signed FROM intents WHERE status = ? ORDER BY group_id, rowid", (SUBMITTED,)
+        ):
+            groups.setdefault(group_id, []).append(signed)
+        return groups
+
+    def close_intents(self, keys, status, error=None):
+        with self.db:
+            self.db.executemany(
+                "UPDATE intents SET status = ?, error = ? WHERE intent = ?",
+                [(status, error, key) for key in keys]
+            )
+
+    # Mark a group submitted before it is sent, so a restart waits for it
+    # instead of placing its reorders again
+    def submit(self, group_id, entries, last_valid):
+        with self.db:
+            self.db.executemany(
+                "UPDATE intents SET status = ?, group_id = ?, quantity = ?, signed = ?, last_valid = ? WHERE intent = ?",
+                [(SUBMITTED, group_id, quantity, signed, last_valid, key) for key, quantity, signed in entries]
+            )
+
+    # A rejected group is planned again with each intent in its own group,
+    # so one bad product cannot hold back the others; a rejected single
+    # intent fails
+    def reject(self, keys, error):
+        with self.db:
+            if len(keys) == 1:
+                self.db.execute(
+                    "UPDATE intents SET status = ?, group_id = NULL, signed = NULL, error = ? WHERE intent = ?",
+                    (FAILED, error, keys[0])
+                )
+                return
+            self.db.executemany(
+                "UPDATE intents SET status = ?, group_id = NULL, signed = NULL, isolate = 1, "
+                "attempts = attempts + 1 WHERE intent = ?",
+                [(PENDING, key) for key in keys]
+            )
+
+    # Intent counts by status
+    def summary(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM intents GROUP BY status").fetchall())
+
+# Turns reorder events into intents and settles them with reorder calls
+class ReorderExecutor:
+    def __init__(self, client, private_key, app_id, journal, window=DEFAULT_WINDOW,
+                 target_factor=DEFAULT_TARGET_FACTOR, params_provider=None, execute=False):
+        self.client = client
+        self.app_id = app_id
+        self.journal = journal
+        # Without execute, intents are journaled but no reorder is sent
+        self.execute = execute
+        self.window = window
+        self.target_factor = target_factor
+        self.params_provider = params_provider
+        self.sender = account.address_from_private_key(private_key)
+        self.sender_bytes = encoding.decode_address(self.sender)
+        self.signing_keys = {self.sender: SigningKey(base64.b64decode(private_key)[:32])}
+        self.reader = StateReader(client, cache_seconds=0)
+        self.decoder = EventDecoder()
+        self.reorder_selector = method_selector(inventory_methods, "reorder")
+
+    # Intents raised and intents settled in a block
+    def scan_block(self, block):
+        round_num = block.get(b"rnd", 0)
+        layouts = self.decoder.layouts
+        intents = []
+        settled = []
+        for txn_index, stxn in enumerate(block.get(b"txns", [])):
+            txn = stxn.get(b"txn", {})
+            note = txn.get(b"note", b"")
+            if txn.get(b"snd") == self.sender_bytes and note.startswith(NOTE_PREFIX):
+                settled.append(note[len(NOTE_PREFIX):].decode())
+            for log_index, (_, log) in enumerate(app_call_logs(stxn, {self.app_id})):
+                layout = layouts.get(log[:4])
+                if layout is None or layout.name not in ("ReorderNeeded", "ReorderNeededBatch"):
+                    continue
+                fields = dict(zip(layout.names, layout.unpack(memoryview(log))))
+                product_ids = fields["product_ids"] if "product_ids" in fields else [fields["product_id"]]
+                for product_id in product_ids:
+                    intents.append((intent_key(round_num, txn_index, log_index, product_id), product_id))
+        return intents, settled
+
+    # Send the groups recorded as in flight again, e.g. after a restart; the
+    # network drops the ones it already has
+    def resubmit(self):
+        for group_id, signed in self.journal.in_flight_raw().items():
+            try:
+                self.client.send_raw_transaction(base64.b64encode(b"".join(signed)).decode())
+            except AlgodHTTPError:
+                pass
+
+    # Plan and submit groups of pending intents while the window has room;
+    # returns the number of groups sent
+    def submit_pending(self):
+        sent = 0
+        while self.journal.in_flight_groups() < self.window:
+            rows = self.journal.pending(MAX_GROUP_SIZE * 4)
+            if not rows:
+                break
+            busy = self.journal.in_flight_products()
+            records = self.reader.products(self.app_id, [product_id for _, product_id, _ in rows])
+
+            # One reorder per product: intents for a product already being
+            # reordered, or since restocked or removed, need none
+            group = []
+            closed = []
+            for key, product_id, isolate in rows:
+                record = records[product_id]
+                if product_id in busy or record is None or record.quantity >= record.min_threshold:
+                    closed.append(key)
+                    continue
+                if isolate and group:
+                    continue
+                group.append((key, product_id, reorder_quantity(record, self.target_factor)))
+                busy.add(product_id)
+                if isolate or len(group) == MAX_GROUP_SIZE:
+                    break
+            self.journal.close_intents(closed, SKIPPED)
+            if not group:
+                continue
+            self.send_group(group)
+            sent += 1
+        return sent
+
+    def send_group(self, group):
+        with STAGE_SECONDS.time(operation="reorder", stage="params"):
+            params = get_suggested_params(self.client, self.params_provider)
+        params.last = params.first + VALIDITY_ROUNDS
+        with STAGE_SECONDS.time(operation="reorder", stage="construct"):
+            txns = [
+                ApplicationNoOpTxn(
+                    self.sender, params, self.app_id,
+                    [self.reorder_selector, product_id.to_bytes(8, "big"), quantity.to_bytes(8, "big")],
+                    boxes=[(self.app_id, product_box_name(product_id))],
+                    note=NOTE_PREFIX + key.encode()
+                )
+                for key, product_id, quantity in group
+            ]
+            if len(txns) > 1:
+                assign_group_id(txns)
+        with STAGE_SECONDS.time(operation="reorder", stage="sign"):
+            signed = [sign_raw(txn, self.signing_keys) for txn in txns]
+        group_id = txns[0].get_txid()
+        self.journal.submit(
+            group_id,
+            [(key, quantity, raw) for (key, _, quantity), raw in zip(group, signed)],
+            params.last
+        )
+        try:
+            with STAGE_SECONDS.time(operation="reorder", stage="submit"):
+                self.client.send_raw_transaction(base64.b64encode(b"".join(signed)).decode())
+        except AlgodHTTPError as e:
+            self.journal.reject([key for key, _, _ in group], str(e))
+
+    # Follow blocks from start_round, journaling intents and settling them.
+    # Groups are submitted whenever the follower reaches the latest round;
+    # with follow=False it stops once nothing is pending or in flight (or,
+    # when not executing, at the latest round).
+    def run(self, start_round, follow=True, on_round=None):
+        if self.execute:
+            self.resubmit()
+        for block in algod_source(self.client, start_round):
+            if block is not None:
+                intents, settled = self.scan_block(block)
+                # Attempts before an intent settled: expired and rejected
+                # submissions each count one
+                for attempts in self.journal.attempts(settled) if settled else []:
+                    RETRIES.observe(attempts, operation="reorder")
+                self.journal.apply_block(block.get(b"rnd", 0), intents, settled)
+                if on_round and (intents or settled):
+                    on_round(block.get(b"rnd", 0), len(intents), len(settled))
+                continue
+            if self.execute:
+                self.submit_pending()
+            summary = self.journal.summary()
+            for status in STATUSES:
+                REORDER_INTENTS.set(summary.get(status, 0), status=status)
+            if not follow and (not self.execute or not self.journal.pending(1) and not self.journal.in_flight_groups()):
+                return
+
+def main():
+    parser = argparse.ArgumentParser(description='Settle inventory reorder events with batched reorder calls')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH, help='Path of the SQLite intent journal')
+    parser.add_argument('--app_ids', default='app_ids.json', help='Path of the deployed app IDs')
+    parser.add_argument('--start_round', type=int,
+                        help='First round to scan when the journal is empty (default: the latest round)')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='Groups in flight at once')
+    parser.add_argument('--target_factor', type=int, default=DEFAULT_TARGET_FACTOR,
+                        help='Reorder up to this multiple of the product threshold')
+    parser.add_argument('--execute', action='store_true',
+                        help='Place reorders; without it intents are only journaled')
+    parser.add_argument('--once', action='store_true',
+                        help='Stop when every intent up to the latest round is settled (journaled without --execute)')
+    parser.add_argument('--status', action='store_true', help='Print intent counts by status and exit')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+
+    journal = IntentJournal(args.journal)
+    if args.status:
+        checkpoint = journal.checkpoint()
+        print(f"Scanned through round {checkpoint}" if checkpoint is not None else "Nothing scanned yet")
+        for status, count in sorted(journal.summary().items()):
+            print(f"  {status}: {count}")
+        journal.close()
+        return
+
+    try:
+        with open("account.json", "r") as f:
+            private_key = mnemonic.to_private_key(json.load(f)["mnemonic"])
+        with open(args.app_ids, "r") as f:
+            app_id = json.load(f)["inventory_app_id"]
+    except (OSError, ValueError, KeyError):
+        print(f"Error: account.json or {args.app_ids} not found. Please run deploy.py first.")
+        return
+
+    client = get_algod_client()
+    checkpoint = journal.checkpoint()
+    if checkpoint is not None:
+        start_round = checkpoint + 1
+    else:
+        start_round = args.start_round if args.start_round is not None else client.status().get("last-round")
+    if args.execute:
+        print(f"Settling reorders of inventory app {app_id} from round {start_round}")
+    else:
+        print(f"Journaling reorder intents of inventory app {app_id} from round {start_round} (--execute to place reorders)")
+
+    def report(round_num, raised, settled):
+        print(f"Round {round_num}: {raised} reorder intents raised, {settled} settled")
+        sys.stdout.flush()
+
+    executor = ReorderExecutor(client, private_key, app_id, journal, args.window, args.target_factor, execute=args.execute)
+    try:
+        with exporting_metrics(args):
+            executor.run(start_round, follow=not args.once, on_round=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(", ".join(f"{count} {status}" for status, count in sorted(journal.summary().items())))
+        journal.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# Off-chain cache of security_contract roles.
+#
+# The cache is built from the app's state (its admin and one role box per
+# user) and kept current by replaying the RoleChanged events of the blocks
+# confirmed since it was last refreshed. Scripts check a sender's role
+# against it before building a transaction, mirroring sender_has_role, so
+# calls the contract would reject are not sent at all. The cache is saved to
+# a JSON file so one-shot scripts only replay the rounds since their last
+# run.
+
+import argparse
+import base64
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from event_decoder import EventDecoder
+from event_indexer import algod_source, app_call_logs, get_algod_client
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from security_contract import ROLE_IDS
+from events import event_selector
+
+# Default location of the saved cache, relative to the working directory
+DEFAULT_CACHE_PATH = ".role_cache.json"
+
+# Rounds behind the chain after which the cache reloads the role boxes
+# instead of replaying blocks
+MAX_REPLAY_ROUNDS = 1000
+
+# Concurrent algod requests of a full load
+DEFAULT_LOAD_CONCURRENCY = 16
+
+# Roles required by the security contract methods
+METHOD_ROLES = {
+    "add_user": ROLE_IDS["admin"],
+    "remove_user": ROLE_IDS["admin"],
+    "change_role": ROLE_IDS["admin"],
+    "register_inventory_app": ROLE_IDS["admin"],
+    "register_asset_manager": ROLE_IDS["admin"],
+    "backup_data": ROLE_IDS["admin"],
+    "set_roles": ROLE_IDS["admin"]
+}
+
+ROLE_NAMES = {role: name for name, role in ROLE_IDS.items()}
+
+class RoleCheckError(Exception):
+    pass
+
+# Roles of the security app's users by address, as of last_round
+class RoleCache:
+    def __init__(self, client, app_id, concurrency=DEFAULT_LOAD_CONCURRENCY):
+        self.client = client
+        self.app_id = app_id
+        self.concurrency = concurrency
+        self.admin = None
+        self.roles = {}
+        self.last_round = None
+        self.decoder = EventDecoder()
+        self.role_changed = event_selector("RoleChanged")
+
+    # Role value of an address, or None if it has no role
+    def role(self, address):
+        if address == self.admin:
+            return ROLE_IDS["admin"]
+        return self.roles.get(address)
+
+    # Same rule as the contract's sender_has_role
+    def has_role(self, address, min_role):
+        role = self.role(address)
+        return role is not None and role != 0 and role <= min_role
+
+    # Raise RoleCheckError unless address may call the security method
+    def require(self, address, method):
+        min_role = METHOD_ROLES.get(method)
+        if min_role is None or self.has_role(address, min_role):
+            return
+        role = self.role(address)
+        held = ROLE_NAMES.get(role, str(role)) if role is not None else "no role"
+        raise RoleCheckError(f"{address} has {held}; {method} requires the {ROLE_NAMES[min_role]} role")
+
+    # Read the admin and every role box. The round is taken first so changes
+    # made during the scan are replayed by refresh().
+    def load(self):
+        self.last_round = self.client.status().get("last-round")
+        for entry in self.client.application_info(self.app_id)["params"].get("global-state", []):
+            if base64.b64decode(entry["key"]) == b"admin_address":
+                self.admin = encoding.encode_address(base64.b64decode(entry["value"]["bytes"]))
+        names = [base64.b64decode(box["name"]) for box in self.client.application_boxes(self.app_id).get("boxes", [])]
+
+        def read(name):
+            try:
+                return base64.b64decode(self.client.application_box_by_name(self.app_id, name)["value"])
+            except AlgodHTTPError as e:
+                if e.code != 404:
+                    raise
+                return None
+
+        self.roles = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for name, value in zip(names, executor.map(read, names)):
+                if value:
+                    self.roles[encoding.encode_address(name)] = value[0]
+
+    # Apply the RoleChanged events of the blocks confirmed since last_round;
+    # reload instead when the cache is too far behind
+    def refresh(self):
+        if self.last_round is None:
+            return self.load()
+        latest = self.client.status().get("last-round")
+        # A chain behind the cache is a different (reset) network
+        if latest < self.last_round or latest - self.last_round > MAX_REPLAY_ROUNDS:
+            return self.load()
+        for block in algod_source(self.client, self.last_round + 1, follow=False):
+            if block is None:
+                break
+            for stxn in block.get(b"txns", []):
+                for _, log in app_call_logs(stxn, {self.app_id}):
+                    if log[:4] == self.role_changed:
+                        _, fields = self.decoder.decode(log)
+                        self.apply_change(encoding.encode_address(fields["user"]), fields["role"])
+            self.last_round = block.get(b"rnd", 0)
+
+    def apply_change(self, address, role):
+        if role:
+            self.roles[address] = role
+        else:
+            self.roles.pop(address, None)
+
+    def save(self, path=DEFAULT_CACHE_PATH):
+        with open(path, "w") as f:
+            json.dump({"app_id": self.app_id, "last_round": self.last_round, "admin": self.admin, "roles": self.roles}, f)
+
+    # Restore a saved cache of the same app; returns False if there is none
+    def restore(self, path=DEFAULT_CACHE_PATH):
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get("app_id") != self.app_id:
+            return False
+        self.last_round = saved["last_round"]
+        self.admin = saved["admin"]
+        self.roles = saved["roles"]
+        return True
+
+# Role cache of the security app, restored from path and brought up to date
+def open_role_cache(client, app_id, path=DEFAULT_CACHE_PATH):
+    cache = RoleCache(client, app_id)
+    cache.restore(path)
+    cache.refresh()
+    cache.save(path)
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description='Show roles from the off-chain security role cache')
+    parser.add_argument('--app_ids', default='app_ids.json', help='Path of the deployed app IDs')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='Path of the saved role cache')
+    parser.add_argument('--reload', action='store_true', help='Rebuild the cache from the role boxes')
+    parser.add_argument('--address', help='Print the role of one address')
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.app_ids, "r") as f:
+            app_id = json.load(f)["security_app_id"]
+    except (OSError, ValueError, KeyError):
+        print(f"Error: {args.app_ids} not found. Please run deploy.py first.")
+        return
+
+    client = get_algod_client()
+    if args.reload:
+        cache = RoleCache(client, app_id)
+        cache.load()
+        cache.save(args.cache)
+    else:
+        cache = open_role_cache(client, app_id, args.cache)
+
+    if args.address:
+        role = cache.role(args.address)
+        print(f"{args.address}: {ROLE_NAMES.get(role, 'no role') if role is not None else 'no role'}")
+        return
+    print(f"Roles as of round {cache.last_round} (admin {cache.admin}):")
+    for address, role in sorted(cache.roles.items(), key=lambda item: (item[1], item[0])):
+        print(f"  {address}: {ROLE_NAMES.get(role, role)}")
+
+if __name__ == "__main__":
+    main()
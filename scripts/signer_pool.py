@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Multi-account signing pool.
+#
+# A pool holds the keys of N operator accounts (operators.json) and signs
+# transactions in a process pool so ed25519 signing and msgpack encoding run
+# on every core. Each worker loads the keys once at start; transactions are
+# sent to the workers in chunks and come back as raw signed transactions
+# ready for send_raw_transaction. next_sender() spreads new transactions
+# across the operators round-robin, so no single account sequences all of
+# them.
+#
+# Operators are funded from the admin account (--fund) but hold no role in
+# the contracts, so they only send transactions any account may send, such
+# as payments and calls of unrestricted methods.
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import msgpack
+from algosdk import account, encoding, mnemonic
+from algosdk.future import transaction
+from algosdk.future.transaction import ApplicationNoOpTxn, PaymentTxn
+from nacl.signing import SigningKey
+from confirmation import ConfirmationTracker
+from params_cache import get_suggested_params, unique_note
+from interact_with_contracts import get_algod_client, group_transactions
+
+# Default location of the operator accounts, relative to the working directory
+DEFAULT_OPERATORS_PATH = "operators.json"
+
+# Transactions per task sent to a signing worker
+DEFAULT_CHUNK_SIZE = 256
+
+# Signing keys of the worker process by sender address, set by init_worker
+SIGNING_KEYS = {}
+
+def init_worker(private_keys):
+    SIGNING_KEYS.clear()
+    for private_key in private_keys:
+        SIGNING_KEYS[account.address_from_private_key(private_key)] = SigningKey(base64.b64decode(private_key)[:32])
+
+# Sign a transaction with the key of its sender, returning the msgpack
+# encoded signed transaction. The encoded transaction is used both as the
+# signed message and as the "txn" value, so it is encoded only once.
+def sign_raw(txn, signing_keys):
+    encoded = base64.b64decode(encoding.msgpack_encode(txn))
+    signature = signing_keys[txn.sender].sign(b"TX" + encoded).signature
+    return b"\x82" + msgpack.packb("sig") + msgpack.packb(signature, use_bin_type=True) + msgpack.packb("txn") + encoded
+
+def sign_chunk(txns):
+    return [sign_raw(txn, SIGNING_KEYS) for txn in txns]
+
+def load_operators(path=DEFAULT_OPERATORS_PATH):
+    with open(path, "r") as f:
+        return [mnemonic.to_private_key(operator["mnemonic"]) for operator in json.load(f)["operators"]]
+
+# Generate operator accounts and save them to path
+def create_operators(count, path=DEFAULT_OPERATORS_PATH):
+    operators = []
+    for _ in range(count):
+        private_key, address = account.generate_account()
+        operators.append({"address": address, "mnemonic": mnemonic.from_private_key(private_key)})
+    with open(path, "w") as f:
+        json.dump({"operators": operators}, f, indent=2)
+    return [mnemonic.to_private_key(operator["mnemonic"]) for operator in operators]
+
+# Signs transactions of many sender accounts in a process pool
+class SignerPool:
+    def __init__(self, private_keys, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.private_keys = list(private_keys)
+        self.senders = [account.address_from_private_key(private_key) for private_key in self.private_keys]
+        self.chunk_size = chunk_size
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.processes, initializer=init_worker, initargs=(self.private_keys,))
+        self.round_robin = itertools.cycle(self.senders)
+        # Signing in this process for small batches avoids the round trip
+        # to the workers
+        self.local_keys = {}
+        for private_key, sender in zip(self.private_keys, self.senders):
+            self.local_keys[sender] = SigningKey(base64.b64decode(private_key)[:32])
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_OPERATORS_PATH, **kwargs):
+        return cls(load_operators(path), **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    # Sender for the next transaction, rotating over the operators
+    def next_sender(self):
+        return next(self.round_robin)
+
+    # Raw signed transactions in the order of txns
+    def sign_raw(self, txns):
+        txns = list(txns)
+        if len(txns) <= self.chunk_size:
+            return [sign_raw(txn, self.local_keys) for txn in txns]
+        chunks = [txns[start:start + self.chunk_size] for start in range(0, len(txns), self.chunk_size)]
+        return [signed for chunk in self.executor.map(sign_chunk, chunks) for signed in chunk]
+
+    # Sign and submit atomic groups (lists of transactions that already
+    # carry their group ID), returning the first transaction ID of each
+    def send_groups(self, client, groups):
+        signed = iter(self.sign_raw(txn for group in groups for txn in group))
+        tx_ids = []
+        for group in groups:
+            raw = b"".join(next(signed) for _ in group)
+            tx_ids.append(client.send_raw_transaction(base64.b64encode(raw).decode()))
+        return tx_ids
+
+# Fund each operator with amount microAlgos from the admin account
+def fund_operators(client, admin_key, addresses, amount, params_provider=None):
+    params = get_suggested_params(client, params_provider)
+    admin = account.address_from_private_key(admin_key)
+    tracker = ConfirmationTracker(client)
+    # send_transactions returns only the first transaction's ID, so every
+    # payment of the group is tracked by its own ID
+    for group in group_transactions([PaymentTxn(admin, params, address, amount, note=unique_note()) for address in addresses]):
+        client.send_transactions([txn.sign(admin_key) for txn in group])
+        tracker.add(*[txn.get_txid() for txn in group])
+    tracker.wait(list(tracker.pending))
+
+# Sign count no-op application calls spread over the pool's senders and
+# return the signing rate; nothing is submitted
+def bench_signing(pool, count, app_id=1):
+    params = transaction.SuggestedParams(1000, 1, 1001, base64.b64encode(bytes(32)).decode(), "bench-v1", flat_fee=True)
+    txns = [ApplicationNoOpTxn(pool.next_sender(), params, app_id, [b"bench"], note=index.to_bytes(8, "big")) for index in range(count)]
+    start = time.perf_counter()
+    signed = pool.sign_raw(txns)
+    elapsed = time.perf_counter() - start
+    return len(signed) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage operator accounts and sign transactions in a process pool')
+    parser.add_argument('--operators', default=DEFAULT_OPERATORS_PATH, help='Path of the operator accounts file')
+    parser.add_argument('--create', type=int, metavar='N', help='Generate N operator accounts')
+    parser.add_argument('--fund', type=int, metavar='MICROALGOS', help='Fund every operator from the admin account')
+    parser.add_argument('--bench', type=int, metavar='COUNT', help='Measure signing throughput with COUNT transactions')
+    parser.add_argument('--processes', type=int, help='Signing processes (default: one per core)')
+
+    args = parser.parse_args()
+
+    if args.create:
+        create_operators(args.create, args.operators)
+        print(f"Generated {args.create} operator accounts in {args.operators}")
+
+    try:
+        private_keys = load_operators(args.operators)
+    except (OSError, ValueError, KeyError):
+        print(f"Error: {args.operators} not found. Generate operators with --create N.")
+        return
+    addresses = [account.address_from_private_key(private_key) for private_key in private_keys]
+
+    if args.fund:
+        try:
+            with open("account.json", "r") as f:
+                admin_key = mnemonic.to_private_key(json.load(f)["mnemonic"])
+        except (OSError, ValueError, KeyError):
+            print("Error: account.json not found. Please run deploy.py first.")
+            return
+        fund_operators(get_algod_client(), admin_key, addresses, args.fund)
+        print(f"Funded {len(addresses)} operators with {args.fund} microAlgos each")
+
+    if args.bench:
+        with SignerPool(private_keys, processes=args.processes) as pool:
+            rate = bench_signing(pool, args.bench)
+        print(f"Signed {args.bench} transactions from {len(addresses)} senders on {pool.processes} processes: {rate:.0f} txn/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+# Read path for contract state without sending transactions.
+#
+# check_inventory and audit only log state they read, so the same answers
+# come from reading the product boxes (and app global/local state) through
+# algod directly. Reads are cached for a short time and bulk reads of many
+# products are issued concurrently. Reads that need contract logic can be
+# evaluated with algod's simulate endpoint, which runs a call against the
+# current state without committing it or paying its fee.
+
+import argparse
+import base64
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import msgpack
+from algosdk import account, mnemonic
+from algosdk.v2client import algod
+from algosdk.error import AlgodHTTPError
+from algosdk.future.transaction import ApplicationNoOpTxn
+from event_decoder import EventDecoder
+from interact_with_contracts import format_field
+from metrics import instrument_client
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'smart_contracts'))
+
+from inventory_contract import METHODS as inventory_methods, PRODUCT_RECORD_SIZE, decode_product_record, product_box_name
+from router import method_selector
+
+# Algorand node connection parameters
+algod_address = "http://localhost:4001"
+algod_token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+
+# Seconds a cached read stays valid; about one round
+DEFAULT_CACHE_SECONDS = 3.0
+
+# Concurrent algod requests of a bulk read
+DEFAULT_READ_CONCURRENCY = 16
+
+# A product record read from its box
+ProductRecord = collections.namedtuple("ProductRecord", [
+    "product_id", "quantity", "last_updated", "min_threshold",
+    "price", "expiration", "location", "supplier"
+])
+
+class SimulationError(Exception):
+    pass
+
+def get_algod_client():
+    return instrument_client(algod.AlgodClient(algod_token, algod_address))
+
+def product_record(product_id, record):
+    return ProductRecord(product_id=product_id, **decode_product_record(record))
+
+# Decode algod's TEAL key-value list into {key: int or bytes}; keys that are
+# valid UTF-8 are returned as strings
+def decode_key_values(key_values):
+    state = {}
+    for entry in key_values or []:
+        key = base64.b64decode(entry["key"])
+        try:
+            key = key.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+        value = entry["value"]
+        state[key] = base64.b64decode(value["bytes"]) if value["type"] == 1 else value["uint"]
+    return state
+
+# Time-limited cache of read results
+class ReadCache:
+    def __init__(self, max_age=DEFAULT_CACHE_SECONDS, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Cached value of key, or compute it with fetch and cache the result
+    def get(self, key, fetch):
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = fetch()
+        with self.lock:
+            self.entries[key] = (now + self.max_age, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+# Cached reads of application state through algod
+class StateReader:
+    def __init__(self, client, cache_seconds=DEFAULT_CACHE_SECONDS, concurrency=DEFAULT_READ_CONCURRENCY):
+        self.client = client
+        self.cache = ReadCache(cache_seconds)
+        self.concurrency = concurrency
+
+    def global_state(self, app_id):
+        return self.cache.get(("global", app_id), lambda: decode_key_values(
+            self.client.application_info(app_id)["params"].get("global-state")
+        ))
+
+    # Local state of an account in an app, or None if it is not opted in
+    def local_state(self, app_id, address):
+        def fetch():
+            for app in self.client.account_info(address).get("apps-local-state", []):
+                if app["id"] == app_id:
+                    return decode_key_values(app.get("key-value"))
+            return None
+        return self.cache.get(("local", app_id, address), fetch)
+
+    # Raw box contents, or None if the box does not exist
+    def box(self, app_id, name):
+        def fetch():
+            try:
+                return base64.b64decode(self.client.application_box_by_name(app_id, name)["value"])
+            except AlgodHTTPError as e:
+                if e.code != 404:
+                    raise
+                return None
+        return self.cache.get(("box", app_id, name), fetch)
+
+    # {name: raw contents or None} of several boxes, read concurrently
+    def boxes(self, app_id, names):
+        names = list(dict.fromkeys(names))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return dict(zip(names, executor.map(lambda name: self.box(app_id, name), names)))
+
+    # ProductRecord of a product, or None if it does not exist
+    def product(self, app_id, product_id):
+        record = self.box(app_id, product_box_name(product_id))
+        if record is None or len(record) != PRODUCT_RECORD_SIZE:
+            return None
+        return product_record(product_id, record)
+
+    # {product ID: ProductRecord or None}, reading the boxes concurrently
+    def products(self, app_id, product_ids):
+        product_ids = list(dict.fromkeys(product_ids))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            records = executor.map(lambda product_id: self.product(app_id, product_id), product_ids)
+            return dict(zip(product_ids, records))
+
+    # Off-chain check_inventory: the InventoryChecked fields plus whether the
+    # product is below its reorder threshold
+    def check_inventory(self, app_id, product_id):
+        record = self.product(app_id, product_id)
+        if record is None:
+            return None
+        return {
+            "product_id": product_id,
+            "quantity": record.quantity,
+            "min_threshold": record.min_threshold,
+            "reorder_needed": record.quantity < record.min_threshold
+        }
+
+    # Off-chain audit: the full product record
+    def audit(self, app_id, product_id):
+        return self.product(app_id, product_id)
+
+# Evaluate an application call with algod's simulate endpoint and return its
+# transaction result (logs, inner transactions). The call is not signed or
+# committed; raises SimulationError when the program rejects it.
+def simulate_app_call(client, sender, app_id, app_args, accounts=None, foreign_apps=None, foreign_assets=None, boxes=None, params=None):
+    params = params or client.suggested_params()
+    txn = ApplicationNoOpTxn(
+        sender, params, app_id, app_args,
+        accounts=accounts, foreign_apps=foreign_apps, foreign_assets=foreign_assets, boxes=boxes
+    )
+    request = {"txn-groups": [{"txns": [{"txn": txn.dictify()}]}], "allow-empty-signatures": True}
+    response = client.algod_request(
+        "POST", "/transactions/simulate",
+        data=msgpack.packb(request, use_bin_type=True),
+        headers={"Content-Type": "application/msgpack"}
+    )
+    group = response["txn-groups"][0]
+    if group.get("failure-message"):
+        raise SimulationError(group["failure-message"])
+    return group["txn-results"][0]["txn-result"]
+
+# Simulate an inventory method on a product and return its decoded events
+def simulate_inventory_method(client, sender, app_id, method, product_id, decoder=None):
+    decoder = decoder or EventDecoder()
+    app_args = [method_selector(inventory_methods, method), product_id.to_bytes(8, "big")]
+    txinfo = simulate_app_call(client, sender, app_id, app_args, boxes=[(app_id, product_box_name(product_id))])
+    return decoder.decode_txinfo(txinfo)
+
+def main():
+    parser = argparse.ArgumentParser(description='Read inventory records without sending transactions')
+    parser.add_argument('--action', default='check_inventory', choices=['check_inventory', 'audit'],
+                        help='Read to perform for each product')
+    parser.add_argument('--product_ids', nargs='+', type=int, required=True, help='Products to read')
+    parser.add_argument('--app_ids', default='app_ids.json', help='Path of the deployed app IDs')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Run the contract method with simulate instead of reading the boxes')
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.app_ids, "r") as f:
+            app_id = json.load(f)["inventory_app_id"]
+    except (OSError, ValueError, KeyError):
+        print(f"Error: {args.app_ids} not found. Please run deploy.py first.")
+        return
+
+    client = get_algod_client()
+    start = time.perf_counter()
+    if args.simulate:
+        # simulate needs a sender; no signature is made with its key
+        try:
+            with open("account.json", "r") as f:
+                sender = account.address_from_private_key(mnemonic.to_private_key(json.load(f)["mnemonic"]))
+        except (OSError, ValueError, KeyError):
+            print("Error: account.json not found. Please run deploy.py first.")
+            return
+        for product_id in args.product_ids:
+            try:
+                events = simulate_inventory_method(client, sender, app_id, args.action, product_id)
+            except SimulationError as e:
+                print(f"product {product_id}: rejected ({e})")
+                continue
+            for name, fields in events:
+                print(f"product {product_id}: {name} " + " ".join(
+                    f"{field}={format_field(value)}" for field, value in fields.items()
+                ))
+    else:
+        reader = StateReader(client)
+        read = reader.check_inventory if args.action == 'check_inventory' else reader.audit
+        records = reader.products(app_id, args.product_ids)
+        for product_id in args.product_ids:
+            if records[product_id] is None:
+                print(f"product {product_id}: not found")
+                continue
+            result = read(app_id, product_id)
+            if args.action == 'audit':
+                result = dict(result._asdict(), location=result.location.decode(errors="replace"),
+                              supplier=result.supplier.decode(errors="replace"))
+            print(f"product {product_id}: " + " ".join(f"{field}={value}" for field, value in result.items()))
+    print(f"Read {len(args.product_ids)} products in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Regression tests of the asyncio send path (confirmation trackers, cached
+# suggested params) against the local algod stand-in. Run with:
+# python -m pytest scripts
+
+import asyncio
+import base64
+from algosdk import account
+from algosdk.future.transaction import ApplicationCreateTxn, OnComplete, StateSchema
+from confirmation import AsyncConfirmationTracker, ConfirmationTracker
+from interact_with_contracts import call_app_async, call_app_many_async
+from local_algod import LocalAlgodClient
+
+APPROVAL_PROGRAM = "#pragma version 8\nint 1\nreturn\n"
+
+# asyncio view of a LocalAlgodClient. Every call yields to the event loop,
+# and a send yields again after its block is committed, so other tasks (a
+# shared tracker's scan) run between a send and whatever its caller does next.
+class AsyncLocalClient:
+    def __init__(self, local):
+        self.local = local
+
+    async def algod_request(self, method, requrl, **kwargs):
+        await asyncio.sleep(0)
+        return self.local.algod_request(method, requrl, **kwargs)
+
+    async def status(self):
+        await asyncio.sleep(0)
+        return self.local.status()
+
+    async def status_after_block(self, block_num):
+        while self.local.status()["last-round"] <= block_num:
+            await asyncio.sleep(0.001)
+        return self.local.status()
+
+    async def suggested_params(self):
+        await asyncio.sleep(0)
+        return self.local.suggested_params()
+
+    async def send_transaction(self, txn):
+        await asyncio.sleep(0)
+        tx_id = self.local.send_transaction(txn)
+        await asyncio.sleep(0.01)
+        return tx_id
+
+    async def pending_transaction_info(self, tx_id):
+        await asyncio.sleep(0)
+        return self.local.pending_transaction_info(tx_id)
+
+    async def block_info(self, block_num, response_format="json"):
+        await asyncio.sleep(0)
+        return self.local.block_info(block_num, response_format=response_format)
+
+def create_app(local, private_key):
+    sender = account.address_from_private_key(private_key)
+    program = base64.b64decode(local.compile(APPROVAL_PROGRAM)["result"])
+    txn = ApplicationCreateTxn(
+        sender, local.suggested_params(), OnComplete.NoOpOC.real, program, program,
+        StateSchema(0, 0), StateSchema(0, 0)
+    )
+    tx_id = local.send_transaction(txn.sign(private_key))
+    return ConfirmationTracker(local).wait([tx_id])[0]["application-index"]
+
+def test_concurrent_calls_share_one_async_tracker():
+    private_key, sender = account.generate_account()
+    local = LocalAlgodClient()
+    local.fund(sender, 10_000_000_000)
+    app_id = create_app(local, private_key)
+    client = AsyncLocalClient(local)
+
+    async def run():
+        tracker = AsyncConfirmationTracker(client, wait_rounds=1000)
+        calls = [
+            call_app_async(client, private_key, app_id, [b"call", index.to_bytes(8, "big")], tracker=tracker)
+            for index in range(10)
+        ]
+        return await asyncio.wait_for(asyncio.gather(*calls), timeout=10)
+
+    txinfos = asyncio.run(run())
+    assert len(txinfos) == 10
+    assert all(txinfo["confirmed-round"] > 0 for txinfo in txinfos)
+    assert len({txinfo["confirmed-round"] for txinfo in txinfos}) == 10
+
+def test_async_tracker_resolves_transaction_confirmed_before_wait():
+    private_key, sender = account.generate_account()
+    local = LocalAlgodClient()
+    local.fund(sender, 10_000_000_000)
+    app_id = create_app(local, private_key)
+    client = AsyncLocalClient(local)
+
+    async def run():
+        tracker = AsyncConfirmationTracker(client)
+        first = asyncio.ensure_future(call_app_async(client, private_key, app_id, [b"first"], tracker=tracker))
+        await asyncio.sleep(0.05)
+        second = await asyncio.wait_for(call_app_async(client, private_key, app_id, [b"second"], tracker=tracker), timeout=10)
+        return await asyncio.wait_for(first, timeout=10), second
+
+    first, second = asyncio.run(run())
+    assert first["confirmed-round"] < second["confirmed-round"]
+
+def test_repeated_calls_with_cached_params_get_distinct_transactions():
+    private_key, sender = account.generate_account()
+    local = LocalAlgodClient()
+    local.fund(sender, 10_000_000_000)
+    app_id = create_app(local, private_key)
+    client = AsyncLocalClient(local)
+
+    async def run():
+        calls = call_app_many_async(client, private_key, app_id, [[b"call"]] * 5)
+        return await asyncio.wait_for(calls, timeout=10)
+
+    txinfos = asyncio.run(run())
+    assert len({txinfo["confirmed-round"] for txinfo in txinfos}) == 5
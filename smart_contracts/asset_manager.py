@@ -1,17 +1,46 @@
+from algosdk import encoding
 from pyteal import *
+from events import emit, fixed_bytes
+from router import MethodRouter, TEAL_VERSION
 
-def approval_program():
+# Methods of the approval program; a method's one-byte selector is its index
+METHODS = [
+    "create_asset",
+    "modify_asset",
+    "transfer_asset",
+    "freeze_asset",
+    "burn_asset",
+    "batch_transfer_asset",
+    "batch_freeze_asset"
+]
+
+# Minimum balance the app account needs for each asset it creates and holds
+ASSET_MIN_BALANCE = 100000
+
+# batch_transfer_asset and batch_freeze_asset take packed (asset_id,
+# address, amount or freeze state) records of a uint64, an address and a
+# uint64. A call submits its records as one inner group, and at most
+# MAX_BATCH_RECORDS of them fit in one call's opcode budget.
+ASSET_RECORD_SIZE = 48
+MAX_BATCH_RECORDS = 12
+
+def pack_asset_record(asset_id, address, value):
+    address = encoding.decode_address(address) if isinstance(address, str) else address
+    return asset_id.to_bytes(8, "big") + address + value.to_bytes(8, "big")
+
+# Pack (asset_id, receiver, amount) transfers for batch_transfer_asset
+def pack_asset_transfers(transfers):
+    return b"".join(pack_asset_record(asset_id, receiver, amount) for asset_id, receiver, amount in transfers)
+
+# Pack (asset_id, target, frozen) freezes for batch_freeze_asset
+def pack_asset_freezes(freezes):
+    return b"".join(pack_asset_record(asset_id, target, int(frozen)) for asset_id, target, frozen in freezes)
+
+def router():
     # Global state schema
     # - total_assets: uint64
     # - admin_address: bytes
     
-    # Define application arguments indices
-    CREATE_ASSET = Bytes("create_asset")
-    MODIFY_ASSET = Bytes("modify_asset")
-    TRANSFER_ASSET = Bytes("transfer_asset")
-    FREEZE_ASSET = Bytes("freeze_asset")
-    BURN_ASSET = Bytes("burn_asset")
-    
     # Define global state keys
     total_assets_key = Bytes("total_assets")
     admin_address_key = Bytes("admin_address")
@@ -20,6 +49,13 @@ def approval_program():
     def is_admin():
         return Txn.sender() == App.globalGet(admin_address_key)
     
+    # Asset operations are inner transactions from the app account, which is
+    # the creator, manager, reserve, freeze and clawback of the assets it
+    # creates. Their fees are paid by the calling transaction, and the
+    # assets and accounts they use must be referenced by it.
+    def execute(fields):
+        return InnerTxnBuilder.Execute({**fields, TxnField.fee: Int(0)})
+    
     # On app creation
     on_creation = Seq([
         App.globalPut(total_assets_key, Int(0)),
@@ -27,32 +63,45 @@ def approval_program():
         Return(Int(1))
     ])
     
-    # Create a new asset (ASA)
-    # This function prepares the parameters for an ASA creation transaction
-    # The actual ASA creation will be done in a separate transaction
+    # Create a new asset (ASA) held by the app account. The metadata hash is
+    # optional: an empty argument leaves it unset, and any other value must
+    # be the 32-byte hash itself.
+    metadata_hash = Txn.application_args[7]
     create_asset = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(8)),  # Command + 7 args
+        Assert(Or(Len(metadata_hash) == Int(0), Len(metadata_hash) == Int(32))),
         
         # Extract arguments
         # asset_name, unit_name, total, decimals, default_frozen, url, metadata_hash
-        # These will be used in the frontend to create the actual ASA
-        Log(Concat(
-            Bytes("CREATE_ASSET:"),
-            Txn.application_args[1], # asset_name
-            Bytes(":"),
-            Txn.application_args[2], # unit_name
-            Bytes(":"),
-            Txn.application_args[3], # total
-            Bytes(":"),
-            Txn.application_args[4], # decimals
-            Bytes(":"),
-            Txn.application_args[5], # default_frozen
-            Bytes(":"),
-            Txn.application_args[6], # url
-            Bytes(":"),
-            Txn.application_args[7]  # metadata_hash
-        )),
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields({
+            TxnField.type_enum: TxnType.AssetConfig,
+            TxnField.config_asset_name: Txn.application_args[1],
+            TxnField.config_asset_unit_name: Txn.application_args[2],
+            TxnField.config_asset_total: Btoi(Txn.application_args[3]),
+            TxnField.config_asset_decimals: Btoi(Txn.application_args[4]),
+            TxnField.config_asset_default_frozen: Btoi(Txn.application_args[5]),
+            TxnField.config_asset_url: Txn.application_args[6],
+            TxnField.config_asset_manager: Global.current_application_address(),
+            TxnField.config_asset_reserve: Global.current_application_address(),
+            TxnField.config_asset_freeze: Global.current_application_address(),
+            TxnField.config_asset_clawback: Global.current_application_address(),
+            TxnField.fee: Int(0)
+        }),
+        If(Len(metadata_hash) == Int(32), InnerTxnBuilder.SetField(TxnField.config_asset_metadata_hash, metadata_hash)),
+        InnerTxnBuilder.Submit(),
+        emit(
+            "CreateAsset",
+            InnerTxn.created_asset_id(), # asset_id
+            fixed_bytes(Txn.application_args[1], 32), # asset_name
+            fixed_bytes(Txn.application_args[2], 8), # unit_name
+            Btoi(Txn.application_args[3]), # total
+            Btoi(Txn.application_args[4]), # decimals
+            Btoi(Txn.application_args[5]), # default_frozen
+            fixed_bytes(Txn.application_args[6], 96), # url
+            If(Len(metadata_hash) == Int(32), metadata_hash, BytesZero(Int(32)))  # metadata_hash, zero when unset
+        ),
         
         # Increment total assets
         App.globalPut(total_assets_key, App.globalGet(total_assets_key) + Int(1)),
@@ -60,76 +109,100 @@ def approval_program():
         Return(Int(1))
     ])
     
-    # Modify an existing asset
-    # This function prepares the parameters for an ASA configuration transaction
+    # Modify an existing asset: hand its manager role to a new address. The
+    # other roles keep their current addresses, since a reconfiguration
+    # clears the addresses it leaves out.
+    asset_reserve = AssetParam.reserve(Btoi(Txn.application_args[1]))
+    asset_freeze = AssetParam.freeze(Btoi(Txn.application_args[1]))
+    asset_clawback = AssetParam.clawback(Btoi(Txn.application_args[1]))
     modify_asset = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(3)),  # Command + 2 args
         
         # Extract arguments
         # asset_id, new_manager_addr
-        Log(Concat(
-            Bytes("MODIFY_ASSET:"),
-            Txn.application_args[1], # asset_id
-            Bytes(":"),
+        Assert(Len(Txn.application_args[2]) == Int(32)),
+        asset_reserve,
+        asset_freeze,
+        asset_clawback,
+        Assert(asset_reserve.hasValue()),
+        execute({
+            TxnField.type_enum: TxnType.AssetConfig,
+            TxnField.config_asset: Btoi(Txn.application_args[1]),
+            TxnField.config_asset_manager: Txn.application_args[2],
+            TxnField.config_asset_reserve: asset_reserve.value(),
+            TxnField.config_asset_freeze: asset_freeze.value(),
+            TxnField.config_asset_clawback: asset_clawback.value()
+        }),
+        emit(
+            "ModifyAsset",
+            Btoi(Txn.application_args[1]), # asset_id
             Txn.application_args[2]  # new_manager_addr
-        )),
+        ),
         
         Return(Int(1))
     ])
     
-    # Transfer asset
-    # This function prepares the parameters for an ASA transfer transaction
+    # Transfer asset from the app account; the receiver must be opted in
     transfer_asset = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(4)),  # Command + 3 args
         
         # Extract arguments
         # asset_id, receiver_addr, amount
-        Log(Concat(
-            Bytes("TRANSFER_ASSET:"),
-            Txn.application_args[1], # asset_id
-            Bytes(":"),
+        Assert(Len(Txn.application_args[2]) == Int(32)),
+        execute({
+            TxnField.type_enum: TxnType.AssetTransfer,
+            TxnField.xfer_asset: Btoi(Txn.application_args[1]),
+            TxnField.asset_receiver: Txn.application_args[2],
+            TxnField.asset_amount: Btoi(Txn.application_args[3])
+        }),
+        emit(
+            "TransferAsset",
+            Btoi(Txn.application_args[1]), # asset_id
             Txn.application_args[2], # receiver_addr
-            Bytes(":"),
-            Txn.application_args[3]  # amount
-        )),
+            Btoi(Txn.application_args[3])  # amount
+        ),
         
         Return(Int(1))
     ])
     
-    # Freeze asset
-    # This function prepares the parameters for an ASA freeze transaction
+    # Freeze or unfreeze an account's holding of the asset
     freeze_asset = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(4)),  # Command + 3 args
         
         # Extract arguments
         # asset_id, target_addr, freeze_state
-        Log(Concat(
-            Bytes("FREEZE_ASSET:"),
-            Txn.application_args[1], # asset_id
-            Bytes(":"),
+        Assert(Len(Txn.application_args[2]) == Int(32)),
+        execute({
+            TxnField.type_enum: TxnType.AssetFreeze,
+            TxnField.freeze_asset: Btoi(Txn.application_args[1]),
+            TxnField.freeze_asset_account: Txn.application_args[2],
+            TxnField.freeze_asset_frozen: Btoi(Txn.application_args[3])
+        }),
+        emit(
+            "FreezeAsset",
+            Btoi(Txn.application_args[1]), # asset_id
             Txn.application_args[2], # target_addr
-            Bytes(":"),
-            Txn.application_args[3]  # freeze_state
-        )),
+            Btoi(Txn.application_args[3])  # freeze_state
+        ),
         
         Return(Int(1))
     ])
     
-    # Burn asset (destroy)
-    # This function prepares the parameters for an ASA destroy transaction
+    # Burn asset (destroy); the app account must hold the whole supply
     burn_asset = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(2)),  # Command + 1 arg
         
         # Extract arguments
         # asset_id
-        Log(Concat(
-            Bytes("BURN_ASSET:"),
-            Txn.application_args[1] # asset_id
-        )),
+        execute({
+            TxnField.type_enum: TxnType.AssetConfig,
+            TxnField.config_asset: Btoi(Txn.application_args[1])
+        }),
+        emit("BurnAsset", Btoi(Txn.application_args[1])), # asset_id
         
         # Decrement total assets
         App.globalPut(total_assets_key, App.globalGet(total_assets_key) - Int(1)),
@@ -137,30 +210,90 @@ def approval_program():
         Return(Int(1))
     ])
     
-    # Main router logic
-    program = Cond(
-        [Txn.application_id() == Int(0), on_creation],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
-        [Txn.on_completion() == OnComplete.OptIn, Return(Int(1))],
-        [Txn.application_args[0] == CREATE_ASSET, create_asset],
-        [Txn.application_args[0] == MODIFY_ASSET, modify_asset],
-        [Txn.application_args[0] == TRANSFER_ASSET, transfer_asset],
-        [Txn.application_args[0] == FREEZE_ASSET, freeze_asset],
-        [Txn.application_args[0] == BURN_ASSET, burn_asset]
+    # Run one inner transaction per packed record, all submitted as a single
+    # inner group, and emit the record's event. fields(asset_id, address,
+    # value) gives the inner transaction of a record.
+    record_offset = ScratchVar(TealType.uint64)
+    records = Txn.application_args[1]
+    def batch(fields, event):
+        asset_id = ExtractUint64(records, record_offset.load())
+        address = Extract(records, record_offset.load() + Int(8), Int(32))
+        value = ExtractUint64(records, record_offset.load() + Int(40))
+        return Seq([
+            Assert(is_admin()),
+            Assert(Txn.application_args.length() == Int(2)),  # Command + packed records
+            Assert(Len(records) % Int(ASSET_RECORD_SIZE) == Int(0)),
+            Assert(Len(records) > Int(0)),
+            Assert(Len(records) <= Int(MAX_BATCH_RECORDS * ASSET_RECORD_SIZE)),
+            
+            InnerTxnBuilder.Begin(),
+            For(
+                record_offset.store(Int(0)),
+                record_offset.load() < Len(records),
+                record_offset.store(record_offset.load() + Int(ASSET_RECORD_SIZE))
+            ).Do(Seq([
+                If(record_offset.load() > Int(0), InnerTxnBuilder.Next()),
+                InnerTxnBuilder.SetFields({**fields(asset_id, address, value), TxnField.fee: Int(0)}),
+                # The record is the event's fields in order
+                emit(event, Extract(records, record_offset.load(), Int(ASSET_RECORD_SIZE)))
+            ])),
+            InnerTxnBuilder.Submit(),
+            
+            Return(Int(1))
+        ])
+    
+    # Transfer assets from the app account to many receivers
+    batch_transfer_asset = batch(
+        lambda asset_id, receiver, amount: {
+            TxnField.type_enum: TxnType.AssetTransfer,
+            TxnField.xfer_asset: asset_id,
+            TxnField.asset_receiver: receiver,
+            TxnField.asset_amount: amount
+        },
+        "TransferAsset"
+    )
+    
+    # Freeze or unfreeze the holdings of many accounts
+    batch_freeze_asset = batch(
+        lambda asset_id, target, frozen: {
+            TxnField.type_enum: TxnType.AssetFreeze,
+            TxnField.freeze_asset: asset_id,
+            TxnField.freeze_asset_account: target,
+            TxnField.freeze_asset_frozen: frozen
+        },
+        "FreezeAsset"
     )
     
-    return program
+    # Main router logic
+    return MethodRouter(
+        METHODS,
+        {
+            "create_asset": create_asset,
+            "modify_asset": modify_asset,
+            "transfer_asset": transfer_asset,
+            "freeze_asset": freeze_asset,
+            "burn_asset": burn_asset,
+            "batch_transfer_asset": batch_transfer_asset,
+            "batch_freeze_asset": batch_freeze_asset
+        },
+        on_creation=on_creation,
+        on_delete=Return(is_admin()),
+        on_update=Return(is_admin()),
+        on_close_out=Return(Int(1)),
+        on_opt_in=Return(Int(1))
+    )
+
+def approval_program():
+    return router().compile()
 
 def clear_state_program():
     return Return(Int(1))
 
 if __name__ == "__main__":
     with open("asset_approval.teal", "w") as f:
-        compiled = compileTeal(approval_program(), Mode.Application, version=6)
+        compiled = approval_program()
         f.write(compiled)
         
     with open("asset_clear.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), Mode.Application, version=6)
+        compiled = compileTeal(clear_state_program(), Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
\ No newline at end of file
@@ -0,0 +1,95 @@
+from algosdk.encoding import checksum
+from pyteal import *
+
+# ARC-28 events emitted by the contracts. Each log is the event's 4-byte
+# selector followed by its ABI-encoded fields. Fields are fixed-width
+# (uint64, address, byte[N]) except for an optional trailing uint64[] list,
+# so every field of an event sits at a fixed offset.
+EVENTS = {
+    # inventory_contract
+    "ReorderNeeded": [("product_id", "uint64"), ("quantity", "uint64"), ("min_threshold", "uint64")],
+    "ReorderNeededBatch": [("product_ids", "uint64[]")],
+    "InventoryChecked": [("product_id", "uint64"), ("quantity", "uint64"), ("min_threshold", "uint64")],
+    "ProductAudited": [
+        ("product_id", "uint64"),
+        ("quantity", "uint64"),
+        ("last_updated", "uint64"),
+        ("min_threshold", "uint64"),
+        ("price", "uint64"),
+        ("expiration", "uint64"),
+        ("location", "byte[32]"),
+        ("supplier", "byte[32]")
+    ],
+    # asset_manager
+    "CreateAsset": [
+        ("asset_id", "uint64"),
+        ("asset_name", "byte[32]"),
+        ("unit_name", "byte[8]"),
+        ("total", "uint64"),
+        ("decimals", "uint64"),
+        ("default_frozen", "uint64"),
+        ("url", "byte[96]"),
+        ("metadata_hash", "byte[32]")
+    ],
+    "ModifyAsset": [("asset_id", "uint64"), ("manager", "address")],
+    "TransferAsset": [("asset_id", "uint64"), ("receiver", "address"), ("amount", "uint64")],
+    "FreezeAsset": [("asset_id", "uint64"), ("target", "address"), ("frozen", "uint64")],
+    "BurnAsset": [("asset_id", "uint64")],
+    # oracle_contract
+    "InventoryCheckPerformed": [("timestamp", "uint64")],
+    "InventoryValuationUpdated": [
+        ("timestamp", "uint64"),
+        ("total_units", "uint64"),
+        ("total_value", "uint64"),
+        ("low_stock_count", "uint64")
+    ],
+    "PerformanceMetricsComputed": [("timestamp", "uint64")],
+    # security_contract
+    "DataBackupInitiated": [("timestamp", "uint64")],
+    "RoleChanged": [("user", "address"), ("role", "uint64")]
+}
+
+# Size in bytes of a fixed-width field type
+def field_size(field_type):
+    if field_type == "uint64":
+        return 8
+    if field_type == "address":
+        return 32
+    if field_type.startswith("byte[") and field_type.endswith("]"):
+        return int(field_type[5:-1])
+    raise ValueError(f"Unsupported event field type {field_type}")
+
+# ARC-28 signature of an event, e.g. "ReorderNeeded(uint64,uint64,uint64)"
+def event_signature(name):
+    return f"{name}({','.join(field_type for _, field_type in EVENTS[name])})"
+
+# First 4 bytes of the SHA-512/256 hash of the event signature
+def event_selector(name):
+    return checksum(event_signature(name).encode())[:4]
+
+# Zero-pad a byte expression to a fixed field width
+def fixed_bytes(value, width):
+    return Seq([
+        Assert(Len(value) <= Int(width)),
+        Concat(value, BytesZero(Int(width) - Len(value)))
+    ])
+
+# Log an event. Values are the encoded fields in order: uint64 expressions
+# are converted with Itob, byte expressions are used as they are and may
+# cover several consecutive fields. A trailing uint64[] field takes the
+# packed 8-byte elements; its ABI offset and length are added here.
+def emit(name, *values):
+    fields = EVENTS[name]
+    parts = [Bytes(event_selector(name))]
+    for value in values:
+        parts.append(Itob(value) if value.type_of() == TealType.uint64 else value)
+
+    if fields and fields[-1][1] == "uint64[]":
+        head_size = sum(field_size(field_type) for _, field_type in fields[:-1]) + 2
+        elements = parts.pop()
+        parts += [
+            Bytes(head_size.to_bytes(2, "big")),
+            Extract(Itob(Len(elements) / Int(8)), Int(6), Int(2)),
+            elements
+        ]
+    return Log(Concat(*parts))
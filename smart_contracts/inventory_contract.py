@@ -1,47 +1,98 @@
 from pyteal import *
+from events import emit, fixed_bytes
+from router import MethodRouter, TEAL_VERSION
 
-def approval_program():
+# Methods of the approval program; a method's one-byte selector is its index
+METHODS = [
+    "create_product",
+    "update_quantity",
+    "reorder",
+    "check_inventory",
+    "update_price",
+    "update_location",
+    "audit",
+    "batch_update_quantity",
+    "set_oracle_address"
+]
+
+# Product records live in boxes named by the 8-byte product ID (as sent in
+# the call arguments). Every record has the same packed layout, so each
+# field sits at a fixed offset:
+# - quantity: uint64
+# - last_updated: uint64
+# - min_threshold: uint64
+# - price: uint64
+# - expiration: uint64
+# - location: bytes, zero-padded
+# - supplier: bytes, zero-padded
+QUANTITY_OFFSET = 0
+LAST_UPDATED_OFFSET = 8
+MIN_THRESHOLD_OFFSET = 16
+PRICE_OFFSET = 24
+EXPIRATION_OFFSET = 32
+LOCATION_OFFSET = 40
+SUPPLIER_OFFSET = 72
+TEXT_FIELD_SIZE = 32
+PRODUCT_RECORD_SIZE = 104
+
+# batch_update_quantity takes packed (product_id, quantity) records of two uint64s
+BATCH_RECORD_SIZE = 16
+
+# Global keys of the running totals over all products, which other apps read
+# with app_global_get_ex
+TOTAL_UNITS_KEY = "total_units"
+TOTAL_VALUE_KEY = "total_value"
+LOW_STOCK_COUNT_KEY = "low_stock_count"
+
+# Minimum balance the app account needs for each product box
+PRODUCT_BOX_MIN_BALANCE = 2500 + 400 * (8 + PRODUCT_RECORD_SIZE)
+
+# Box name of a product
+def product_box_name(product_id):
+    return product_id.to_bytes(8, "big")
+
+# Pack (product_id, quantity) pairs for batch_update_quantity
+def pack_quantity_updates(updates):
+    return b"".join(product_id.to_bytes(8, "big") + quantity.to_bytes(8, "big") for product_id, quantity in updates)
+
+# Decode a product record read from its box
+def decode_product_record(record):
+    def uint(offset):
+        return int.from_bytes(record[offset:offset + 8], "big")
+
+    def text(offset):
+        return record[offset:offset + TEXT_FIELD_SIZE].rstrip(b"\0")
+
+    return {
+        "quantity": uint(QUANTITY_OFFSET),
+        "last_updated": uint(LAST_UPDATED_OFFSET),
+        "min_threshold": uint(MIN_THRESHOLD_OFFSET),
+        "price": uint(PRICE_OFFSET),
+        "expiration": uint(EXPIRATION_OFFSET),
+        "location": text(LOCATION_OFFSET),
+        "supplier": text(SUPPLIER_OFFSET)
+    }
+
+def router():
     # Global state schema
     # - total_products: uint64
+    # - total_units: uint64 (sum of quantities)
+    # - total_value: uint64 (sum of quantity * price)
+    # - low_stock_count: uint64 (products below their threshold)
     # - admin_address: bytes
     # - oracle_address: bytes
     
-    # Local state schema (per product)
-    # - product_id: uint64
-    # - quantity: uint64
-    # - min_threshold: uint64
-    # - price: uint64
-    # - location: bytes
-    # - last_updated: uint64
-    # - expiration: uint64
-    # - supplier: bytes
-    
     # App creation arguments
     # - admin_address: bytes
-    
-    # Define application arguments indices
-    CREATE_PRODUCT = Bytes("create_product")
-    UPDATE_QUANTITY = Bytes("update_quantity")
-    REORDER = Bytes("reorder")
-    CHECK_INVENTORY = Bytes("check_inventory")
-    UPDATE_PRICE = Bytes("update_price")
-    UPDATE_LOCATION = Bytes("update_location")
-    AUDIT = Bytes("audit")
+    # - oracle_address: bytes
     
     # Define global state keys
     total_products_key = Bytes("total_products")
     admin_address_key = Bytes("admin_address")
     oracle_address_key = Bytes("oracle_address")
-    
-    # Define local state keys
-    product_id_key = Bytes("product_id")
-    quantity_key = Bytes("quantity")
-    min_threshold_key = Bytes("min_threshold")
-    price_key = Bytes("price")
-    location_key = Bytes("location")
-    last_updated_key = Bytes("last_updated")
-    expiration_key = Bytes("expiration")
-    supplier_key = Bytes("supplier")
+    total_units_key = Bytes(TOTAL_UNITS_KEY)
+    total_value_key = Bytes(TOTAL_VALUE_KEY)
+    low_stock_count_key = Bytes(LOW_STOCK_COUNT_KEY)
     
     # Helper function to check if sender is admin
     def is_admin():
@@ -51,13 +102,48 @@ def approval_program():
     def is_oracle():
         return Txn.sender() == App.globalGet(oracle_address_key)
     
-    # Helper function to check if product exists
-    def product_exists(product_id):
-        return App.localGet(Txn.sender(), product_id_key) != Int(0)
+    # Box of the product named by the first method argument
+    def product_box():
+        return Txn.application_args[1]
+    
+    # Read a uint64 field of the product record
+    def product_uint(offset):
+        return Btoi(App.box_extract(product_box(), Int(offset), Int(8)))
+    
+    # Write a uint64 field together with last_updated. Quantity and
+    # last_updated are adjacent, so quantity updates are a single write.
+    def set_product_uint(offset, value):
+        if offset == QUANTITY_OFFSET:
+            return App.box_replace(product_box(), Int(QUANTITY_OFFSET), Concat(Itob(value), Itob(Global.latest_timestamp())))
+        return Seq([
+            App.box_replace(product_box(), Int(offset), Itob(value)),
+            App.box_replace(product_box(), Int(LAST_UPDATED_OFFSET), Itob(Global.latest_timestamp()))
+        ])
+    
+    # Move the running totals from a product's old quantity and price to
+    # its new ones. Arguments are evaluated more than once, so pass scratch
+    # loads or constants.
+    def update_totals(old_quantity, old_price, new_quantity, new_price, min_threshold):
+        return Seq([
+            App.globalPut(total_units_key, App.globalGet(total_units_key) - old_quantity + new_quantity),
+            App.globalPut(total_value_key, App.globalGet(total_value_key) - old_quantity * old_price + new_quantity * new_price),
+            App.globalPut(
+                low_stock_count_key,
+                App.globalGet(low_stock_count_key) - (old_quantity < min_threshold) + (new_quantity < min_threshold)
+            )
+        ])
+    
+    # Quantity, last_updated, min_threshold and price are the first 32 bytes
+    # of a record, so one box read gets the fields the totals depend on
+    def record_head(box):
+        return App.box_extract(box, Int(0), Int(PRICE_OFFSET + 8))
     
     # On app creation
     on_creation = Seq([
         App.globalPut(total_products_key, Int(0)),
+        App.globalPut(total_units_key, Int(0)),
+        App.globalPut(total_value_key, Int(0)),
+        App.globalPut(low_stock_count_key, Int(0)),
         App.globalPut(admin_address_key, Txn.application_args[0]),
         App.globalPut(oracle_address_key, Txn.application_args[1]),
         Return(Int(1))
@@ -67,45 +153,69 @@ def approval_program():
     create_product = Seq([
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(7)),  # Command + 6 args
+        Assert(Len(product_box()) == Int(8)),
         
         # Extract arguments
         # product_id, min_threshold, price, location, expiration, supplier
-        App.localPut(Txn.sender(), product_id_key, Btoi(Txn.application_args[1])),
-        App.localPut(Txn.sender(), quantity_key, Int(0)),
-        App.localPut(Txn.sender(), min_threshold_key, Btoi(Txn.application_args[2])),
-        App.localPut(Txn.sender(), price_key, Btoi(Txn.application_args[3])),
-        App.localPut(Txn.sender(), location_key, Txn.application_args[4]),
-        App.localPut(Txn.sender(), last_updated_key, Global.latest_timestamp()),
-        App.localPut(Txn.sender(), expiration_key, Btoi(Txn.application_args[5])),
-        App.localPut(Txn.sender(), supplier_key, Txn.application_args[6]),
-        
-        # Increment total products
+        # box_create fails the call if the product already exists
+        Assert(App.box_create(product_box(), Int(PRODUCT_RECORD_SIZE))),
+        App.box_replace(product_box(), Int(0), Concat(
+            Itob(Int(0)),
+            Itob(Global.latest_timestamp()),
+            Itob(Btoi(Txn.application_args[2])),
+            Itob(Btoi(Txn.application_args[3])),
+            Itob(Btoi(Txn.application_args[5])),
+            fixed_bytes(Txn.application_args[4], TEXT_FIELD_SIZE),
+            fixed_bytes(Txn.application_args[6], TEXT_FIELD_SIZE)
+        )),
+        
+        # Increment total products; a new product has no stock yet, so it
+        # is below any non-zero threshold
         App.globalPut(total_products_key, App.globalGet(total_products_key) + Int(1)),
+        App.globalPut(
+            low_stock_count_key,
+            App.globalGet(low_stock_count_key) + (Int(0) < Btoi(Txn.application_args[2]))
+        ),
         
         Return(Int(1))
     ])
     
-    # Update product quantity
+    # Fields of the product being changed, read once from its record head
+    head = ScratchVar(TealType.bytes)
+    old_quantity = ScratchVar(TealType.uint64)
+    new_quantity = ScratchVar(TealType.uint64)
+    min_threshold = ScratchVar(TealType.uint64)
+    price = ScratchVar(TealType.uint64)
+    
+    def load_head(box):
+        return Seq([
+            head.store(record_head(box)),
+            old_quantity.store(ExtractUint64(head.load(), Int(QUANTITY_OFFSET))),
+            min_threshold.store(ExtractUint64(head.load(), Int(MIN_THRESHOLD_OFFSET))),
+            price.store(ExtractUint64(head.load(), Int(PRICE_OFFSET)))
+        ])
+    
+    # Update product quantity. Reads and writes fail if the product box does
+    # not exist.
     update_quantity = Seq([
         Assert(Or(is_admin(), is_oracle())),
         Assert(Txn.application_args.length() == Int(3)),  # Command + 2 args
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
         # Extract arguments
         # product_id, new_quantity
-        App.localPut(Txn.sender(), quantity_key, Btoi(Txn.application_args[2])),
-        App.localPut(Txn.sender(), last_updated_key, Global.latest_timestamp()),
+        load_head(product_box()),
+        new_quantity.store(Btoi(Txn.application_args[2])),
+        App.box_replace(product_box(), Int(QUANTITY_OFFSET), Concat(Itob(new_quantity.load()), Itob(Global.latest_timestamp()))),
+        update_totals(old_quantity.load(), price.load(), new_quantity.load(), price.load(), min_threshold.load()),
         
         # Check if quantity is below threshold and trigger reorder if needed
         If(
-            Btoi(Txn.application_args[2]) < App.localGet(Txn.sender(), min_threshold_key),
+            new_quantity.load() < min_threshold.load(),
             # Trigger reorder logic
             Seq([
                 # In a real implementation, this would call an oracle or external service
-                # For now, we just log the reorder event
-                Log(Concat(Bytes("REORDER NEEDED: "), Txn.application_args[1])),
+                # For now, we just emit the reorder event
+                emit("ReorderNeeded", product_box(), new_quantity.load(), min_threshold.load()),
                 Return(Int(1))
             ]),
             Return(Int(1))
@@ -117,19 +227,14 @@ def approval_program():
         Assert(Or(is_admin(), is_oracle())),
         Assert(Txn.application_args.length() == Int(3)),  # Command + 2 args
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
         # Extract arguments
         # product_id, reorder_quantity
         # In a real implementation, this would initiate a transaction to the supplier
         # For now, we just update the quantity
-        App.localPut(
-            Txn.sender(), 
-            quantity_key, 
-            App.localGet(Txn.sender(), quantity_key) + Btoi(Txn.application_args[2])
-        ),
-        App.localPut(Txn.sender(), last_updated_key, Global.latest_timestamp()),
+        load_head(product_box()),
+        new_quantity.store(old_quantity.load() + Btoi(Txn.application_args[2])),
+        set_product_uint(QUANTITY_OFFSET, new_quantity.load()),
+        update_totals(old_quantity.load(), price.load(), new_quantity.load(), price.load(), min_threshold.load()),
         
         Return(Int(1))
     ])
@@ -139,15 +244,13 @@ def approval_program():
         Assert(Or(is_admin(), is_oracle())),
         Assert(Txn.application_args.length() == Int(2)),  # Command + 1 arg
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
-        # Return the current quantity (via log for now)
-        Log(Concat(
-            Bytes("Product ID: "), Txn.application_args[1],
-            Bytes(", Quantity: "), Itob(App.localGet(Txn.sender(), quantity_key)),
-            Bytes(", Min Threshold: "), Itob(App.localGet(Txn.sender(), min_threshold_key))
-        )),
+        # Return the current quantity (via an event for now)
+        emit(
+            "InventoryChecked",
+            product_box(),
+            App.box_extract(product_box(), Int(QUANTITY_OFFSET), Int(8)),
+            App.box_extract(product_box(), Int(MIN_THRESHOLD_OFFSET), Int(8))
+        ),
         
         Return(Int(1))
     ])
@@ -157,13 +260,15 @@ def approval_program():
         Assert(is_admin()),
         Assert(Txn.application_args.length() == Int(3)),  # Command + 2 args
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
         # Extract arguments
         # product_id, new_price
-        App.localPut(Txn.sender(), price_key, Btoi(Txn.application_args[2])),
-        App.localPut(Txn.sender(), last_updated_key, Global.latest_timestamp()),
+        load_head(product_box()),
+        set_product_uint(PRICE_OFFSET, Btoi(Txn.application_args[2])),
+        App.globalPut(
+            total_value_key,
+            App.globalGet(total_value_key) - old_quantity.load() * price.load()
+            + old_quantity.load() * Btoi(Txn.application_args[2])
+        ),
         
         Return(Int(1))
     ])
@@ -173,13 +278,10 @@ def approval_program():
         Assert(Or(is_admin(), is_oracle())),
         Assert(Txn.application_args.length() == Int(3)),  # Command + 2 args
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
         # Extract arguments
         # product_id, new_location
-        App.localPut(Txn.sender(), location_key, Txn.application_args[2]),
-        App.localPut(Txn.sender(), last_updated_key, Global.latest_timestamp()),
+        App.box_replace(product_box(), Int(LOCATION_OFFSET), fixed_bytes(Txn.application_args[2], TEXT_FIELD_SIZE)),
+        App.box_replace(product_box(), Int(LAST_UPDATED_OFFSET), Itob(Global.latest_timestamp())),
         
         Return(Int(1))
     ])
@@ -189,48 +291,111 @@ def approval_program():
         Assert(Or(is_admin(), is_oracle())),
         Assert(Txn.application_args.length() == Int(2)),  # Command + 1 arg
         
-        # Check if product exists
-        Assert(product_exists(Btoi(Txn.application_args[1]))),
-        
-        # Log all product information for audit
-        Log(Concat(
-            Bytes("AUDIT - Product ID: "), Txn.application_args[1],
-            Bytes(", Quantity: "), Itob(App.localGet(Txn.sender(), quantity_key)),
-            Bytes(", Price: "), Itob(App.localGet(Txn.sender(), price_key)),
-            Bytes(", Location: "), App.localGet(Txn.sender(), location_key),
-            Bytes(", Last Updated: "), Itob(App.localGet(Txn.sender(), last_updated_key)),
-            Bytes(", Expiration: "), Itob(App.localGet(Txn.sender(), expiration_key))
-        )),
+        # Emit all product information for audit; the event fields after the
+        # product ID follow the record layout, so the record is logged whole
+        emit("ProductAudited", product_box(), App.box_extract(product_box(), Int(0), Int(PRODUCT_RECORD_SIZE))),
+        
+        Return(Int(1))
+    ])
+    
+    # Update the quantities of many products in one call. The argument is a
+    # packed array of (product_id, quantity) records; every product's box
+    # must be referenced somewhere in the group. Products that fall below
+    # their threshold are reported together in a single event. The running
+    # totals are kept in scratch during the loop and written once; products
+    # now below their threshold are counted from the reported list.
+    record_offset = ScratchVar(TealType.uint64)
+    record_box = ScratchVar(TealType.bytes)
+    low_stock = ScratchVar(TealType.bytes)
+    timestamp = ScratchVar(TealType.bytes)
+    total_units = ScratchVar(TealType.uint64)
+    total_value = ScratchVar(TealType.uint64)
+    low_stock_count = ScratchVar(TealType.uint64)
+    records = Txn.application_args[1]
+    batch_update_quantity = Seq([
+        Assert(Or(is_admin(), is_oracle())),
+        Assert(Txn.application_args.length() == Int(2)),  # Command + packed records
+        Assert(Len(records) % Int(BATCH_RECORD_SIZE) == Int(0)),
+        
+        low_stock.store(Bytes("")),
+        timestamp.store(Itob(Global.latest_timestamp())),
+        total_units.store(App.globalGet(total_units_key)),
+        total_value.store(App.globalGet(total_value_key)),
+        low_stock_count.store(App.globalGet(low_stock_count_key)),
+        For(
+            record_offset.store(Int(0)),
+            record_offset.load() < Len(records),
+            record_offset.store(record_offset.load() + Int(BATCH_RECORD_SIZE))
+        ).Do(Seq([
+            record_box.store(Extract(records, record_offset.load(), Int(8))),
+            load_head(record_box.load()),
+            new_quantity.store(ExtractUint64(records, record_offset.load() + Int(8))),
+            App.box_replace(record_box.load(), Int(QUANTITY_OFFSET), Concat(Itob(new_quantity.load()), timestamp.load())),
+            total_units.store(total_units.load() - old_quantity.load() + new_quantity.load()),
+            total_value.store(total_value.load() - old_quantity.load() * price.load() + new_quantity.load() * price.load()),
+            low_stock_count.store(low_stock_count.load() - (old_quantity.load() < min_threshold.load())),
+            If(
+                new_quantity.load() < min_threshold.load(),
+                low_stock.store(Concat(low_stock.load(), record_box.load()))
+            )
+        ])),
+        
+        App.globalPut(total_units_key, total_units.load()),
+        App.globalPut(total_value_key, total_value.load()),
+        App.globalPut(low_stock_count_key, low_stock_count.load() + Len(low_stock.load()) / Int(8)),
+        If(
+            Len(low_stock.load()) > Int(0),
+            emit("ReorderNeededBatch", low_stock.load())
+        ),
+        Return(Int(1))
+    ])
+    
+    # Change the oracle address, e.g. to the oracle app's account so its
+    # inner calls are accepted
+    set_oracle_address = Seq([
+        Assert(is_admin()),
+        Assert(Txn.application_args.length() == Int(2)),  # Command + 1 arg
+        Assert(Len(Txn.application_args[1]) == Int(32)),
+        
+        # Extract arguments
+        # oracle_address
+        App.globalPut(oracle_address_key, Txn.application_args[1]),
         
         Return(Int(1))
     ])
     
     # Main router logic
-    program = Cond(
-        [Txn.application_id() == Int(0), on_creation],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
-        [Txn.on_completion() == OnComplete.OptIn, Return(Int(1))],
-        [Txn.application_args[0] == CREATE_PRODUCT, create_product],
-        [Txn.application_args[0] == UPDATE_QUANTITY, update_quantity],
-        [Txn.application_args[0] == REORDER, reorder],
-        [Txn.application_args[0] == CHECK_INVENTORY, check_inventory],
-        [Txn.application_args[0] == UPDATE_PRICE, update_price],
-        [Txn.application_args[0] == UPDATE_LOCATION, update_location],
-        [Txn.application_args[0] == AUDIT, audit]
+    return MethodRouter(
+        METHODS,
+        {
+            "create_product": create_product,
+            "update_quantity": update_quantity,
+            "reorder": reorder,
+            "check_inventory": check_inventory,
+            "update_price": update_price,
+            "update_location": update_location,
+            "audit": audit,
+            "batch_update_quantity": batch_update_quantity,
+            "set_oracle_address": set_oracle_address
+        },
+        on_creation=on_creation,
+        on_delete=Return(is_admin()),
+        on_update=Return(is_admin()),
+        on_close_out=Return(Int(1)),
+        on_opt_in=Return(Int(1))
     )
-    
-    return program
+
+def approval_program():
+    return router().compile()
 
 def clear_state_program():
     return Return(Int(1))
 
 if __name__ == "__main__":
     with open("inventory_approval.teal", "w") as f:
-        compiled = compileTeal(approval_program(), Mode.Application, version=6)
+        compiled = approval_program()
         f.write(compiled)
         
     with open("inventory_clear.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), Mode.Application, version=6)
+        compiled = compileTeal(clear_state_program(), Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
\ No newline at end of file
@@ -1,6 +1,24 @@
 from pyteal import *
+from events import emit
+from inventory_contract import METHODS as INVENTORY_METHODS, LOW_STOCK_COUNT_KEY, TOTAL_UNITS_KEY, TOTAL_VALUE_KEY
+from router import MethodRouter, TEAL_VERSION, method_selector
 
-def approval_program():
+# Methods of the approval program; a method's one-byte selector is its index
+METHODS = [
+    "register_inventory_app",
+    "register_asset_manager",
+    "set_check_interval",
+    "perform_check",
+    "update_valuation",
+    "compute_metrics",
+    "tick"
+]
+
+# tick takes an optional packed list of 8-byte product IDs to check in the
+# inventory app
+TICK_RECORD_SIZE = 8
+
+def router():
     # Global state schema
     # - admin_address: bytes
     # - inventory_app_id: uint64
@@ -8,14 +26,6 @@ def approval_program():
     # - last_check_timestamp: uint64
     # - check_interval: uint64 (in seconds)
     
-    # Define application arguments indices
-    REGISTER_INVENTORY_APP = Bytes("register_inventory_app")
-    REGISTER_ASSET_MANAGER = Bytes("register_asset_manager")
-    SET_CHECK_INTERVAL = Bytes("set_check_interval")
-    PERFORM_CHECK = Bytes("perform_check")
-    UPDATE_VALUATION = Bytes("update_valuation")
-    COMPUTE_METRICS = Bytes("compute_metrics")
-    
     # Define global state keys
     admin_address_key = Bytes("admin_address")
     inventory_app_id_key = Bytes("inventory_app_id")
@@ -27,6 +37,28 @@ def approval_program():
     def is_admin():
         return Txn.sender() == App.globalGet(admin_address_key)
     
+    # Helper function to check if the check interval has elapsed
+    def check_due():
+        return Global.latest_timestamp() >= App.globalGet(last_check_timestamp_key) + App.globalGet(check_interval_key)
+    
+    # A running total kept in the registered inventory app's global state, or
+    # 0 when it has none, as an 8-byte event field; the inventory app must be
+    # referenced by the call
+    def inventory_total(key):
+        total = App.globalGetEx(App.globalGet(inventory_app_id_key), Bytes(key))
+        return Seq([total, Itob(If(total.hasValue(), total.value(), Int(0)))])
+    
+    # Valuation event from the inventory app's running totals, read in O(1)
+    # however many products there are
+    def emit_valuation():
+        return emit(
+            "InventoryValuationUpdated",
+            Global.latest_timestamp(),
+            inventory_total(TOTAL_UNITS_KEY),
+            inventory_total(TOTAL_VALUE_KEY),
+            inventory_total(LOW_STOCK_COUNT_KEY)
+        )
+    
     # On app creation
     on_creation = Seq([
         App.globalPut(admin_address_key, Txn.application_args[0]),
@@ -80,14 +112,14 @@ def approval_program():
         
         # Check if it's time to perform a check
         If(
-            Global.latest_timestamp() >= App.globalGet(last_check_timestamp_key) + App.globalGet(check_interval_key),
+            check_due(),
             Seq([
                 # Update last check timestamp
                 App.globalPut(last_check_timestamp_key, Global.latest_timestamp()),
                 
                 # In a real implementation, this would call the inventory app to check stock levels
-                # For now, we just log the check event
-                Log(Bytes("INVENTORY CHECK PERFORMED")),
+                # For now, we just emit the check event
+                emit("InventoryCheckPerformed", Global.latest_timestamp()),
                 
                 Return(Int(1))
             ]),
@@ -97,51 +129,101 @@ def approval_program():
     
     # Update inventory valuation
     update_valuation = Seq([
-        Assert(Or(is_admin(), Global.latest_timestamp() >= App.globalGet(last_check_timestamp_key) + App.globalGet(check_interval_key))),
+        Assert(Or(is_admin(), check_due())),
         
-        # In a real implementation, this would calculate the total value of inventory
-        # For now, we just log the valuation event
-        Log(Bytes("INVENTORY VALUATION UPDATED")),
+        emit_valuation(),
         
         Return(Int(1))
     ])
     
     # Compute performance metrics
     compute_metrics = Seq([
-        Assert(Or(is_admin(), Global.latest_timestamp() >= App.globalGet(last_check_timestamp_key) + App.globalGet(check_interval_key))),
+        Assert(Or(is_admin(), check_due())),
         
         # In a real implementation, this would calculate various performance metrics
-        # For now, we just log the metrics event
-        Log(Bytes("PERFORMANCE METRICS COMPUTED")),
+        # For now, we just emit the metrics event
+        emit("PerformanceMetricsComputed", Global.latest_timestamp()),
+        
+        Return(Int(1))
+    ])
+    
+    # Run a full check cycle in one call. The check stage only runs when the
+    # interval has passed, like perform_check: it restarts the interval and,
+    # given packed product IDs, checks each product with an inner
+    # check_inventory call to the registered inventory app (the call must
+    # reference the inventory app and the product boxes, and its fee must
+    # cover the inner calls). The valuation and metrics stages then run,
+    # which the admin may also trigger before the check is due. Whether the
+    # check is due is evaluated once, before the check stage moves
+    # last_check_timestamp.
+    product_ids = Txn.application_args[1]
+    product_offset = ScratchVar(TealType.uint64)
+    tick_check_due = ScratchVar(TealType.uint64)
+    tick = Seq([
+        tick_check_due.store(check_due()),
+        Assert(Or(tick_check_due.load(), is_admin())),
+        
+        If(tick_check_due.load(), Seq([
+            App.globalPut(last_check_timestamp_key, Global.latest_timestamp()),
+            emit("InventoryCheckPerformed", Global.latest_timestamp()),
+            
+            If(Txn.application_args.length() == Int(2), Seq([
+                Assert(App.globalGet(inventory_app_id_key) != Int(0)),
+                Assert(Len(product_ids) % Int(TICK_RECORD_SIZE) == Int(0)),
+                For(
+                    product_offset.store(Int(0)),
+                    product_offset.load() < Len(product_ids),
+                    product_offset.store(product_offset.load() + Int(TICK_RECORD_SIZE))
+                ).Do(
+                    InnerTxnBuilder.Execute({
+                        TxnField.type_enum: TxnType.ApplicationCall,
+                        TxnField.application_id: App.globalGet(inventory_app_id_key),
+                        TxnField.application_args: [
+                            Bytes(method_selector(INVENTORY_METHODS, "check_inventory")),
+                            Extract(product_ids, product_offset.load(), Int(TICK_RECORD_SIZE))
+                        ],
+                        TxnField.fee: Int(0)
+                    })
+                )
+            ]))
+        ])),
+        
+        emit_valuation(),
+        emit("PerformanceMetricsComputed", Global.latest_timestamp()),
         
         Return(Int(1))
     ])
     
     # Main router logic
-    program = Cond(
-        [Txn.application_id() == Int(0), on_creation],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
-        [Txn.on_completion() == OnComplete.OptIn, Return(Int(1))],
-        [Txn.application_args[0] == REGISTER_INVENTORY_APP, register_inventory_app],
-        [Txn.application_args[0] == REGISTER_ASSET_MANAGER, register_asset_manager],
-        [Txn.application_args[0] == SET_CHECK_INTERVAL, set_check_interval],
-        [Txn.application_args[0] == PERFORM_CHECK, perform_check],
-        [Txn.application_args[0] == UPDATE_VALUATION, update_valuation],
-        [Txn.application_args[0] == COMPUTE_METRICS, compute_metrics]
+    return MethodRouter(
+        METHODS,
+        {
+            "register_inventory_app": register_inventory_app,
+            "register_asset_manager": register_asset_manager,
+            "set_check_interval": set_check_interval,
+            "perform_check": perform_check,
+            "update_valuation": update_valuation,
+            "compute_metrics": compute_metrics,
+            "tick": tick
+        },
+        on_creation=on_creation,
+        on_delete=Return(is_admin()),
+        on_update=Return(is_admin()),
+        on_close_out=Return(Int(1)),
+        on_opt_in=Return(Int(1))
     )
-    
-    return program
+
+def approval_program():
+    return router().compile()
 
 def clear_state_program():
     return Return(Int(1))
 
 if __name__ == "__main__":
     with open("oracle_approval.teal", "w") as f:
-        compiled = compileTeal(approval_program(), Mode.Application, version=6)
+        compiled = approval_program()
         f.write(compiled)
         
     with open("oracle_clear.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), Mode.Application, version=6)
+        compiled = compileTeal(clear_state_program(), Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
\ No newline at end of file
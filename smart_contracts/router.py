@@ -0,0 +1,111 @@
+import re
+from pyteal import *
+
+# TEAL version the contracts are compiled for (switch and match need 8)
+TEAL_VERSION = 8
+
+# Matches a label definition line in compiled TEAL
+LABEL_DEFINITION = re.compile(r"^(\w+):$")
+
+# Opcodes that take a single label argument
+LABEL_OPS = ("b", "bz", "bnz", "callsub")
+
+# Compile a PyTeal expression into a standalone block of TEAL lines. The block
+# starts with the given label and all of its internal labels are prefixed with
+# it, so several blocks can be concatenated into one program.
+def compile_section(label, expr, version=TEAL_VERSION):
+    teal = compileTeal(expr, Mode.Application, version=version)
+    lines = [line for line in teal.splitlines() if line and not line.startswith("#pragma")]
+    local_labels = {match.group(1) for match in map(LABEL_DEFINITION.match, lines) if match}
+
+    section = [f"{label}:"]
+    for line in lines:
+        match = LABEL_DEFINITION.match(line)
+        if match:
+            section.append(f"{label}_{match.group(1)}:")
+            continue
+        op, _, arg = line.partition(" ")
+        if op in LABEL_OPS and arg in local_labels:
+            line = f"{op} {label}_{arg}"
+        section.append(line)
+    return section
+
+# Label of the section holding a method's handler
+def method_label(name):
+    return f"method_{name}"
+
+# One-byte selector of a method: its index in the method list
+def method_selector(methods, name):
+    return bytes([methods.index(name)])
+
+# Approval program router with constant-cost dispatch.
+#
+# On-completion actions are dispatched with a single `switch` on
+# Txn.on_completion(). Method calls carry a one-byte selector (the method's
+# index in `methods`) as their first argument and are dispatched with a single
+# `switch`, so the cost of reaching a handler does not depend on how many
+# methods there are. Calls that still pass the full method name are routed
+# with one `match` instead of a chain of comparisons.
+class MethodRouter:
+    def __init__(self, methods, handlers, on_creation, on_delete, on_update, on_close_out, on_opt_in):
+        if len(methods) > 256:
+            raise ValueError("A one-byte selector supports at most 256 methods")
+        if set(methods) != set(handlers):
+            raise ValueError(f"Handlers do not match methods: {sorted(set(methods) ^ set(handlers))}")
+        self.methods = list(methods)
+        self.handlers = handlers
+        self.on_creation = on_creation
+        # Indexed by OnComplete value: NoOp, OptIn, CloseOut, ClearState, UpdateApplication, DeleteApplication
+        self.on_completion_labels = ["dispatch", "on_opt_in", "on_close_out", "reject", "on_update", "on_delete"]
+        self.on_completion_handlers = {
+            "on_opt_in": on_opt_in,
+            "on_close_out": on_close_out,
+            "on_update": on_update,
+            "on_delete": on_delete
+        }
+
+    # Every labelled PyTeal section of the program, in program order
+    def sections(self):
+        sections = [("on_creation", self.on_creation)]
+        sections += list(self.on_completion_handlers.items())
+        sections += [(method_label(name), self.handlers[name]) for name in self.methods]
+        return sections
+
+    # TEAL that routes a call to the label of its section
+    def dispatch_teal(self):
+        method_labels = " ".join(method_label(name) for name in self.methods)
+        lines = [
+            "txn ApplicationID",
+            "bz on_creation",
+            "txn OnCompletion",
+            "switch " + " ".join(self.on_completion_labels),
+            "err",
+            "reject:",
+            "int 0",
+            "return",
+            "dispatch:",
+            "txna ApplicationArgs 0",
+            "len",
+            "int 1",
+            "==",
+            "bz dispatch_by_name",
+            "txna ApplicationArgs 0",
+            "btoi",
+            "switch " + method_labels,
+            "err",
+            "dispatch_by_name:"
+        ]
+        lines += [f'byte "{name}"' for name in self.methods]
+        lines += [
+            "txna ApplicationArgs 0",
+            "match " + method_labels,
+            "err"
+        ]
+        return lines
+
+    # Compile the whole approval program to TEAL source
+    def compile(self, version=TEAL_VERSION):
+        lines = [f"#pragma version {version}"] + self.dispatch_teal()
+        for label, expr in self.sections():
+            lines += compile_section(label, expr, version)
+        return "\n".join(lines) + "\n"
@@ -1,19 +1,47 @@
+from algosdk import encoding
 from pyteal import *
+from events import emit
+from router import MethodRouter, TEAL_VERSION
 
-def approval_program():
+# Methods of the approval program; a method's one-byte selector is its index
+METHODS = [
+    "add_user",
+    "remove_user",
+    "change_role",
+    "register_inventory_app",
+    "register_asset_manager",
+    "backup_data",
+    "set_roles"
+]
+
+# Role values stored for authorized users; a lower value is a higher role
+ROLE_IDS = {"admin": 1, "manager": 2, "operator": 3}
+
+# Each user's role is a one-byte box named by the user's 32-byte address,
+# so a role check is a single box read. The creator admin is implicit and
+# has no box. set_roles takes packed (address, role) records; role 0
+# removes the user.
+ROLE_BOX_SIZE = 1
+ROLE_RECORD_SIZE = 33
+
+# Minimum balance the app account needs for each role box
+ROLE_BOX_MIN_BALANCE = 2500 + 400 * (32 + ROLE_BOX_SIZE)
+
+# Box name of a user's role
+def role_box_name(address):
+    return encoding.decode_address(address) if isinstance(address, str) else address
+
+# Pack (address, role) pairs for set_roles
+def pack_role_updates(updates):
+    return b"".join(role_box_name(address) + bytes([role]) for address, role in updates)
+
+def router():
     # Global state schema
     # - admin_address: bytes
     # - inventory_app_id: uint64
     # - asset_manager_app_id: uint64
-    # - authorized_users: map[address]role (1=admin, 2=manager, 3=operator)
-    
-    # Define application arguments indices
-    ADD_USER = Bytes("add_user")
-    REMOVE_USER = Bytes("remove_user")
-    CHANGE_ROLE = Bytes("change_role")
-    REGISTER_INVENTORY_APP = Bytes("register_inventory_app")
-    REGISTER_ASSET_MANAGER = Bytes("register_asset_manager")
-    BACKUP_DATA = Bytes("backup_data")
+    # Boxes
+    # - <address>: role (1=admin, 2=manager, 3=operator)
     
     # Define global state keys
     admin_address_key = Bytes("admin_address")
@@ -21,30 +49,52 @@ def approval_program():
     asset_manager_app_id_key = Bytes("asset_manager_app_id")
     
     # Define roles
-    ROLE_ADMIN = Int(1)
-    ROLE_MANAGER = Int(2)
-    ROLE_OPERATOR = Int(3)
+    ROLE_ADMIN = Int(ROLE_IDS["admin"])
+    ROLE_MANAGER = Int(ROLE_IDS["manager"])
+    ROLE_OPERATOR = Int(ROLE_IDS["operator"])
     
     # Helper function to check if sender is admin
     def is_admin():
         return Txn.sender() == App.globalGet(admin_address_key)
     
-    # Helper function to check if user has a specific role or higher
+    # Helper function to check if user has a specific role or higher; the
+    # caller must reference the user's box. Lower values are higher roles and
+    # 0 is no role, so it never passes.
     def has_role(address, min_role):
-        user_role_key = Concat(Bytes("role_"), address)
-        return App.globalGet(user_role_key) >= min_role
+        role = App.box_get(address)
+        return Seq([
+            role,
+            And(role.hasValue(), Btoi(role.value()) != Int(0), Btoi(role.value()) <= min_role)
+        ])
     
-    # Helper function to check if sender has a specific role or higher
+    # Helper function to check if sender has a specific role or higher. The
+    # admin passes without a box read, so admin calls need no box reference.
     def sender_has_role(min_role):
-        return has_role(Txn.sender(), min_role)
+        return If(is_admin(), Int(1), has_role(Txn.sender(), min_role))
+    
+    # Set, change or (with role 0) remove a user's role box
+    def set_role(address, role):
+        return Seq([
+            Assert(Len(address) == Int(32)),
+            Assert(role <= ROLE_OPERATOR),
+            If(
+                role == Int(0),
+                Pop(App.box_delete(address)),
+                App.box_put(address, Extract(Itob(role), Int(7), Int(ROLE_BOX_SIZE)))
+            ),
+            emit("RoleChanged", address, role)
+        ])
+    
+    records = Txn.application_args[1]
+    record_offset = ScratchVar(TealType.uint64)
+    record_address = ScratchVar(TealType.bytes)
+    record_role = ScratchVar(TealType.uint64)
     
     # On app creation
     on_creation = Seq([
         App.globalPut(admin_address_key, Txn.application_args[0]),
         App.globalPut(inventory_app_id_key, Int(0)),
         App.globalPut(asset_manager_app_id_key, Int(0)),
-        # Set creator as admin role
-        App.globalPut(Concat(Bytes("role_"), Txn.application_args[0]), ROLE_ADMIN),
         Return(Int(1))
     ])
     
@@ -55,10 +105,8 @@ def approval_program():
         
         # Extract arguments
         # user_address, role
-        App.globalPut(
-            Concat(Bytes("role_"), Txn.application_args[1]),
-            Btoi(Txn.application_args[2])
-        ),
+        Assert(Btoi(Txn.application_args[2]) != Int(0)),
+        set_role(Txn.application_args[1], Btoi(Txn.application_args[2])),
         
         Return(Int(1))
     ])
@@ -70,7 +118,7 @@ def approval_program():
         
         # Extract arguments
         # user_address
-        App.globalDel(Concat(Bytes("role_"), Txn.application_args[1])),
+        set_role(Txn.application_args[1], Int(0)),
         
         Return(Int(1))
     ])
@@ -82,10 +130,8 @@ def approval_program():
         
         # Extract arguments
         # user_address, new_role
-        App.globalPut(
-            Concat(Bytes("role_"), Txn.application_args[1]),
-            Btoi(Txn.application_args[2])
-        ),
+        Assert(Btoi(Txn.application_args[2]) != Int(0)),
+        set_role(Txn.application_args[1], Btoi(Txn.application_args[2])),
         
         Return(Int(1))
     ])
@@ -119,37 +165,62 @@ def approval_program():
         Assert(sender_has_role(ROLE_ADMIN)),
         
         # In a real implementation, this would create a backup of all data to IPFS
-        # For now, we just log the backup event
-        Log(Bytes("DATA BACKUP INITIATED")),
+        # For now, we just emit the backup event
+        emit("DataBackupInitiated", Global.latest_timestamp()),
+        
+        Return(Int(1))
+    ])
+    
+    # Set the roles of many users from packed (address, role) records; every
+    # user's box must be referenced by a transaction in the group
+    set_roles = Seq([
+        Assert(sender_has_role(ROLE_ADMIN)),
+        Assert(Txn.application_args.length() == Int(2)),  # Command + packed records
+        Assert(Len(records) % Int(ROLE_RECORD_SIZE) == Int(0)),
+        
+        For(
+            record_offset.store(Int(0)),
+            record_offset.load() < Len(records),
+            record_offset.store(record_offset.load() + Int(ROLE_RECORD_SIZE))
+        ).Do(Seq([
+            record_address.store(Extract(records, record_offset.load(), Int(32))),
+            record_role.store(GetByte(records, record_offset.load() + Int(32))),
+            set_role(record_address.load(), record_role.load())
+        ])),
         
         Return(Int(1))
     ])
     
     # Main router logic
-    program = Cond(
-        [Txn.application_id() == Int(0), on_creation],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Return(is_admin())],
-        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
-        [Txn.on_completion() == OnComplete.OptIn, Return(Int(1))],
-        [Txn.application_args[0] == ADD_USER, add_user],
-        [Txn.application_args[0] == REMOVE_USER, remove_user],
-        [Txn.application_args[0] == CHANGE_ROLE, change_role],
-        [Txn.application_args[0] == REGISTER_INVENTORY_APP, register_inventory_app],
-        [Txn.application_args[0] == REGISTER_ASSET_MANAGER, register_asset_manager],
-        [Txn.application_args[0] == BACKUP_DATA, backup_data]
+    return MethodRouter(
+        METHODS,
+        {
+            "add_user": add_user,
+            "remove_user": remove_user,
+            "change_role": change_role,
+            "register_inventory_app": register_inventory_app,
+            "register_asset_manager": register_asset_manager,
+            "backup_data": backup_data,
+            "set_roles": set_roles
+        },
+        on_creation=on_creation,
+        on_delete=Return(is_admin()),
+        on_update=Return(is_admin()),
+        on_close_out=Return(Int(1)),
+        on_opt_in=Return(Int(1))
     )
-    
-    return program
+
+def approval_program():
+    return router().compile()
 
 def clear_state_program():
     return Return(Int(1))
 
 if __name__ == "__main__":
     with open("security_approval.teal", "w") as f:
-        compiled = compileTeal(approval_program(), Mode.Application, version=6)
+        compiled = approval_program()
         f.write(compiled)
         
     with open("security_clear.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), Mode.Application, version=6)
+        compiled = compileTeal(clear_state_program(), Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
\ No newline at end of file